@@ -14,6 +14,7 @@
 #include <cmath>
 #include <cstdlib>
 #include <iostream>
+#include <vector>
 
 namespace hof{
 
@@ -38,6 +39,129 @@ struct Segment
   struct Segment *suivant; // pointing to next segment
 };
 
+/*
+ * Family of parallel digital lines swept for one direction. Coordinates are
+ * given along the lines (primary axis: x for angles in [-PI/4,PI/4], y
+ * otherwise) and across them (secondary axis, flipped for negative angles).
+ * Line 's' is made of the runs k >= max(0,-s) of the Bresenham chain, run k
+ * covering the primary coordinates runStart[k]..runStart[k+1]-1 at the
+ * secondary coordinate k+s.
+ */
+
+struct LineFrame
+{
+  bool projY;
+  bool mirrored;
+  int Xsize, Ysize;
+  int primarySize, secondarySize;
+  int nRuns;
+  std::vector<int> runStart;
+};
+
+/*
+ * Supplies the segments of the argument and referent objects along each line
+ * of a LineFrame (see HoF_Sweep.cpp).
+ */
+
+class SegmentSource
+{
+public:
+	virtual ~SegmentSource() {}
+	/* Areas of A, B and of their intersection, times 255 (sums of the gray
+	   levels, as in computeHistogram). */
+	virtual void areas (double *areaA, double *areaB, double *areaAB) = 0;
+	/* Prepares the frame and returns the range of lines that may hit both objects. */
+	virtual void beginFrame (const LineFrame &frame, int *sLo, int *sHi) = 0;
+	virtual void lineSegments (int s, std::vector<Segment> &segA, std::vector<Segment> &segB) = 0;
+};
+
+/*
+ * Coarse-to-fine search of the main direction of histograms (see
+ * HoF_Raster::searchDirections in HoF_Sweep.cpp).
+ */
+
+struct DirectionSearch
+{
+  int coarseStep;   /* directions about coarseStep apart are computed first */
+  double tolerance; /* directions next to coarse values >= (1-tolerance) x max are refined */
+  int *directions;  /* receives the index of the maximum of each histogram */
+};
+
+/* Crisp objects given as the boxes [x1, y1, x2, y2[ of a width x height image. */
+
+class BoxSource : public SegmentSource
+{
+public:
+	BoxSource (const int *boxA, const int *boxB, int width, int height);
+	void areas (double *areaA, double *areaB, double *areaAB);
+	void beginFrame (const LineFrame &frame, int *sLo, int *sHi);
+	void lineSegments (int s, std::vector<Segment> &segA, std::vector<Segment> &segB);
+
+protected:
+	/* Inclusive ranges along the primary (p) and secondary (q) axes. */
+	struct Span { int p1, p2, q1, q2; };
+
+	BoxSource () : frame_(NULL) {}
+	void setBoxes (const int *boxA, const int *boxB, int width, int height);
+	bool segment (const Span &span, int s, Segment &seg) const;
+	/* Segments of line s inside 'span' made of the pixels (given by their
+	   row and column in the image) for which member(row, column) is true. */
+	template<typename Member>
+	void readLine (const Member &member, const Span &span, int s,
+				   std::vector<Segment> &segments) const;
+
+	const LineFrame *frame_;
+	Span spanA_, spanB_;
+
+private:
+	Span toFrame (const int *box) const;
+	bool shifts (const Span &span, int *sLo, int *sHi) const;
+
+	int boxA_[4], boxB_[4]; /* xmin, xmax, ymin, ymax in HoF coordinates (y upwards) */
+};
+
+/*
+ * Crisp objects given as two width x height images (nonzero pixels belong to
+ * the object). Only the pixels of the lines inside the bounding box of each
+ * object are read. The images may also be the roiWidth x roiHeight crops at
+ * column roiX and row roiY of the width x height images, the objects being
+ * entirely inside the crop: the lines are still those of the whole images.
+ */
+
+class RasterSource : public BoxSource
+{
+public:
+	RasterSource (const unsigned char *imageA, const unsigned char *imageB,
+				  int roiX, int roiY, int roiWidth, int roiHeight, int width, int height);
+	void areas (double *areaA, double *areaB, double *areaAB);
+	void lineSegments (int s, std::vector<Segment> &segA, std::vector<Segment> &segB);
+
+private:
+	const unsigned char *imageA_, *imageB_;
+	int roiX_, roiY_, roiWidth_;
+	double areaA_, areaB_, areaAB_;
+};
+
+/*
+ * Crisp objects given as the pixels of a width x height label image equal to
+ * labelA and labelB. The bounding boxes and areas (times 255) of the labels
+ * are computed once by the caller for all the pairs of the image.
+ */
+
+class LabelSource : public BoxSource
+{
+public:
+	LabelSource (const int *labels, int labelA, int labelB, int width, int height,
+				 const int *boxA, const int *boxB, double areaA, double areaB);
+	void areas (double *areaA, double *areaB, double *areaAB);
+	void lineSegments (int s, std::vector<Segment> &segA, std::vector<Segment> &segB);
+
+private:
+	const int *labels_;
+	int labelA_, labelB_;
+	double areaA_, areaB_;
+};
+
 /* Trying to collect all these HoF functions in a class */
 
 class HoF_Raster{
@@ -148,6 +272,84 @@ public:
 								   int width, int height, double p0, double p1,
 								   int fuzzyMethod);
 
+	/*************************************
+	 * Methods for handling crisp boxes.
+	 *************************************/
+
+	/* Same histograms as the crisp raster methods for the objects boxA and
+	   boxB, given as [x1, y1, x2, y2[ (columns x1..x2-1, rows y1..y2-1 of a
+	   'width' x 'height' image). No image is built: only the lines crossing
+	   both boxes are visited. */
+	void FRHistogram_CrispBoxes (double *histogram,
+								 int numberDirections, double typeForce,
+								 const int *boxA, const int *boxB,
+								 int width, int height);
+
+	void F02Histogram_CrispBoxes (double *histogram, int numberDirections,
+								  const int *boxA, const int *boxB,
+								  int width, int height, double p0, double p1);
+
+	/*************************************
+	 * Several histograms in one sweep.
+	 *************************************/
+
+	/* histograms[i] receives the F-hybrid histogram if hybrid[i] is nonzero,
+	   the F-r histogram with r = typeForces[i] otherwise. The segments of
+	   the objects are extracted once per line for all the histograms.
+	   When 'search' is given, only search->directions[i] receives the
+	   index of the maximum of histogram i, found with a coarse-to-fine
+	   search, and 'histograms' is not used (the batch methods then fill
+	   numberPairs x numberForces directions). */
+	void MultiHistogram_CrispRaster (double **histograms, int numberForces,
+									 const double *typeForces, const int *hybrid,
+									 int numberDirections,
+									 const unsigned char *imageA, const unsigned char *imageB,
+									 int width, int height, double p0, double p1,
+									 const DirectionSearch *search=NULL);
+
+	/* Same as MultiHistogram_CrispRaster, where imageA and imageB are the
+	   roiWidth x roiHeight crops at column roiX and row roiY of the width x
+	   height images, and the objects lie entirely inside the crops. The
+	   cost depends on the size of the crops, the result is the one of the
+	   whole images. */
+	void MultiHistogram_CrispRasterROI (double **histograms, int numberForces,
+										const double *typeForces, const int *hybrid,
+										int numberDirections,
+										const unsigned char *imageA, const unsigned char *imageB,
+										int roiX, int roiY, int roiWidth, int roiHeight,
+										int width, int height, double p0, double p1,
+									 const DirectionSearch *search=NULL);
+
+	void MultiHistogram_CrispBoxes (double **histograms, int numberForces,
+									const double *typeForces, const int *hybrid,
+									int numberDirections,
+									const int *boxA, const int *boxB,
+									int width, int height, double p0, double p1,
+									 const DirectionSearch *search=NULL);
+
+	/*************************************
+	 * Batches of pairs.
+	 *************************************/
+
+	/* The pairs of objects are given by 'pairs' (numberPairs x 2 indices),
+	   the objects being either the pixels of 'labels' equal to the indices,
+	   or the boxes [x1, y1, x2, y2[ given in 'boxes' (numberBoxes x 4).
+	   'histograms' receives numberPairs x numberForces x (numberDirections+1)
+	   values, the histograms of pair i being those of MultiHistogram_*.
+	   The pairs are shared between numberThreads threads (one per core if
+	   numberThreads <= 0). */
+	void MultiHistogram_LabelBatch (double *histograms, int numberPairs, const int *pairs,
+									int numberForces, const double *typeForces, const int *hybrid,
+									int numberDirections, const int *labels,
+									int width, int height, double p0, double p1,
+									int numberThreads, const DirectionSearch *search=NULL);
+
+	void MultiHistogram_BoxBatch (double *histograms, int numberPairs, const int *pairs,
+								  int numberForces, const double *typeForces, const int *hybrid,
+								  int numberDirections, const int *boxes, int numberBoxes,
+								  int width, int height, double p0, double p1,
+								  int numberThreads, const DirectionSearch *search=NULL);
+
 private:
 	void rotateImage (unsigned char *image, int width, int height, unsigned char *rotatedImage);
 
@@ -239,6 +441,35 @@ private:
 					      int Xsize, int Ysize,
 						int methode, double p0, double p1);
 
+	/* Line sweeps over a SegmentSource (see HoF_Sweep.cpp). */
+	void computeHistograms (SegmentSource &source, double **histograms, int numberForces,
+							const double *typeForces, const int *hybrid, int numberDirections,
+							int Xsize, int Ysize, bool rotated, double p0, double p1,
+							const DirectionSearch *search);
+
+	void computeSteps (SegmentSource &source, double **histograms, int numberForces,
+					   const int *methodes, const double *typeForces, int numberDirections,
+					   int Xsize, int Ysize, bool rotated, double p0, double p1,
+					   const unsigned char *steps);
+
+	void searchDirections (SegmentSource &source, const DirectionSearch &search,
+						   int numberForces, const int *methodes, const double *typeForces,
+						   int numberDirections, int Xsize, int Ysize, bool rotated,
+						   double p0, double p1);
+
+	void computeHistogramSweep (SegmentSource &source, double **Histos, int numberForces,
+							   const int *methodes, const double *typeForces, int Taille,
+							   int Xsize, int Ysize, double p0, double p1,
+							   const unsigned char *steps);
+
+	void setFrame (LineFrame &frame, bool projY, bool mirrored,
+				   int x2, int y2, int Xsize, int Ysize, std::vector<int> &Chaine);
+
+	void sweepLines (SegmentSource &source, const LineFrame &frame,
+					double **Histos, int numberForces, const int *methodes,
+					int Case1, int Case2, double l,
+					double *Sum_LN_C1, double *Sum_LN_C2, const double *r);
+
 	template<typename T>
 	T  sign(T x);
 
@@ -1,5 +1,7 @@
 #include <pybind11/pybind11.h>
 #include <pybind11/numpy.h>
+#include <pybind11/stl.h>
+#include <vector>
 
 namespace py = pybind11;
 
@@ -8,6 +10,35 @@ py::array_t<double> F0Hist(py::array_t<unsigned char>& imageA, py::array_t<unsig
 py::array_t<double> F2Hist(py::array_t<unsigned char>& imageA, py::array_t<unsigned char>& imageB, int numberDirections);
 py::array_t<double> F02Hist(py::array_t<unsigned char>& imageA, py::array_t<unsigned char>& imageB, int numberDirections, double p0, double p1);
 
+py::array_t<double> FRBoxHist(std::vector<int>& boxA, std::vector<int>& boxB, int width, int height, double typeForce, int numberDirections);
+py::array_t<double> F0BoxHist(std::vector<int>& boxA, std::vector<int>& boxB, int width, int height, int numberDirections);
+py::array_t<double> F2BoxHist(std::vector<int>& boxA, std::vector<int>& boxB, int width, int height, int numberDirections);
+py::array_t<double> F02BoxHist(std::vector<int>& boxA, std::vector<int>& boxB, int width, int height, int numberDirections, double p0, double p1);
+
+typedef py::array_t<unsigned char, py::array::c_style | py::array::forcecast> ImageArray;
+typedef py::array_t<int, py::array::c_style | py::array::forcecast> IndexArray;
+
+py::array MultiHist(ImageArray& imageA, ImageArray& imageB, py::sequence forces, int numberDirections, double p0, double p1);
+py::array MultiHistROI(ImageArray& imageA, ImageArray& imageB, int x, int y, int width, int height,
+                       py::sequence forces, int numberDirections, double p0, double p1);
+py::array MultiBoxHist(std::vector<int>& boxA, std::vector<int>& boxB, int width, int height,
+                       py::sequence forces, int numberDirections, double p0, double p1);
+py::array MultiHistBatch(IndexArray& labels, IndexArray& pairs, py::sequence forces, int numberDirections,
+                         double p0, double p1, int numberThreads);
+py::array MultiBoxHistBatch(IndexArray& boxes, IndexArray& pairs, int width, int height, py::sequence forces,
+                            int numberDirections, double p0, double p1, int numberThreads);
+
+py::array MultiArgMax(ImageArray& imageA, ImageArray& imageB, py::sequence forces, int numberDirections,
+                      int coarseStep, double tolerance, double p0, double p1);
+py::array MultiArgMaxROI(ImageArray& imageA, ImageArray& imageB, int x, int y, int width, int height,
+                         py::sequence forces, int numberDirections, int coarseStep, double tolerance, double p0, double p1);
+py::array MultiBoxArgMax(std::vector<int>& boxA, std::vector<int>& boxB, int width, int height,
+                         py::sequence forces, int numberDirections, int coarseStep, double tolerance, double p0, double p1);
+py::array MultiArgMaxBatch(IndexArray& labels, IndexArray& pairs, py::sequence forces, int numberDirections,
+                           int coarseStep, double tolerance, double p0, double p1, int numberThreads);
+py::array MultiBoxArgMaxBatch(IndexArray& boxes, IndexArray& pairs, int width, int height, py::sequence forces,
+                              int numberDirections, int coarseStep, double tolerance, double p0, double p1, int numberThreads);
+
 PYBIND11_MODULE(hofpy, m) {
     m.def("FRHist", &FRHist, "Histogram of Forces",
           py::arg("imageA"), py::arg("imageB"), py::arg("typeForce"), py::arg("numberDirections") = 180);
@@ -17,4 +48,36 @@ PYBIND11_MODULE(hofpy, m) {
           py::arg("imageA"), py::arg("imageB"), py::arg("numberDirections") = 180);
     m.def("F02Hist", &F02Hist, "Histogram of Hybrid Forces",
           py::arg("imageA"), py::arg("imageB"), py::arg("numberDirections") = 180, py::arg("p0") = 0.01, py::arg("p1") = 3.0);
+
+    m.def("FRBoxHist", &FRBoxHist, "Histogram of Forces between two boxes",
+          py::arg("boxA"), py::arg("boxB"), py::arg("width"), py::arg("height"), py::arg("typeForce"), py::arg("numberDirections") = 180);
+    m.def("F0BoxHist", &F0BoxHist, "Histogram of Constant Forces (F0) between two boxes",
+          py::arg("boxA"), py::arg("boxB"), py::arg("width"), py::arg("height"), py::arg("numberDirections") = 180);
+    m.def("F2BoxHist", &F2BoxHist, "Histogram of Gravitational Forces (F2) between two boxes",
+          py::arg("boxA"), py::arg("boxB"), py::arg("width"), py::arg("height"), py::arg("numberDirections") = 180);
+    m.def("F02BoxHist", &F02BoxHist, "Histogram of Hybrid Forces between two boxes",
+          py::arg("boxA"), py::arg("boxB"), py::arg("width"), py::arg("height"), py::arg("numberDirections") = 180, py::arg("p0") = 0.01, py::arg("p1") = 3.0);
+
+    m.def("MultiHist", &MultiHist, "Several Histograms of Forces in one sweep, stacked in a (len(forces), numberDirections+1) array",
+          py::arg("imageA"), py::arg("imageB"), py::arg("forces") = py::make_tuple(0, 2, "hybrid"), py::arg("numberDirections") = 180, py::arg("p0") = 0.01, py::arg("p1") = 3.0);
+    m.def("MultiHistROI", &MultiHistROI, "Several Histograms of Forces in one sweep, for images cropped at column x and row y of width x height images",
+          py::arg("imageA"), py::arg("imageB"), py::arg("x"), py::arg("y"), py::arg("width"), py::arg("height"), py::arg("forces") = py::make_tuple(0, 2, "hybrid"), py::arg("numberDirections") = 180, py::arg("p0") = 0.01, py::arg("p1") = 3.0);
+    m.def("MultiBoxHist", &MultiBoxHist, "Several Histograms of Forces between two boxes in one sweep",
+          py::arg("boxA"), py::arg("boxB"), py::arg("width"), py::arg("height"), py::arg("forces") = py::make_tuple(0, 2, "hybrid"), py::arg("numberDirections") = 180, py::arg("p0") = 0.01, py::arg("p1") = 3.0);
+
+    m.def("MultiHistBatch", &MultiHistBatch, "Histograms of Forces of pairs of regions of a label image, computed in parallel",
+          py::arg("labels"), py::arg("pairs"), py::arg("forces") = py::make_tuple(0, 2, "hybrid"), py::arg("numberDirections") = 180, py::arg("p0") = 0.01, py::arg("p1") = 3.0, py::arg("numberThreads") = 0);
+    m.def("MultiBoxHistBatch", &MultiBoxHistBatch, "Histograms of Forces of pairs of boxes, computed in parallel",
+          py::arg("boxes"), py::arg("pairs"), py::arg("width"), py::arg("height"), py::arg("forces") = py::make_tuple(0, 2, "hybrid"), py::arg("numberDirections") = 180, py::arg("p0") = 0.01, py::arg("p1") = 3.0, py::arg("numberThreads") = 0);
+
+    m.def("MultiArgMax", &MultiArgMax, "Main directions of several Histograms of Forces, found by a coarse-to-fine search",
+          py::arg("imageA"), py::arg("imageB"), py::arg("forces") = py::make_tuple(0, 2, "hybrid"), py::arg("numberDirections") = 180, py::arg("coarseStep") = 8, py::arg("tolerance") = 0.1, py::arg("p0") = 0.01, py::arg("p1") = 3.0);
+    m.def("MultiArgMaxROI", &MultiArgMaxROI, "Main directions of several Histograms of Forces for cropped images, found by a coarse-to-fine search",
+          py::arg("imageA"), py::arg("imageB"), py::arg("x"), py::arg("y"), py::arg("width"), py::arg("height"), py::arg("forces") = py::make_tuple(0, 2, "hybrid"), py::arg("numberDirections") = 180, py::arg("coarseStep") = 8, py::arg("tolerance") = 0.1, py::arg("p0") = 0.01, py::arg("p1") = 3.0);
+    m.def("MultiBoxArgMax", &MultiBoxArgMax, "Main directions of several Histograms of Forces between two boxes, found by a coarse-to-fine search",
+          py::arg("boxA"), py::arg("boxB"), py::arg("width"), py::arg("height"), py::arg("forces") = py::make_tuple(0, 2, "hybrid"), py::arg("numberDirections") = 180, py::arg("coarseStep") = 8, py::arg("tolerance") = 0.1, py::arg("p0") = 0.01, py::arg("p1") = 3.0);
+    m.def("MultiArgMaxBatch", &MultiArgMaxBatch, "Main directions of the Histograms of Forces of pairs of regions of a label image, computed in parallel",
+          py::arg("labels"), py::arg("pairs"), py::arg("forces") = py::make_tuple(0, 2, "hybrid"), py::arg("numberDirections") = 180, py::arg("coarseStep") = 8, py::arg("tolerance") = 0.1, py::arg("p0") = 0.01, py::arg("p1") = 3.0, py::arg("numberThreads") = 0);
+    m.def("MultiBoxArgMaxBatch", &MultiBoxArgMaxBatch, "Main directions of the Histograms of Forces of pairs of boxes, computed in parallel",
+          py::arg("boxes"), py::arg("pairs"), py::arg("width"), py::arg("height"), py::arg("forces") = py::make_tuple(0, 2, "hybrid"), py::arg("numberDirections") = 180, py::arg("coarseStep") = 8, py::arg("tolerance") = 0.1, py::arg("p0") = 0.01, py::arg("p1") = 3.0, py::arg("numberThreads") = 0);
 }
\ No newline at end of file
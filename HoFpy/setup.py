@@ -7,7 +7,8 @@ hof_module = Pybind11Extension(
     'hofpy',
     [str(fname) for fname in Path('src').glob('*.cpp')],
     include_dirs=['include'],
-    extra_compile_args=['-O3']
+    extra_compile_args=['-O3', '-pthread'],
+    extra_link_args=['-pthread']
 )
 
 setup(
@@ -0,0 +1,1007 @@
+/*
+ * HoF_Sweep.cpp
+ *
+ *  Line sweep of the crisp histograms of forces over a SegmentSource.
+ *
+ *  computeHistogramSweep() visits the same directions, the same Bresenham
+ *  lines and accumulates the same forces in the same order as
+ *  computeHistogram() (methods 2, 3 and 7), but the segments of the objects
+ *  along each line are asked to a SegmentSource instead of being read from
+ *  two full images. Lines that cannot cross both objects are skipped, and
+ *  the segments of a line are used for all the requested histograms.
+ */
+
+#include "HoF_Raster.hpp"
+#include <algorithm>
+#include <atomic>
+#include <thread>
+
+namespace {
+
+/* Chains the segments of a line as the force computations expect them. */
+hof::Segment *linkSegments (std::vector<hof::Segment> &segments)
+{
+  size_t i;
+  for (i=0; i+1<segments.size(); i++) segments[i].suivant=&segments[i+1];
+  segments.back().suivant=NULL;
+  return &segments[0];
+}
+
+/* Clips [x1, y1, x2, y2[ to the image. */
+void clipBox (const int *box, int width, int height, int *clipped)
+{
+  clipped[0]=std::min(std::max(box[0], 0), width);
+  clipped[1]=std::min(std::max(box[1], 0), height);
+  clipped[2]=std::min(std::max(box[2], 0), width);
+  clipped[3]=std::min(std::max(box[3], 0), height);
+}
+
+/* Same rotation as rotateImage(): the pixel of row i and column j of a
+   width x height image goes to row width-1-j and column i. */
+void rotateBox (const int *box, int width, int *rotated)
+{
+  rotated[0]=box[1];
+  rotated[1]=width-box[2];
+  rotated[2]=box[3];
+  rotated[3]=width-box[0];
+}
+
+void rotateLabels (const int *labels, int width, int height, int *rotated)
+{
+  int x, y;
+  for (x=width-1; x>=0; x--)
+    for (y=0; y<height; y++) *rotated++=labels[y*width+x];
+}
+
+/* Runs task(i) for i in [0, count[ on numberThreads threads. */
+template<typename Task>
+void runParallel (int count, int numberThreads, const Task &task)
+{
+  std::atomic<int> next(0);
+  std::vector<std::thread> threads;
+  int t;
+
+  if (numberThreads<=0)
+    numberThreads=(int)std::thread::hardware_concurrency();
+  numberThreads=std::max(1, std::min(numberThreads, count));
+
+  auto worker=[&]() {
+    int i;
+    while ((i=next++)<count) task(i);
+  };
+
+  for (t=1; t<numberThreads; t++) threads.emplace_back(worker);
+  worker();
+  for (t=0; t<(int)threads.size(); t++) threads[t].join();
+}
+
+/* Step of computeHistogramSweep giving direction 'i' of a histogram with
+   'Taille' directions. */
+int directionStep (int i, int Taille)
+{
+  int half=Taille/2;
+  i%=half;
+  return std::min(i, half-i);
+}
+
+/* F02 normalization of the two cells filled by one direction (see computeHistogram). */
+void normalizeF02 (double **Histos, int numberForces, const int *methodes,
+		   int Case1, int Case2, double c, double p0,
+		   const std::vector<double> &Sum_LN_C1, const std::vector<double> &Sum_LN_C2)
+{
+  int f;
+  for (f=0; f<numberForces; f++)
+    if (methodes[f]==3)
+      {
+	Histos[f][Case1] = Histos[f][Case1]/(c*p0*p0) + Sum_LN_C1[f]*c;
+	Histos[f][Case2] = Histos[f][Case2]/(c*p0*p0) + Sum_LN_C2[f]*c;
+      }
+}
+
+/* Pixels of the objects, for BoxSource::readLine. */
+struct ImageMember
+{
+  const unsigned char *image;
+  int x0, y0, stride;
+  ImageMember (const unsigned char *image_, int x0_, int y0_, int stride_)
+    : image(image_), x0(x0_), y0(y0_), stride(stride_) {}
+  bool operator() (int row, int col) const { return image[(row-y0)*stride+col-x0]!=0; }
+};
+
+struct LabelMember
+{
+  const int *labels;
+  int label, stride;
+  LabelMember (const int *labels_, int label_, int stride_) : labels(labels_), label(label_), stride(stride_) {}
+  bool operator() (int row, int col) const { return labels[row*stride+col]==label; }
+};
+
+} // namespace
+
+/*==============================================================================
+   FRHistogram_CrispBoxes / F02Histogram_CrispBoxes | Same as the crisp raster
+   methods, for objects given as boxes.
+--------------------------------------------------------------------------------
+   See hof.hpp for argument details.
+==============================================================================*/
+
+void hof::HoF_Raster::FRHistogram_CrispBoxes (double *histogram,
+								 int numberDirections, double typeForce,
+								 const int *boxA, const int *boxB,
+								 int width, int height)
+{
+	int hybrid=0;
+
+	MultiHistogram_CrispBoxes(&histogram, 1, &typeForce, &hybrid, numberDirections,
+							  boxA, boxB, width, height, 0.01, 3.0, NULL);
+}
+
+void hof::HoF_Raster::F02Histogram_CrispBoxes (double *histogram, int numberDirections,
+								  const int *boxA, const int *boxB,
+								  int width, int height, double p0, double p1)
+{
+	double typeForce=2.0;
+	int hybrid=1;
+
+	MultiHistogram_CrispBoxes(&histogram, 1, &typeForce, &hybrid, numberDirections,
+							  boxA, boxB, width, height, p0, p1, NULL);
+}
+
+/*==============================================================================
+   MultiHistogram_CrispRaster / MultiHistogram_CrispBoxes | Several crisp
+   histograms computed in a single sweep.
+--------------------------------------------------------------------------------
+   See hof.hpp for argument details.
+==============================================================================*/
+
+void hof::HoF_Raster::MultiHistogram_CrispRaster (double **histograms, int numberForces,
+									 const double *typeForces, const int *hybrid,
+									 int numberDirections,
+									 const unsigned char *imageA, const unsigned char *imageB,
+									 int width, int height, double p0, double p1,
+									 const DirectionSearch *search)
+{
+	MultiHistogram_CrispRasterROI(histograms, numberForces, typeForces, hybrid, numberDirections,
+								  imageA, imageB, 0, 0, width, height, width, height, p0, p1, search);
+}
+
+void hof::HoF_Raster::MultiHistogram_CrispRasterROI (double **histograms, int numberForces,
+										const double *typeForces, const int *hybrid,
+										int numberDirections,
+										const unsigned char *imageA, const unsigned char *imageB,
+										int roiX, int roiY, int roiWidth, int roiHeight,
+										int width, int height, double p0, double p1,
+									 const DirectionSearch *search)
+{
+	if(width>=height)
+	{
+		RasterSource source(imageA, imageB, roiX, roiY, roiWidth, roiHeight, width, height);
+		computeHistograms(source, histograms, numberForces, typeForces, hybrid,
+						  numberDirections, width, height, false, p0, p1, search);
+	}
+	else
+	{
+		/* The crops are rotated with the images (see rotateBox) */
+		int roi[4]={roiX, roiY, roiX+roiWidth, roiY+roiHeight}, rotROI[4];
+		std::vector<unsigned char> rotImageA(roiWidth*roiHeight), rotImageB(roiWidth*roiHeight);
+
+		rotateBox(roi, width, rotROI);
+		rotateImage(const_cast<unsigned char *>(imageA), roiWidth, roiHeight, rotImageA.data());
+		rotateImage(const_cast<unsigned char *>(imageB), roiWidth, roiHeight, rotImageB.data());
+
+		RasterSource source(rotImageA.data(), rotImageB.data(), rotROI[0], rotROI[1], roiHeight, roiWidth,
+							height, width);
+		computeHistograms(source, histograms, numberForces, typeForces, hybrid,
+						  numberDirections, height, width, true, p0, p1, search);
+	}
+}
+
+void hof::HoF_Raster::MultiHistogram_CrispBoxes (double **histograms, int numberForces,
+									const double *typeForces, const int *hybrid,
+									int numberDirections,
+									const int *boxA, const int *boxB,
+									int width, int height, double p0, double p1,
+									 const DirectionSearch *search)
+{
+	int clipA[4], clipB[4];
+
+	clipBox(boxA, width, height, clipA);
+	clipBox(boxB, width, height, clipB);
+
+	if(width>=height)
+	{
+		BoxSource source(clipA, clipB, width, height);
+		computeHistograms(source, histograms, numberForces, typeForces, hybrid,
+						  numberDirections, width, height, false, p0, p1, search);
+	}
+	else
+	{
+		int rotA[4], rotB[4];
+
+		rotateBox(clipA, width, rotA);
+		rotateBox(clipB, width, rotB);
+
+		BoxSource source(rotA, rotB, height, width);
+		computeHistograms(source, histograms, numberForces, typeForces, hybrid,
+						  numberDirections, height, width, true, p0, p1, search);
+	}
+}
+
+/*==============================================================================
+   MultiHistogram_LabelBatch / MultiHistogram_BoxBatch | Histograms of many
+   pairs of objects of the same image, computed in parallel.
+--------------------------------------------------------------------------------
+   See hof.hpp for argument details.
+==============================================================================*/
+
+void hof::HoF_Raster::MultiHistogram_LabelBatch (double *histograms, int numberPairs, const int *pairs,
+									int numberForces, const double *typeForces, const int *hybrid,
+									int numberDirections, const int *labels,
+									int width, int height, double p0, double p1,
+									int numberThreads, const DirectionSearch *search)
+{
+	int i, x, y, label, numberLabels=0;
+	int Xsize=width, Ysize=height;
+	bool rotated=(width<height);
+	std::vector<int> rotLabels;
+	const int *ptr;
+
+	for(i=0;i<2*numberPairs;i++)
+		numberLabels=std::max(numberLabels, pairs[i]+1);
+
+	/* Bounding boxes [x1, y1, x2, y2[ and areas of the labels used by the pairs */
+	std::vector<int> boxes(4*numberLabels);
+	std::vector<double> areas(numberLabels, 0.0);
+
+	if(rotated)
+	{
+		rotLabels.resize(width*height);
+		rotateLabels(labels, width, height, &rotLabels[0]);
+		labels=&rotLabels[0];
+		Xsize=height;
+		Ysize=width;
+	}
+
+	for(i=0;i<numberLabels;i++)
+	{
+		boxes[4*i]=Xsize; boxes[4*i+1]=Ysize;
+		boxes[4*i+2]=boxes[4*i+3]=0;
+	}
+	for(y=0,ptr=labels;y<Ysize;y++)
+		for(x=0;x<Xsize;x++,ptr++)
+		{
+			label=*ptr;
+			if(label<0 || label>=numberLabels) continue;
+			areas[label]+=255;
+			boxes[4*label]=std::min(boxes[4*label], x);
+			boxes[4*label+1]=std::min(boxes[4*label+1], y);
+			boxes[4*label+2]=std::max(boxes[4*label+2], x+1);
+			boxes[4*label+3]=std::max(boxes[4*label+3], y+1);
+		}
+
+	runParallel(numberPairs, numberThreads, [&](int pair) {
+		int a=pairs[2*pair], b=pairs[2*pair+1], f;
+		std::vector<double *> rows(numberForces);
+		DirectionSearch pairSearch;
+
+		if(search)
+		{
+			pairSearch=*search;
+			pairSearch.directions=search->directions+(size_t)pair*numberForces;
+		}
+		else
+			for(f=0;f<numberForces;f++)
+				rows[f]=histograms+((size_t)pair*numberForces+f)*(numberDirections+1);
+
+		LabelSource source(labels, a, b, Xsize, Ysize, &boxes[4*a], &boxes[4*b], areas[a], areas[b]);
+		computeHistograms(source, &rows[0], numberForces, typeForces, hybrid,
+						  numberDirections, Xsize, Ysize, rotated, p0, p1,
+						  search ? &pairSearch : NULL);
+	});
+}
+
+void hof::HoF_Raster::MultiHistogram_BoxBatch (double *histograms, int numberPairs, const int *pairs,
+								  int numberForces, const double *typeForces, const int *hybrid,
+								  int numberDirections, const int *boxes, int numberBoxes,
+								  int width, int height, double p0, double p1,
+								  int numberThreads, const DirectionSearch *search)
+{
+	int i;
+	int Xsize=width, Ysize=height;
+	bool rotated=(width<height);
+	std::vector<int> frameBoxes(4*numberBoxes);
+	int clipped[4];
+
+	for(i=0;i<numberBoxes;i++)
+	{
+		clipBox(&boxes[4*i], width, height, clipped);
+		if(rotated)
+			rotateBox(clipped, width, &frameBoxes[4*i]);
+		else
+			std::copy(clipped, clipped+4, &frameBoxes[4*i]);
+	}
+	if(rotated)
+	{
+		Xsize=height;
+		Ysize=width;
+	}
+
+	runParallel(numberPairs, numberThreads, [&](int pair) {
+		int a=pairs[2*pair], b=pairs[2*pair+1], f;
+		std::vector<double *> rows(numberForces);
+		DirectionSearch pairSearch;
+
+		if(search)
+		{
+			pairSearch=*search;
+			pairSearch.directions=search->directions+(size_t)pair*numberForces;
+		}
+		else
+			for(f=0;f<numberForces;f++)
+				rows[f]=histograms+((size_t)pair*numberForces+f)*(numberDirections+1);
+
+		BoxSource source(&frameBoxes[4*a], &frameBoxes[4*b], Xsize, Ysize);
+		computeHistograms(source, &rows[0], numberForces, typeForces, hybrid,
+						  numberDirections, Xsize, Ysize, rotated, p0, p1,
+						  search ? &pairSearch : NULL);
+	});
+}
+
+/*==============================================================================
+   computeHistograms | Chooses the method of each histogram, and undoes the
+   rotation of the objects when 'rotated' is true (see FRHistogram_CrispRaster).
+   When 'search' is given, the main direction of each histogram is searched
+   instead (see searchDirections) and 'histograms' is not used.
+==============================================================================*/
+
+void hof::HoF_Raster::computeHistograms (SegmentSource &source, double **histograms, int numberForces,
+							const double *typeForces, const int *hybrid, int numberDirections,
+							int Xsize, int Ysize, bool rotated, double p0, double p1,
+							const DirectionSearch *search)
+{
+	int f;
+	std::vector<int> methodes(numberForces);
+	std::vector<double> forces(numberForces);
+
+	for(f=0;f<numberForces;f++)
+	{
+		if(hybrid[f])
+		{
+			methodes[f]=3;
+			forces[f]=2.0;
+		}
+		else
+		{
+			methodes[f]=(fabs(typeForces[f])<=ZERO_FORCE_TYPE) ? 7 : 2;
+			forces[f]=typeForces[f];
+		}
+	}
+
+	if(search)
+		searchDirections(source, *search, numberForces, &methodes[0], &forces[0],
+						 numberDirections, Xsize, Ysize, rotated, p0, p1);
+	else
+		computeSteps(source, histograms, numberForces, &methodes[0], &forces[0],
+					 numberDirections, Xsize, Ysize, rotated, p0, p1, NULL);
+}
+
+/*==============================================================================
+   computeSteps | Histograms of the objects supplied by 'source', with only
+   the directions of the selected steps computed (all of them if 'steps' is
+   NULL, zero elsewhere). Step m (0 <= m <= numberDirections/4) gives the
+   directions m, numberDirections/2-m, numberDirections/2+m and
+   numberDirections-m, as in computeHistogram.
+==============================================================================*/
+
+void hof::HoF_Raster::computeSteps (SegmentSource &source, double **histograms, int numberForces,
+					   const int *methodes, const double *typeForces, int numberDirections,
+					   int Xsize, int Ysize, bool rotated, double p0, double p1,
+					   const unsigned char *steps)
+{
+	int f, i, j, quarter=numberDirections/4;
+
+	if(!rotated)
+	{
+		computeHistogramSweep(source, histograms, numberForces, methodes, typeForces,
+							  numberDirections, Xsize, Ysize, p0, p1, steps);
+		return;
+	}
+
+	std::vector<double> auxHistograms(numberForces*(numberDirections+1));
+	std::vector<double *> auxPointers(numberForces);
+	std::vector<unsigned char> auxSteps;
+
+	for(f=0;f<numberForces;f++)
+		auxPointers[f]=&auxHistograms[f*(numberDirections+1)];
+
+	/* Direction i of the histogram is direction i+numberDirections/4 of the
+	   rotated objects, given by step numberDirections/4-m for step m */
+	if(steps)
+	{
+		auxSteps.resize(quarter+1);
+		for(i=0;i<=quarter;i++) auxSteps[i]=steps[quarter-i];
+	}
+
+	computeHistogramSweep(source, &auxPointers[0], numberForces, methodes, typeForces,
+						  numberDirections, Xsize, Ysize, p0, p1,
+						  steps ? &auxSteps[0] : NULL);
+
+	for(f=0;f<numberForces;f++)
+		for(i=0,j=numberDirections/4;i<=numberDirections;i++,j++)
+			histograms[f][i]=auxPointers[f][j%numberDirections];
+}
+
+/*==============================================================================
+   searchDirections | Index of the maximum of each histogram (the first one,
+   NaN values counting as 0), found without computing every direction.
+--------------------------------------------------------------------------------
+   One step out of search.coarseStep is computed first. Then, until
+   nothing changes, every direction closer than coarseStep to a computed value
+   at least equal to (1-search.tolerance) times the largest computed value is
+   computed, and the maximum is taken over all the computed directions. The
+   histogram values are the ones of the full computation, so the result is the
+   same whenever the maximum can be reached from a coarse value above the
+   threshold; tolerance=1 computes every direction. Assumes numberDirections
+   is a multiple of 4.
+==============================================================================*/
+
+void hof::HoF_Raster::searchDirections (SegmentSource &source, const DirectionSearch &search,
+						   int numberForces, const int *methodes, const double *typeForces,
+						   int numberDirections, int Xsize, int Ysize, bool rotated,
+						   double p0, double p1)
+{
+	int f, i, k, m, best, T=numberDirections;
+	int step=std::max(search.coarseStep, 1);
+	double value, bestValue, threshold;
+	std::vector<unsigned char> computed(T/4+1, 0), next(T/4+1, 0);
+	std::vector<double> values(numberForces*(T+1), 0.0), newValues(numberForces*(T+1));
+	std::vector<double *> newRows(numberForces);
+	bool refine;
+
+	for(f=0;f<numberForces;f++)
+		newRows[f]=&newValues[f*(T+1)];
+
+	/* Step m gives four directions: sampling the steps keeps the coarse
+	   directions about coarseStep apart */
+	for(m=0;m<=T/4;m+=step) next[m]=1;
+	next[T/4]=1;
+
+	do
+	{
+		computeSteps(source, &newRows[0], numberForces, methodes, typeForces, T,
+					 Xsize, Ysize, rotated, p0, p1, &next[0]);
+		for(f=0;f<numberForces;f++)
+			for(i=0;i<T;i++)
+				if(next[directionStep(i, T)])
+					values[f*(T+1)+i]=std::isnan(newRows[f][i]) ? 0.0 : newRows[f][i];
+		for(m=0;m<=T/4;m++)
+			if(next[m])
+			{
+				computed[m]=1;
+				next[m]=0;
+			}
+
+		refine=false;
+		for(f=0;f<numberForces;f++)
+		{
+			bestValue=-HUGE_VAL;
+			for(i=0;i<T;i++)
+				if(computed[directionStep(i, T)])
+					bestValue=std::max(bestValue, values[f*(T+1)+i]);
+			threshold=bestValue-search.tolerance*fabs(bestValue);
+			for(i=0;i<T;i++)
+			{
+				if(!computed[directionStep(i, T)] || values[f*(T+1)+i]<threshold) continue;
+				for(k=i-step+1;k<i+step;k++)
+				{
+					m=directionStep(((k%T)+T)%T, T);
+					if(!computed[m])
+					{
+						next[m]=1;
+						refine=true;
+					}
+				}
+			}
+		}
+	}
+	while(refine);
+
+	for(f=0;f<numberForces;f++)
+	{
+		best=0;
+		bestValue=-HUGE_VAL;
+		for(i=0;i<T;i++)
+			if(values[f*(T+1)+i]>bestValue)
+			{
+				best=i;
+				bestValue=values[f*(T+1)+i];
+			}
+		search.directions[f]=best;
+	}
+}
+
+/*==============================================================================
+   computeHistogramSweep | Crisp histograms of forces (methods 2, 3 and 7,
+   see computeHistogram) of the objects supplied by 'source', one per entry
+   of 'methodes' and 'typeForces'. Only the steps selected by 'steps' are
+   computed when it is not NULL (see computeSteps). Assumes Xsize >= Ysize.
+==============================================================================*/
+
+void hof::HoF_Raster::computeHistogramSweep (SegmentSource &source, double **Histos, int numberForces,
+							   const int *methodes, const double *typeForces, int Taille,
+							   int Xsize, int Ysize, double p0, double p1,
+							   const unsigned char *steps)
+{
+  LineFrame frame;
+  std::vector<int> Chaine(2*(Xsize+Ysize)+4);
+  int f, i, m, x2, y2, case_dep, case_dep_neg, case_op, case_op_neg;
+  double areaA, areaB, areaAB;
+  std::vector<double> Sum_LN_C1(numberForces), Sum_LN_C2(numberForces);
+  double angle, Pas_Angle;
+
+  for(f=0;f<numberForces;f++)
+    for(i=0;i<=Taille;i++) Histos[f][i]=0.0;
+
+  /* Same scaling of p0 and p1 as computeHistogram */
+  source.areas(&areaA, &areaB, &areaAB);
+  if(areaA>areaB) p0*=2*sqrt(areaB/(PI*255));
+  else p0*=2*sqrt(areaA/(PI*255));
+  p1*=2*sqrt(areaAB/(PI*255));
+  if(p0<p1) p0=p1;
+
+  Pas_Angle = 2*PI/Taille;
+
+  /************* Angle = 0 *****************/
+  angle=0;
+  m=0;
+  case_dep=Taille/2;
+  case_op=0;
+  case_dep_neg=Taille/2;
+  case_op_neg=Taille;
+
+  if (!steps || steps[m])
+    {
+      setFrame(frame, false, false, Xsize, 0, Xsize, Ysize, Chaine);
+      std::fill(Sum_LN_C1.begin(), Sum_LN_C1.end(), 0.0);
+      std::fill(Sum_LN_C2.begin(), Sum_LN_C2.end(), 0.0);
+      sweepLines(source, frame, Histos, numberForces, methodes, case_dep, case_op, p0,
+		 &Sum_LN_C1[0], &Sum_LN_C2[0], typeForces);
+      normalizeF02(Histos, numberForces, methodes, case_dep, case_op, 1.0, p0, Sum_LN_C1, Sum_LN_C2);
+    }
+
+  /********** angle in [-pi/4,pi/4]-{0} ***************/
+
+  angle+=Pas_Angle;
+  x2 = Xsize + 200;
+
+  while (angle<PI/4+0.0001)
+    {
+      y2 = (int) (x2 * tan (angle));
+      m++;
+      case_dep++;
+      case_op++;
+      case_dep_neg--;
+      case_op_neg--;
+
+      if (!steps || steps[m])
+	{
+	  setFrame(frame, false, false, x2, y2, Xsize, Ysize, Chaine);
+	  std::fill(Sum_LN_C1.begin(), Sum_LN_C1.end(), 0.0);
+	  std::fill(Sum_LN_C2.begin(), Sum_LN_C2.end(), 0.0);
+	  sweepLines(source, frame, Histos, numberForces, methodes, case_dep, case_op, p0*cos(angle),
+		     &Sum_LN_C1[0], &Sum_LN_C2[0], typeForces);
+	  normalizeF02(Histos, numberForces, methodes, case_dep, case_op, cos(angle), p0,
+		       Sum_LN_C1, Sum_LN_C2);
+
+	  /* Opposite negative angle: same lines, going down */
+	  frame.mirrored=true;
+	  std::fill(Sum_LN_C1.begin(), Sum_LN_C1.end(), 0.0);
+	  std::fill(Sum_LN_C2.begin(), Sum_LN_C2.end(), 0.0);
+	  sweepLines(source, frame, Histos, numberForces, methodes, case_dep_neg, case_op_neg, p0*cos(angle),
+		     &Sum_LN_C1[0], &Sum_LN_C2[0], typeForces);
+	  normalizeF02(Histos, numberForces, methodes, case_dep_neg, case_op_neg, cos(angle), p0,
+		       Sum_LN_C1, Sum_LN_C2);
+	}
+
+      angle+=Pas_Angle;
+    }
+
+  /*********** angle in ]-PI/2,-PI/4[ or ]PI/4,PI/2[ ***************/
+
+  while (angle<PI/2-0.0001)
+    {
+      y2 = (int) (x2 * tan (angle));
+      m++;
+      case_dep++;
+      case_op++;
+      case_dep_neg--;
+      case_op_neg--;
+
+      if (!steps || steps[m])
+	{
+	  setFrame(frame, true, false, x2, y2, Xsize, Ysize, Chaine);
+	  std::fill(Sum_LN_C1.begin(), Sum_LN_C1.end(), 0.0);
+	  std::fill(Sum_LN_C2.begin(), Sum_LN_C2.end(), 0.0);
+	  sweepLines(source, frame, Histos, numberForces, methodes, case_dep, case_op, p0*sin(angle),
+		     &Sum_LN_C1[0], &Sum_LN_C2[0], typeForces);
+	  normalizeF02(Histos, numberForces, methodes, case_dep, case_op, sin(angle), p0,
+		       Sum_LN_C1, Sum_LN_C2);
+
+	  /* Opposite side: same lines, going left */
+	  frame.mirrored=true;
+	  std::fill(Sum_LN_C1.begin(), Sum_LN_C1.end(), 0.0);
+	  std::fill(Sum_LN_C2.begin(), Sum_LN_C2.end(), 0.0);
+	  sweepLines(source, frame, Histos, numberForces, methodes, case_op_neg, case_dep_neg, p0*sin(angle),
+		     &Sum_LN_C2[0], &Sum_LN_C1[0], typeForces);
+	  normalizeF02(Histos, numberForces, methodes, case_dep_neg, case_op_neg, sin(angle), p0,
+		       Sum_LN_C1, Sum_LN_C2);
+	}
+
+      angle+=Pas_Angle;
+    }
+
+  /************* Angle = PI/2 *****************/
+  m++;
+  case_dep++;
+  case_op++;
+
+  if (!steps || steps[m])
+    {
+      setFrame(frame, true, false, 0, Ysize, Xsize, Ysize, Chaine);
+      std::fill(Sum_LN_C1.begin(), Sum_LN_C1.end(), 0.0);
+      std::fill(Sum_LN_C2.begin(), Sum_LN_C2.end(), 0.0);
+      sweepLines(source, frame, Histos, numberForces, methodes, case_dep, case_op, p0,
+		 &Sum_LN_C1[0], &Sum_LN_C2[0], typeForces);
+      normalizeF02(Histos, numberForces, methodes, case_dep, case_op, 1.0, p0, Sum_LN_C1, Sum_LN_C2);
+    }
+
+  for(f=0;f<numberForces;f++)
+    {
+      Histos[f][Taille] += Histos[f][0];
+      Histos[f][0] = Histos[f][Taille];
+
+      if (methodes[f]!=3)
+	Angle_Histo(Histos[f], Taille, typeForces[f]);
+    }
+}
+
+/*==============================================================
+ Bresenham chain of the lines of one direction, as run table.
+==============================================================*/
+
+void hof::HoF_Raster::setFrame (LineFrame &frame, bool projY, bool mirrored,
+				   int x2, int y2, int Xsize, int Ysize, std::vector<int> &Chaine)
+{
+  int k;
+
+  frame.projY=projY;
+  frame.mirrored=mirrored;
+  frame.Xsize=Xsize;
+  frame.Ysize=Ysize;
+  if (projY)
+    {
+      Bresenham_Y(0, 0, x2, y2, Ysize, &Chaine[0]);
+      frame.primarySize=Ysize;
+      frame.secondarySize=Xsize;
+    }
+  else
+    {
+      Bresenham_X(0, 0, x2, y2, Xsize, &Chaine[0]);
+      frame.primarySize=Xsize;
+      frame.secondarySize=Ysize;
+    }
+
+  frame.nRuns=(Chaine[0]+1)/2;
+  frame.runStart.resize(frame.nRuns+1);
+  frame.runStart[0]=0;
+  for (k=0; k<frame.nRuns; k++)
+    frame.runStart[k+1]=frame.runStart[k]+Chaine[2*k+1];
+}
+
+/*==============================================================
+ Forces along the lines of one direction. The lines starting on
+ the secondary axis come first, then the ones starting inside
+ the chain, as in Calcul_Seg_X / Calcul_Seg_Y.
+==============================================================*/
+
+void hof::HoF_Raster::sweepLines (SegmentSource &source, const LineFrame &frame,
+					double **Histos, int numberForces, const int *methodes,
+					int Case1, int Case2, double l,
+					double *Sum_LN_C1, double *Sum_LN_C2, const double *r)
+{
+  int f, s, sLo, sHi, lo, hi;
+  std::vector<Segment> segA, segB;
+  Segment *listA, *listB;
+
+  source.beginFrame(frame, &sLo, &sHi);
+
+  lo=std::max(sLo, 0);
+  hi=std::min(sHi, frame.secondarySize-1);
+  for (s=lo; s<=hi; s++)
+    {
+      source.lineSegments(frame.mirrored ? lo+hi-s : s, segA, segB);
+      if (!segA.empty() && !segB.empty())
+	{
+	  listA=linkSegments(segA);
+	  listB=linkSegments(segB);
+	  for (f=0; f<numberForces; f++)
+	    Choix_Methode(Histos[f], listA, listB, Case1, Case2,
+			  methodes[f], l, &Sum_LN_C1[f], &Sum_LN_C2[f], r[f]);
+	}
+    }
+
+  lo=std::max(sLo, 1-frame.nRuns);
+  hi=std::min(sHi, -1);
+  for (s=hi; s>=lo; s--)
+    {
+      source.lineSegments(s, segA, segB);
+      if (!segA.empty() && !segB.empty())
+	{
+	  listA=linkSegments(segA);
+	  listB=linkSegments(segB);
+	  for (f=0; f<numberForces; f++)
+	    Choix_Methode(Histos[f], listA, listB, Case1, Case2,
+			  methodes[f], l, &Sum_LN_C1[f], &Sum_LN_C2[f], r[f]);
+	}
+    }
+}
+
+/*==============================================================
+ BoxSource: each line crosses a box along at most one segment,
+ found directly from the run table.
+==============================================================*/
+
+hof::BoxSource::BoxSource (const int *boxA, const int *boxB, int width, int height)
+  : frame_(NULL)
+{
+  setBoxes(boxA, boxB, width, height);
+}
+
+void hof::BoxSource::setBoxes (const int *boxA, const int *boxB, int width, int height)
+{
+  int clipA[4], clipB[4];
+
+  clipBox(boxA, width, height, clipA);
+  clipBox(boxB, width, height, clipB);
+
+  /* Row y of the image is line height-1-y for the HoF (see Cree_Tab_Pointeur) */
+  boxA_[0]=clipA[0]; boxA_[1]=clipA[2]-1; boxA_[2]=height-clipA[3]; boxA_[3]=height-1-clipA[1];
+  boxB_[0]=clipB[0]; boxB_[1]=clipB[2]-1; boxB_[2]=height-clipB[3]; boxB_[3]=height-1-clipB[1];
+}
+
+void hof::BoxSource::areas (double *areaA, double *areaB, double *areaAB)
+{
+  int w, h;
+
+  w=boxA_[1]-boxA_[0]+1; h=boxA_[3]-boxA_[2]+1;
+  *areaA=(w>0 && h>0) ? 255.0*w*h : 0.0;
+  w=boxB_[1]-boxB_[0]+1; h=boxB_[3]-boxB_[2]+1;
+  *areaB=(w>0 && h>0) ? 255.0*w*h : 0.0;
+  w=std::min(boxA_[1], boxB_[1])-std::max(boxA_[0], boxB_[0])+1;
+  h=std::min(boxA_[3], boxB_[3])-std::max(boxA_[2], boxB_[2])+1;
+  *areaAB=(w>0 && h>0) ? 255.0*w*h : 0.0;
+}
+
+hof::BoxSource::Span hof::BoxSource::toFrame (const int *box) const
+{
+  Span span;
+
+  if (frame_->projY)
+    {
+      span.p1=box[2]; span.p2=box[3];
+      span.q1=frame_->mirrored ? frame_->Xsize-1-box[1] : box[0];
+      span.q2=frame_->mirrored ? frame_->Xsize-1-box[0] : box[1];
+    }
+  else
+    {
+      span.p1=box[0]; span.p2=box[1];
+      span.q1=frame_->mirrored ? frame_->Ysize-1-box[3] : box[2];
+      span.q2=frame_->mirrored ? frame_->Ysize-1-box[2] : box[3];
+    }
+  return span;
+}
+
+/* Lines s crossing the box: runs ka..kb overlap its primary range. */
+bool hof::BoxSource::shifts (const Span &span, int *sLo, int *sHi) const
+{
+  const std::vector<int> &start=frame_->runStart;
+  int ka, kb, pHi;
+
+  pHi=std::min(span.p2, std::min(frame_->primarySize, start[frame_->nRuns])-1);
+  if (span.p1>pHi || span.q1>span.q2)
+    return false;
+
+  ka=(int)(std::upper_bound(start.begin(), start.begin()+frame_->nRuns, span.p1)-start.begin())-1;
+  kb=(int)(std::upper_bound(start.begin(), start.begin()+frame_->nRuns, pHi)-start.begin())-1;
+  *sLo=span.q1-kb;
+  *sHi=span.q2-ka;
+  return true;
+}
+
+void hof::BoxSource::beginFrame (const LineFrame &frame, int *sLo, int *sHi)
+{
+  int loA, hiA, loB, hiB;
+
+  frame_=&frame;
+  spanA_=toFrame(boxA_);
+  spanB_=toFrame(boxB_);
+  if (shifts(spanA_, &loA, &hiA) && shifts(spanB_, &loB, &hiB))
+    {
+      *sLo=std::max(loA, loB);
+      *sHi=std::min(hiA, hiB);
+    }
+  else
+    {
+      *sLo=1;
+      *sHi=0;
+    }
+}
+
+bool hof::BoxSource::segment (const Span &span, int s, Segment &seg) const
+{
+  const std::vector<int> &start=frame_->runStart;
+  int klo, khi, lo, hi;
+
+  klo=std::max(span.q1-s, 0);
+  khi=std::min(span.q2-s, frame_->nRuns-1);
+  if (klo>khi)
+    return false;
+
+  lo=std::max(span.p1, start[klo]);
+  hi=std::min(std::min(span.p2, start[khi+1]-1), frame_->primarySize-1);
+  if (lo>hi)
+    return false;
+
+  /* Only the primary coordinates are used by the force computations */
+  seg.x1=lo;
+  seg.x2=hi;
+  seg.y1=seg.y2=s;
+  seg.Val=255;
+  seg.suivant=NULL;
+  return true;
+}
+
+void hof::BoxSource::lineSegments (int s, std::vector<Segment> &segA, std::vector<Segment> &segB)
+{
+  Segment seg;
+
+  segA.clear();
+  segB.clear();
+  if (segment(spanA_, s, seg)) segA.push_back(seg);
+  if (segment(spanB_, s, seg)) segB.push_back(seg);
+}
+
+/*==============================================================
+ Segments of a line read from an image, between the ends of its
+ intersection with a box.
+==============================================================*/
+
+template<typename Member>
+void hof::BoxSource::readLine (const Member &member, const Span &span, int s,
+			       std::vector<Segment> &segments) const
+{
+  const std::vector<int> &start=frame_->runStart;
+  Segment box, seg;
+  int p, k, q, x, y, inside;
+
+  if (!segment(span, s, box))
+    return;
+
+  seg=box;
+  inside=0;
+  k=(int)(std::upper_bound(start.begin(), start.begin()+frame_->nRuns, box.x1)-start.begin())-1;
+  for (p=box.x1; p<=box.x2; p++)
+    {
+      while (p>=start[k+1]) k++;
+      q=k+s;
+      if (frame_->projY)
+	{
+	  y=p;
+	  x=frame_->mirrored ? frame_->Xsize-1-q : q;
+	}
+      else
+	{
+	  x=p;
+	  y=frame_->mirrored ? frame_->Ysize-1-q : q;
+	}
+
+      if (member(frame_->Ysize-1-y, x))
+	{
+	  if (!inside)
+	    {
+	      inside=1;
+	      seg.x1=p;
+	    }
+	  seg.x2=p;
+	}
+      else if (inside)
+	{
+	  inside=0;
+	  segments.push_back(seg);
+	}
+    }
+  if (inside)
+    segments.push_back(seg);
+}
+
+/*==============================================================
+ RasterSource: the segments of a line are read from the images,
+ between the ends of its intersection with the bounding box of
+ the object.
+==============================================================*/
+
+hof::RasterSource::RasterSource (const unsigned char *imageA, const unsigned char *imageB,
+				 int roiX, int roiY, int roiWidth, int roiHeight, int width, int height)
+  : imageA_(imageA), imageB_(imageB), roiX_(roiX), roiY_(roiY), roiWidth_(roiWidth),
+    areaA_(0.0), areaB_(0.0), areaAB_(0.0)
+{
+  int x, y, a, b;
+  int boxA[4]={width, height, 0, 0}, boxB[4]={width, height, 0, 0};
+  const unsigned char *ptrA=imageA, *ptrB=imageB;
+
+  for (y=roiY; y<roiY+roiHeight; y++)
+    for (x=roiX; x<roiX+roiWidth; x++, ptrA++, ptrB++)
+      {
+	a=*ptrA;
+	b=*ptrB;
+	if (a)
+	  {
+	    areaA_+=a;
+	    boxA[0]=std::min(boxA[0], x); boxA[2]=std::max(boxA[2], x+1);
+	    boxA[1]=std::min(boxA[1], y); boxA[3]=std::max(boxA[3], y+1);
+	  }
+	if (b)
+	  {
+	    areaB_+=b;
+	    boxB[0]=std::min(boxB[0], x); boxB[2]=std::max(boxB[2], x+1);
+	    boxB[1]=std::min(boxB[1], y); boxB[3]=std::max(boxB[3], y+1);
+	  }
+	if (a && b)
+	  areaAB_+=std::min(a, b);
+      }
+
+  setBoxes(boxA, boxB, width, height);
+}
+
+void hof::RasterSource::areas (double *areaA, double *areaB, double *areaAB)
+{
+  *areaA=areaA_;
+  *areaB=areaB_;
+  *areaAB=areaAB_;
+}
+
+void hof::RasterSource::lineSegments (int s, std::vector<Segment> &segA, std::vector<Segment> &segB)
+{
+  segA.clear();
+  segB.clear();
+  readLine(ImageMember(imageA_, roiX_, roiY_, roiWidth_), spanA_, s, segA);
+  readLine(ImageMember(imageB_, roiX_, roiY_, roiWidth_), spanB_, s, segB);
+}
+
+/*==============================================================
+ LabelSource: same as RasterSource, for the pixels of a label
+ image equal to the labels of A and B. Different labels never
+ intersect.
+==============================================================*/
+
+hof::LabelSource::LabelSource (const int *labels, int labelA, int labelB, int width, int height,
+			       const int *boxA, const int *boxB, double areaA, double areaB)
+  : labels_(labels), labelA_(labelA), labelB_(labelB), areaA_(areaA), areaB_(areaB)
+{
+  setBoxes(boxA, boxB, width, height);
+}
+
+void hof::LabelSource::areas (double *areaA, double *areaB, double *areaAB)
+{
+  *areaA=areaA_;
+  *areaB=areaB_;
+  *areaAB=(labelA_==labelB_) ? areaA_ : 0.0;
+}
+
+void hof::LabelSource::lineSegments (int s, std::vector<Segment> &segA, std::vector<Segment> &segB)
+{
+  segA.clear();
+  segB.clear();
+  readLine(LabelMember(labels_, labelA_, frame_->Xsize), spanA_, s, segA);
+  readLine(LabelMember(labels_, labelB_, frame_->Xsize), spanB_, s, segB);
+}
@@ -30,6 +30,7 @@ py::array_t<double> FHist(py::array_t<unsigned char>& imageA, py::array_t<unsign
     int N = bufA.shape[0];
 
     hof::HoF_Raster raster_obj;
+    py::gil_scoped_release release;
 
     if (useHybrid) {
         raster_obj.F02Histogram_CrispRaster(ptr_histogram, numberDirections, ptrA, ptrB, M, N, p0, p1);
@@ -56,4 +57,395 @@ py::array_t<double> F2Hist(py::array_t<unsigned char>& imageA, py::array_t<unsig
 
 py::array_t<double> F02Hist(py::array_t<unsigned char>& imageA, py::array_t<unsigned char>& imageB, int numberDirections, double p0, double p1) {
     return FHist(imageA, imageB, numberDirections, true, 0.0, p0, p1);
+}
+
+
+py::array_t<double> FBoxHist(std::vector<int>& boxA, std::vector<int>& boxB, int width, int height,
+                             int numberDirections, bool useHybrid, double typeForce, double p0, double p1) {
+
+    if (boxA.size() != 4 || boxB.size() != 4)
+    {
+        throw std::runtime_error("Boxes must be given as [x1, y1, x2, y2]");
+    }
+    if (width <= 0 || height <= 0)
+    {
+        throw std::runtime_error("Image width and height must be positive");
+    }
+
+    auto histogram = py::array_t<double>(numberDirections + 1);
+
+    py::buffer_info buf_histogram = histogram.request();
+    double* ptr_histogram = (double*)buf_histogram.ptr;
+
+    hof::HoF_Raster raster_obj;
+    py::gil_scoped_release release;
+
+    if (useHybrid) {
+        raster_obj.F02Histogram_CrispBoxes(ptr_histogram, numberDirections, boxA.data(), boxB.data(), width, height, p0, p1);
+    }
+    else {
+        raster_obj.FRHistogram_CrispBoxes(ptr_histogram, numberDirections, typeForce, boxA.data(), boxB.data(), width, height);
+    }
+
+    return histogram;
+}
+
+
+py::array_t<double> FRBoxHist(std::vector<int>& boxA, std::vector<int>& boxB, int width, int height, double typeForce, int numberDirections) {
+    return FBoxHist(boxA, boxB, width, height, numberDirections, false, typeForce, 0.01, 3.0);
+}
+
+py::array_t<double> F0BoxHist(std::vector<int>& boxA, std::vector<int>& boxB, int width, int height, int numberDirections) {
+    return FRBoxHist(boxA, boxB, width, height, 0.0, numberDirections);
+}
+
+py::array_t<double> F2BoxHist(std::vector<int>& boxA, std::vector<int>& boxB, int width, int height, int numberDirections) {
+    return FRBoxHist(boxA, boxB, width, height, 2.0, numberDirections);
+}
+
+py::array_t<double> F02BoxHist(std::vector<int>& boxA, std::vector<int>& boxB, int width, int height, int numberDirections, double p0, double p1) {
+    return FBoxHist(boxA, boxB, width, height, numberDirections, true, 0.0, p0, p1);
+}
+
+
+/* Force types of MultiHist: a number r for the F-r histogram, or 'hybrid'. */
+void parseForces(py::sequence& forces, std::vector<double>& typeForces, std::vector<int>& hybrid) {
+
+    if (py::len(forces) == 0)
+    {
+        throw std::runtime_error("At least one force type is required");
+    }
+
+    for (auto item : forces) {
+        if (py::isinstance<py::str>(item)) {
+            if (item.cast<std::string>() != "hybrid")
+            {
+                throw std::runtime_error("Force types must be numbers or 'hybrid'");
+            }
+            typeForces.push_back(2.0);
+            hybrid.push_back(1);
+        }
+        else {
+            typeForces.push_back(item.cast<double>());
+            hybrid.push_back(0);
+        }
+    }
+}
+
+
+/* Output of the Multi* functions: the histograms of 'numberItems' pairs (or of a
+   single pair if numberItems < 0), or their main directions when coarseStep > 0. */
+struct MultiOutput {
+    py::array array;
+    double* histograms;
+    hof::DirectionSearch search;
+    int numberForces, numberDirections;
+
+    MultiOutput(int numberItems, int numberForces_, int numberDirections_, int coarseStep, double tolerance)
+        : histograms(NULL), numberForces(numberForces_), numberDirections(numberDirections_) {
+
+        std::vector<py::ssize_t> shape;
+        if (numberItems >= 0) {
+            shape.push_back(numberItems);
+        }
+        shape.push_back(numberForces);
+
+        search.coarseStep = coarseStep;
+        search.tolerance = tolerance;
+        search.directions = NULL;
+
+        if (coarseStep > 0) {
+            if (numberDirections % 4 != 0)
+            {
+                throw std::runtime_error("numberDirections must be a multiple of 4");
+            }
+            if (tolerance < 0)
+            {
+                throw std::runtime_error("tolerance must be nonnegative");
+            }
+            array = py::array_t<int>(shape);
+            search.directions = (int*)array.mutable_data();
+        }
+        else {
+            shape.push_back(numberDirections + 1);
+            array = py::array_t<double>(shape);
+            histograms = (double*)array.mutable_data();
+        }
+    }
+
+    const hof::DirectionSearch* directionSearch() const {
+        return search.directions ? &search : NULL;
+    }
+
+    /* Rows of the histograms of a single pair */
+    std::vector<double*> rows() const {
+        std::vector<double*> result(numberForces, (double*)NULL);
+        for (int i = 0; histograms && i < numberForces; i++) {
+            result[i] = histograms + i * (numberDirections + 1);
+        }
+        return result;
+    }
+};
+
+
+py::array MultiROI(ImageArray& imageA, ImageArray& imageB, int x, int y, int width, int height,
+                   py::sequence& forces, int numberDirections, double p0, double p1, int coarseStep, double tolerance) {
+
+    py::buffer_info bufA = imageA.request();
+    py::buffer_info bufB = imageB.request();
+
+    if (bufA.ndim != 2 || bufB.ndim != 2)
+    {
+        throw std::runtime_error("Image dimensions must be 2");
+    }
+    if ((bufA.shape[0] != bufB.shape[0]) || (bufA.shape[1] != bufB.shape[1]))
+    {
+        throw std::runtime_error("Images must have same shape");
+    }
+
+    int M = bufA.shape[1];
+    int N = bufA.shape[0];
+
+    if (x < 0 || y < 0 || x + M > width || y + N > height)
+    {
+        throw std::runtime_error("Cropped images must lie inside the width x height image");
+    }
+
+    std::vector<double> typeForces;
+    std::vector<int> hybrid;
+    parseForces(forces, typeForces, hybrid);
+
+    MultiOutput output(-1, (int)typeForces.size(), numberDirections, coarseStep, tolerance);
+    std::vector<double*> rows = output.rows();
+
+    unsigned char* ptrA = (unsigned char*)bufA.ptr;
+    unsigned char* ptrB = (unsigned char*)bufB.ptr;
+
+    hof::HoF_Raster raster_obj;
+    {
+        // The GIL is taken back at the end of the block, before the array is copied into the return value
+        py::gil_scoped_release release;
+
+        raster_obj.MultiHistogram_CrispRasterROI(rows.data(), (int)typeForces.size(), typeForces.data(), hybrid.data(),
+                                                 numberDirections, ptrA, ptrB, x, y, M, N, width, height, p0, p1,
+                                                 output.directionSearch());
+    }
+
+    return output.array;
+}
+
+
+py::array Multi(ImageArray& imageA, ImageArray& imageB,
+                py::sequence& forces, int numberDirections, double p0, double p1, int coarseStep, double tolerance) {
+
+    py::buffer_info bufA = imageA.request();
+
+    if (bufA.ndim != 2)
+    {
+        throw std::runtime_error("Image dimensions must be 2");
+    }
+
+    return MultiROI(imageA, imageB, 0, 0, (int)bufA.shape[1], (int)bufA.shape[0], forces, numberDirections, p0, p1,
+                    coarseStep, tolerance);
+}
+
+
+py::array MultiBox(std::vector<int>& boxA, std::vector<int>& boxB, int width, int height,
+                   py::sequence& forces, int numberDirections, double p0, double p1, int coarseStep, double tolerance) {
+
+    if (boxA.size() != 4 || boxB.size() != 4)
+    {
+        throw std::runtime_error("Boxes must be given as [x1, y1, x2, y2]");
+    }
+    if (width <= 0 || height <= 0)
+    {
+        throw std::runtime_error("Image width and height must be positive");
+    }
+
+    std::vector<double> typeForces;
+    std::vector<int> hybrid;
+    parseForces(forces, typeForces, hybrid);
+
+    MultiOutput output(-1, (int)typeForces.size(), numberDirections, coarseStep, tolerance);
+    std::vector<double*> rows = output.rows();
+
+    hof::HoF_Raster raster_obj;
+    {
+        py::gil_scoped_release release;
+
+        raster_obj.MultiHistogram_CrispBoxes(rows.data(), (int)typeForces.size(), typeForces.data(), hybrid.data(),
+                                             numberDirections, boxA.data(), boxB.data(), width, height, p0, p1,
+                                             output.directionSearch());
+    }
+
+    return output.array;
+}
+
+
+/* Pairs of objects given as an (n_pairs, 2) array. */
+int* parsePairs(IndexArray& pairs, int* numberPairs) {
+
+    py::buffer_info bufPairs = pairs.request();
+
+    if (bufPairs.ndim != 2 || bufPairs.shape[1] != 2)
+    {
+        throw std::runtime_error("Pairs must be given as an (n, 2) array");
+    }
+
+    *numberPairs = (int)bufPairs.shape[0];
+    return (int*)bufPairs.ptr;
+}
+
+
+py::array MultiBatch(IndexArray& labels, IndexArray& pairs, py::sequence& forces, int numberDirections,
+                     double p0, double p1, int numberThreads, int coarseStep, double tolerance) {
+
+    py::buffer_info bufLabels = labels.request();
+
+    if (bufLabels.ndim != 2)
+    {
+        throw std::runtime_error("Label image dimensions must be 2");
+    }
+
+    int numberPairs;
+    int* ptr_pairs = parsePairs(pairs, &numberPairs);
+
+    for (int i = 0; i < 2 * numberPairs; i++) {
+        if (ptr_pairs[i] < 0)
+        {
+            throw std::runtime_error("Labels of the pairs must be nonnegative");
+        }
+    }
+
+    std::vector<double> typeForces;
+    std::vector<int> hybrid;
+    parseForces(forces, typeForces, hybrid);
+
+    MultiOutput output(numberPairs, (int)typeForces.size(), numberDirections, coarseStep, tolerance);
+    int* ptr_labels = (int*)bufLabels.ptr;
+
+    int M = bufLabels.shape[1];
+    int N = bufLabels.shape[0];
+
+    hof::HoF_Raster raster_obj;
+    {
+        py::gil_scoped_release release;
+
+        raster_obj.MultiHistogram_LabelBatch(output.histograms, numberPairs, ptr_pairs, (int)typeForces.size(),
+                                             typeForces.data(), hybrid.data(), numberDirections,
+                                             ptr_labels, M, N, p0, p1, numberThreads, output.directionSearch());
+    }
+
+    return output.array;
+}
+
+
+py::array MultiBoxBatch(IndexArray& boxes, IndexArray& pairs, int width, int height, py::sequence& forces,
+                        int numberDirections, double p0, double p1, int numberThreads, int coarseStep, double tolerance) {
+
+    py::buffer_info bufBoxes = boxes.request();
+
+    if (bufBoxes.ndim != 2 || bufBoxes.shape[1] != 4)
+    {
+        throw std::runtime_error("Boxes must be given as an (n, 4) array of [x1, y1, x2, y2]");
+    }
+    if (width <= 0 || height <= 0)
+    {
+        throw std::runtime_error("Image width and height must be positive");
+    }
+
+    int numberPairs;
+    int* ptr_pairs = parsePairs(pairs, &numberPairs);
+
+    int numberBoxes = (int)bufBoxes.shape[0];
+    for (int i = 0; i < 2 * numberPairs; i++) {
+        if (ptr_pairs[i] < 0 || ptr_pairs[i] >= numberBoxes)
+        {
+            throw std::runtime_error("Pair indices must refer to the boxes");
+        }
+    }
+
+    std::vector<double> typeForces;
+    std::vector<int> hybrid;
+    parseForces(forces, typeForces, hybrid);
+
+    MultiOutput output(numberPairs, (int)typeForces.size(), numberDirections, coarseStep, tolerance);
+    int* ptr_boxes = (int*)bufBoxes.ptr;
+
+    hof::HoF_Raster raster_obj;
+    {
+        py::gil_scoped_release release;
+
+        raster_obj.MultiHistogram_BoxBatch(output.histograms, numberPairs, ptr_pairs, (int)typeForces.size(),
+                                           typeForces.data(), hybrid.data(), numberDirections,
+                                           ptr_boxes, numberBoxes, width, height, p0, p1, numberThreads,
+                                           output.directionSearch());
+    }
+
+    return output.array;
+}
+
+
+py::array MultiHist(ImageArray& imageA, ImageArray& imageB, py::sequence forces, int numberDirections, double p0, double p1) {
+    return Multi(imageA, imageB, forces, numberDirections, p0, p1, 0, 0.0);
+}
+
+py::array MultiHistROI(ImageArray& imageA, ImageArray& imageB, int x, int y, int width, int height,
+                       py::sequence forces, int numberDirections, double p0, double p1) {
+    return MultiROI(imageA, imageB, x, y, width, height, forces, numberDirections, p0, p1, 0, 0.0);
+}
+
+py::array MultiBoxHist(std::vector<int>& boxA, std::vector<int>& boxB, int width, int height,
+                       py::sequence forces, int numberDirections, double p0, double p1) {
+    return MultiBox(boxA, boxB, width, height, forces, numberDirections, p0, p1, 0, 0.0);
+}
+
+py::array MultiHistBatch(IndexArray& labels, IndexArray& pairs, py::sequence forces, int numberDirections,
+                         double p0, double p1, int numberThreads) {
+    return MultiBatch(labels, pairs, forces, numberDirections, p0, p1, numberThreads, 0, 0.0);
+}
+
+py::array MultiBoxHistBatch(IndexArray& boxes, IndexArray& pairs, int width, int height, py::sequence forces,
+                            int numberDirections, double p0, double p1, int numberThreads) {
+    return MultiBoxBatch(boxes, pairs, width, height, forces, numberDirections, p0, p1, numberThreads, 0, 0.0);
+}
+
+
+/* The coarseStep of the ArgMax functions must be positive, 0 is used for histograms. */
+void checkCoarseStep(int coarseStep) {
+
+    if (coarseStep < 1)
+    {
+        throw std::runtime_error("coarseStep must be positive");
+    }
+}
+
+py::array MultiArgMax(ImageArray& imageA, ImageArray& imageB, py::sequence forces, int numberDirections,
+                      int coarseStep, double tolerance, double p0, double p1) {
+    checkCoarseStep(coarseStep);
+    return Multi(imageA, imageB, forces, numberDirections, p0, p1, coarseStep, tolerance);
+}
+
+py::array MultiArgMaxROI(ImageArray& imageA, ImageArray& imageB, int x, int y, int width, int height,
+                         py::sequence forces, int numberDirections, int coarseStep, double tolerance, double p0, double p1) {
+    checkCoarseStep(coarseStep);
+    return MultiROI(imageA, imageB, x, y, width, height, forces, numberDirections, p0, p1, coarseStep, tolerance);
+}
+
+py::array MultiBoxArgMax(std::vector<int>& boxA, std::vector<int>& boxB, int width, int height,
+                         py::sequence forces, int numberDirections, int coarseStep, double tolerance, double p0, double p1) {
+    checkCoarseStep(coarseStep);
+    return MultiBox(boxA, boxB, width, height, forces, numberDirections, p0, p1, coarseStep, tolerance);
+}
+
+py::array MultiArgMaxBatch(IndexArray& labels, IndexArray& pairs, py::sequence forces, int numberDirections,
+                           int coarseStep, double tolerance, double p0, double p1, int numberThreads) {
+    checkCoarseStep(coarseStep);
+    return MultiBatch(labels, pairs, forces, numberDirections, p0, p1, numberThreads, coarseStep, tolerance);
+}
+
+py::array MultiBoxArgMaxBatch(IndexArray& boxes, IndexArray& pairs, int width, int height, py::sequence forces,
+                              int numberDirections, int coarseStep, double tolerance, double p0, double p1, int numberThreads) {
+    checkCoarseStep(coarseStep);
+    return MultiBoxBatch(boxes, pairs, width, height, forces, numberDirections, p0, p1, numberThreads, coarseStep, tolerance);
 }
\ No newline at end of file
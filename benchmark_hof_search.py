@@ -0,0 +1,105 @@
+"""
+This benchmark script compares the HOF angles found by the coarse-to-fine direction search with the ones of the full
+histograms, for the object tuples detected in the images located in ./input/demo_images/. With --synthetic, the tuples
+are random boxes of the sizes of the demo images instead, so the benchmark runs without the YOLO weights
+"""
+from libs.spatial_relationships import compute_hof, create_roi_masks
+from utils import convert_boxes, get_image_tuples
+import numpy as np
+import cv2
+import json
+import os
+import sys
+import time
+
+DEMO_IMAGES_DIR = './input/demo_images/'
+COARSE_STEPS = [4, 8, 16]
+TOLERANCES = [0.0, 0.05, 0.1, 0.2, 0.3]
+# Number of random objects of each image of the synthetic tuples
+SYNTHETIC_OBJECTS = 8
+# Number of timed runs, the fastest one is reported
+NUM_RUNS = 3
+
+
+def load_tuples(img_dir=None):
+    """
+    Detect the objects of the images and build their object tuples
+    :param img_dir: Directory of the images
+    :return: A list of (arg_box, ref_box, img_shape) for every object tuple of the images
+    """
+    from libs.object_detection import YoloObjectDetection
+    detector = YoloObjectDetection()
+    tuples = []
+    for name in sorted(os.listdir(img_dir)):
+        image = cv2.imread(img_dir + name, cv2.IMREAD_COLOR)
+        _, results = detector.compute_detections(image, name)
+        boxes = convert_boxes(results['bounding_boxes'])
+        labels = json.loads(results['labels'])
+        label_box_map = dict(zip(labels, boxes))
+        for arg_label, ref_label in get_image_tuples(img_labels=labels):
+            tuples.append((label_box_map[arg_label], label_box_map[ref_label], image.shape[:2]))
+    return tuples
+
+
+def synthetic_tuples(img_dir=None, seed=0):
+    """
+    Build random object tuples of the sizes of the images, with boxes of 5% to 50% of the image sides
+    :param img_dir: Directory of the images
+    :param seed: Seed of the random generator
+    :return: A list of (arg_box, ref_box, img_shape) for every object tuple of the images
+    """
+    rng = np.random.default_rng(seed)
+    tuples = []
+    for name in sorted(os.listdir(img_dir)):
+        img_shape = cv2.imread(img_dir + name, cv2.IMREAD_COLOR).shape[:2]
+        boxes = []
+        for _ in range(SYNTHETIC_OBJECTS):
+            width = int(rng.uniform(0.05, 0.5) * img_shape[1])
+            height = int(rng.uniform(0.05, 0.5) * img_shape[0])
+            x, y = int(rng.integers(0, img_shape[1] - width)), int(rng.integers(0, img_shape[0] - height))
+            boxes.append([x, y, x + width, y + height])
+        for arg_idx in range(len(boxes)):
+            for ref_idx in range(arg_idx + 1, len(boxes)):
+                tuples.append((boxes[arg_idx], boxes[ref_idx], img_shape))
+    return tuples
+
+
+def time_angles(tuples, box_hof=True, coarse_step=0, tolerance=0.1):
+    """
+    Compute the F0, F2, and Hybrid HOF angles of every tuple
+    :param tuples: The (arg_box, ref_box, img_shape) object tuples
+    :param box_hof: Compute the HOF from the bounding boxes instead of from the cropped masks
+    :param coarse_step: Coarse step of the direction search (0 for the full histograms)
+    :param tolerance: Refinement tolerance of the direction search
+    :return: The (n, 3) array of angles and the elapsed time in seconds of the fastest of NUM_RUNS runs
+    """
+    times = []
+    for _ in range(NUM_RUNS):
+        angles = []
+        start = time.perf_counter()
+        for arg_box, ref_box, img_shape in tuples:
+            if box_hof:
+                angles.append(compute_hof(arg_box, ref_box, img_shape=img_shape, coarse_step=coarse_step,
+                                          tolerance=tolerance))
+            else:
+                arg_mask, ref_mask, roi_origin = create_roi_masks(arg_box, ref_box, img_shape[0], img_shape[1])
+                angles.append(compute_hof(arg_mask, ref_mask, img_shape=img_shape, roi_origin=roi_origin,
+                                          coarse_step=coarse_step, tolerance=tolerance))
+        times.append(time.perf_counter() - start)
+    return np.array(angles), min(times)
+
+
+if __name__ == '__main__':
+    object_tuples = synthetic_tuples(DEMO_IMAGES_DIR) if '--synthetic' in sys.argv else load_tuples(DEMO_IMAGES_DIR)
+    print(f'{len(object_tuples)} object tuples')
+
+    for mode, box_hof in [('Bounding boxes', True), ('Cropped masks', False)]:
+        full_angles, full_time = time_angles(object_tuples, box_hof)
+        print(f'{mode}: full histograms {full_time:.3f}s')
+        for coarse_step in COARSE_STEPS:
+            for tolerance in TOLERANCES:
+                search_angles, search_time = time_angles(object_tuples, box_hof, coarse_step, tolerance)
+                agreement = np.mean(search_angles == full_angles, axis=0) if len(object_tuples) else np.ones(3)
+                print(f'  coarse_step={coarse_step:2d} tolerance={tolerance:.2f}: {search_time:.3f}s '
+                      f'({full_time / max(search_time, 1e-9):.1f}x), agreement F0 {agreement[0]:.3f} '
+                      f'F2 {agreement[1]:.3f} Hybrid {agreement[2]:.3f}')
@@ -0,0 +1,54 @@
+"""
+This benchmark script measures the import time of each public entry point with python -X importtime, in a new
+interpreter per import, and lists the heavy dependencies each one loads. The spatial relationship entry points must not
+load the dependencies of the annotation and the models, so a relationship only service starts quickly
+"""
+import subprocess
+import sys
+
+NUM_RUNS = 3
+ENTRY_POINTS = ['libs.spatial_relationships', 'libs.tuple_records', 'libs.annotation.general',
+                'libs.annotation.person', 'libs.object_detection', 'libs.columnar_export', 'libs.batch_runner',
+                'libs.video_session', 'scene_labeling']
+HEAVY_MODULES = ['pandas', 'sklearn', 'scipy', 'skfuzzy', 'cv2', 'torch', 'torchvision', 'pyarrow']
+# Dependencies the spatial relationship entry points must not load on import
+SPATIAL_ENTRY_POINTS = ['libs.spatial_relationships', 'libs.tuple_records']
+SPATIAL_FORBIDDEN = ['pandas', 'sklearn', 'scipy', 'skfuzzy', 'cv2', 'torch', 'torchvision', 'pyarrow']
+# Entry points that only load OpenCV once an image is decoded or the detector is built
+LAZY_CV2_ENTRY_POINTS = ['libs.object_detection', 'libs.batch_runner', 'libs.video_session', 'scene_labeling']
+
+
+def measure_import(module=None):
+    """
+    Import a module in a new interpreter with -X importtime
+    :param module: Name of the module
+    :return: The cumulative import time of the module in seconds, and the heavy modules loaded by the import
+    """
+    assert module is not None, "Must supply the module name"
+    code = f'import sys, {module}; print(" ".join(m for m in {HEAVY_MODULES!r} if m in sys.modules))'
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], capture_output=True, text=True,
+                            check=True)
+    import_time = None
+    for line in result.stderr.splitlines():
+        # Lines of the form "import time: self [us] | cumulative | imported package"
+        fields = line.split('|')
+        if line.startswith('import time:') and len(fields) == 3 and fields[2].strip() == module:
+            import_time = int(fields[1]) / 1e6
+    return import_time, result.stdout.split()
+
+
+if __name__ == '__main__':
+    failures = 0
+    print(f'{"Entry point":<28} {"Import time":>12}  Heavy modules')
+    for entry_point in ENTRY_POINTS:
+        runs = [measure_import(entry_point) for _ in range(NUM_RUNS)]
+        import_time = min(t for t, _ in runs)
+        loaded = runs[0][1]
+        print(f'{entry_point:<28} {import_time * 1e3:>10.0f}ms  {", ".join(loaded) or "-"}')
+        if entry_point in SPATIAL_ENTRY_POINTS and set(loaded) & set(SPATIAL_FORBIDDEN):
+            print(f'  {entry_point} must not load {", ".join(sorted(set(loaded) & set(SPATIAL_FORBIDDEN)))}')
+            failures += 1
+        if entry_point in LAZY_CV2_ENTRY_POINTS and 'cv2' in loaded:
+            print(f'  {entry_point} must not load cv2')
+            failures += 1
+    sys.exit(1 if failures else 0)
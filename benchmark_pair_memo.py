@@ -0,0 +1,83 @@
+"""
+This benchmark script measures the pair memo of the spatial relationships on the frames of a simulated fixed camera:
+parked objects whose detected boxes jitter by a pixel or two between the frames, and people walking through the scene.
+For each quantization step it reports the hit rate of the memo, the computation time, and the agreement of the results
+with the ones computed without the memo
+"""
+from libs.spatial_relationships import SpatialRelationships
+import numpy as np
+import json
+import time
+
+NUM_FRAMES = 40
+NUM_PEOPLE = 3
+STATIC_LABELS = ['car'] * 6 + ['bench'] * 3 + ['traffic_light'] * 3
+IMG_WIDTH = 1280
+IMG_HEIGHT = 720
+# Largest detection jitter of the parked objects in pixels
+JITTER = 2
+MEMO_SIZE = 4096
+MEMO_STEPS = [0., 0.002, 0.005, 0.01]
+METADATA = {'labels': json.dumps(['street_sign']), 'confidences': json.dumps([1.]), 'num_labels': 1}
+
+
+def create_frames(num_frames=NUM_FRAMES, seed=0):
+    """
+    Create the object detection results of the frames of a fixed camera
+    :param num_frames: Number of frames
+    :param seed: Seed of the random generator
+    :return: List of the object detection results of each frame
+    """
+    rng = np.random.default_rng(seed)
+    static_boxes = []
+    for _ in STATIC_LABELS:
+        x, y = rng.integers(0, IMG_WIDTH - 200), rng.integers(0, IMG_HEIGHT - 150)
+        static_boxes.append([int(x), int(y), int(x + rng.integers(40, 200)), int(y + rng.integers(40, 150))])
+    counts = {}
+    labels = []
+    for label in STATIC_LABELS + ['person'] * NUM_PEOPLE:
+        counts[label] = counts.get(label, 0) + 1
+        labels.append(f'{label}_{counts[label]}')
+    starts = rng.integers(0, IMG_WIDTH - 60, NUM_PEOPLE)
+    frames = []
+    for i in range(num_frames):
+        # Half of the detections of a parked object are the same as in the previous frames
+        boxes = [box if rng.random() < 0.5 else [int(c + rng.integers(-JITTER, JITTER + 1)) for c in box]
+                 for box in static_boxes]
+        for start in starts:
+            x = int((start + 15 * i) % (IMG_WIDTH - 60))
+            boxes.append([x, 400, x + 60, 600])
+        boxes = [[max(0, c) for c in box] for box in boxes]
+        frames.append({'key': f'frame_{i}.jpg', 'num_objects': len(labels), 'bounding_boxes': json.dumps(boxes),
+                       'confidences': json.dumps([0.9] * len(labels)), 'labels': json.dumps(labels),
+                       'img_width': IMG_WIDTH, 'img_height': IMG_HEIGHT})
+    return frames
+
+
+def compute_frames(spatial_relationships, frames):
+    """
+    Compute the spatial relationships of the frames
+    :return: List of the tuple results of each frame, and the computation time
+    """
+    start = time.perf_counter()
+    results = [spatial_relationships.compute_spatial_relationships(frame, METADATA)[1] for frame in frames]
+    return results, time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    od_frames = create_frames()
+    # Warm up the HOF threads before the timings
+    compute_frames(SpatialRelationships(), od_frames[:2])
+    reference, reference_time = compute_frames(SpatialRelationships(), od_frames)
+    num_tuples = sum(len(r) for r in reference)
+    print(f'{NUM_FRAMES} frames, {num_tuples} tuples, without memo {reference_time:.2f}s')
+    for step in MEMO_STEPS:
+        memo = SpatialRelationships(pair_memo_size=MEMO_SIZE, pair_memo_step=step)
+        results, memo_time = compute_frames(memo, od_frames)
+        pairs = [(a, b) for frame_a, frame_b in zip(reference, results) for a, b in zip(frame_a, frame_b)]
+        exact = np.mean([all(a[k] == b[k] for k in ['proximity', 'overlap', 'f0', 'f2', 'hybrid']) for a, b in pairs])
+        same_summary = np.mean([a['spatial_relationship'] == b['spatial_relationship'] for a, b in pairs])
+        giou_error = max(abs(a['proximity'] - b['proximity']) for a, b in pairs)
+        stats = memo.pair_memo_stats()
+        print(f'Step {step}: hit rate {stats["hit_rate"]:.1%}, {memo_time:.2f}s ({reference_time / memo_time:.1f}x), '
+              f'exact results {exact:.1%}, same relationship {same_summary:.1%}, max GIOU error {giou_error:.4f}')
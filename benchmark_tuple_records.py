@@ -0,0 +1,75 @@
+"""
+This benchmark script compares the memory footprint and the number of objects tracked by the garbage collector of the
+tuple results stored as lists of dictionaries and as compact ImageTuples records, for images of 25 objects, 300 object
+tuples each
+"""
+from libs.spatial_relationships import SpatialRelationships
+import numpy as np
+import json
+import gc
+import tracemalloc
+
+NUM_IMAGES = 100
+NUM_OBJECTS = 25
+IMG_WIDTH = 640
+IMG_HEIGHT = 480
+OBJECT_LABELS = ['person', 'chair', 'cup', 'dog', 'bottle']
+METADATA = {'labels': json.dumps(['soccer_ball']), 'confidences': json.dumps([1.]), 'num_labels': 1}
+
+
+def create_detections(num_images=NUM_IMAGES, seed=0):
+    """
+    Create random object detection results
+    :param num_images: Number of images
+    :param seed: Seed of the random generator
+    :return: List of the object detection results of each image
+    """
+    rng = np.random.default_rng(seed)
+    results = []
+    for i in range(num_images):
+        labels = [f'{OBJECT_LABELS[j % len(OBJECT_LABELS)]}_{j // len(OBJECT_LABELS) + 1}' for j in range(NUM_OBJECTS)]
+        x1 = rng.integers(0, IMG_WIDTH - 40, NUM_OBJECTS)
+        y1 = rng.integers(0, IMG_HEIGHT - 40, NUM_OBJECTS)
+        boxes = [[int(x), int(y), int(x + rng.integers(10, 40)), int(y + rng.integers(10, 40))] for x, y in zip(x1, y1)]
+        results.append({'key': f'image_{i}.jpg', 'num_objects': NUM_OBJECTS, 'bounding_boxes': json.dumps(boxes),
+                        'confidences': json.dumps([0.9] * NUM_OBJECTS), 'labels': json.dumps(labels),
+                        'img_width': IMG_WIDTH, 'img_height': IMG_HEIGHT})
+    return results
+
+
+def measure(spatial_relationships, detections):
+    """
+    Compute and annotate the tuple results of the images, as the rule bases do, and measure the memory they hold. The
+    results are kept as returned by the rule bases: the list of dictionaries, or the compact record
+    :return: The results, their size in bytes, and the number of objects they add to the garbage collector
+    """
+    gc.collect()
+    num_objects = len(gc.get_objects())
+    tracemalloc.start()
+    results = []
+    for od_result in detections:
+        _, sr_result = spatial_relationships.compute_spatial_relationships(od_result, METADATA)
+        for r in sr_result:
+            r['general_interaction'] = 'Not Interacting'
+            r['person_interaction'] = 'None'
+        results.append(sr_result)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    gc.collect()
+    return results, size, len(gc.get_objects()) - num_objects
+
+
+if __name__ == '__main__':
+    od_results = create_detections()
+    # Each kind of results is measured alone, so the collector only holds its objects
+    dict_results, dict_size, dict_objects = measure(SpatialRelationships(compact_results=False), od_results)
+    num_tuples = sum(len(image) for image in dict_results)
+    dict_json = json.dumps(dict_results, default=int)
+    del dict_results
+    compact_results, compact_size, compact_objects = measure(SpatialRelationships(compact_results=True), od_results)
+    assert json.dumps([[dict(r) for r in image] for image in compact_results]) == dict_json, \
+        "The compact results differ from the dictionary results"
+    print(f'{NUM_IMAGES} images, {num_tuples} tuples')
+    print(f'Dictionaries: {dict_size / num_tuples:.0f} bytes/tuple, {dict_objects / num_tuples:.2f} gc objects/tuple')
+    print(f'Compact records: {compact_size / num_tuples:.0f} bytes/tuple, '
+          f'{compact_objects / num_tuples:.2f} gc objects/tuple')
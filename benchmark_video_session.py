@@ -0,0 +1,104 @@
+"""
+This benchmark script measures the incremental processing of a video session on the frames of a simulated fixed
+camera: parked objects whose detected boxes jitter by a pixel or two, people walking through the scene, and a person
+leaving it halfway. The detector numbers and orders the objects of each frame anew, as YOLO does, and the session tracks
+them. For each move threshold it reports the share of the tuples carried forward, the computation time against
+labeling every frame from scratch, and the agreement of the results with the ones of every frame from scratch. With a
+move threshold of 0, the results must be the same
+"""
+from benchmark_pair_memo import create_frames, METADATA, NUM_FRAMES
+from libs.annotation.general import GeneralRules
+from libs.annotation.person import PersonRules
+from libs.spatial_relationships import SpatialRelationships
+from libs.video_session import VideoSession
+import json
+import numpy as np
+import sys
+import time
+
+MOVE_THRESHOLDS = [0, 2, 4, 8]
+COMPARED_KEYS = ['proximity', 'overlap', 'f0', 'f2', 'hybrid', 'spatial_relationship', 'general_interaction',
+                 'person_interaction']
+
+
+def detector_frames(seed=0):
+    """
+    The simulated frames as a detector gives them: the objects in a random order, numbered in that order, and the last
+    person gone from the second half of the frames
+    :return: List of the object detection results of each frame
+    """
+    rng = np.random.default_rng(seed)
+    frames = []
+    for i, frame in enumerate(create_frames(NUM_FRAMES, seed)):
+        labels = json.loads(frame['labels'])
+        boxes = json.loads(frame['bounding_boxes'])
+        keep = list(range(len(labels) - 1 if i >= NUM_FRAMES // 2 else len(labels)))
+        order = rng.permutation(keep).tolist()
+        counts = {}
+        detections = []
+        for idx in order:
+            obj_class = '_'.join(labels[idx].split('_')[:-1])
+            counts[obj_class] = counts.get(obj_class, 0) + 1
+            detections.append((f'{obj_class}_{counts[obj_class]}', boxes[idx]))
+        frames.append(dict(frame, num_objects=len(detections), labels=json.dumps([label for label, _ in detections]),
+                           bounding_boxes=json.dumps([box for _, box in detections]),
+                           confidences=json.dumps([0.9] * len(detections))))
+    return frames
+
+
+def label_frame(od_result, spatial_relationships, general_rules, person_rules):
+    """
+    Compute the spatial relationships and annotations of a frame from scratch
+    :return: The annotated tuple results of the frame
+    """
+    _, sr_result = spatial_relationships.compute_spatial_relationships(od_result, METADATA)
+    general_rules.compute_interactions(sr_result)
+    _, sr_result = person_rules.compute_interactions(sr_result)
+    return sr_result
+
+
+if __name__ == '__main__':
+    od_frames = detector_frames()
+    spatial = SpatialRelationships()
+    general = GeneralRules()
+    person = PersonRules(lazy_rule_bases=False)
+    # Warm up the HOF threads and the rule bases before the timings
+    label_frame(od_frames[0], spatial, general, person)
+
+    failures = 0
+    reference_time = None
+    for threshold in MOVE_THRESHOLDS:
+        session = VideoSession(move_threshold=threshold)
+        tracked_frames, session_results = [], []
+        session_time = 0.
+        for od_result in od_frames:
+            start = time.perf_counter()
+            tracked, anchored = session.track_detections(od_result)
+            session_results.append(session.annotate(anchored, METADATA, spatial, general, person))
+            session_time += time.perf_counter() - start
+            tracked_frames.append(tracked)
+        # The tracked detections labeled from scratch, with their detected boxes
+        start = time.perf_counter()
+        reference = [label_frame(tracked, spatial, general, person) for tracked in tracked_frames]
+        if reference_time is None:
+            reference_time = time.perf_counter() - start
+            print(f'{NUM_FRAMES} frames, {sum(len(r) for r in reference)} tuples, from scratch {reference_time:.2f}s')
+
+        agreement = {key: [] for key in COMPARED_KEYS}
+        for frame_reference, frame_results in zip(reference, session_results):
+            results = {(r['arg_label'], r['ref_label']): r for r in frame_results}
+            assert len(results) == len(frame_reference), "Must give the tuples of every tracked object"
+            for r in frame_reference:
+                for key in COMPARED_KEYS:
+                    agreement[key].append(r[key] == results[(r['arg_label'], r['ref_label'])][key])
+        stats = session.stats()
+        exact = np.mean([all(values) for values in zip(*agreement.values())])
+        print(f'Move threshold {threshold}px: carried {stats["carried_rate"]:.1%}, {session_time:.2f}s '
+              f'({reference_time / session_time:.1f}x), exact tuples {exact:.1%}, same relationship '
+              f'{np.mean(agreement["spatial_relationship"]):.1%}, same general '
+              f'{np.mean(agreement["general_interaction"]):.1%}, same person '
+              f'{np.mean(agreement["person_interaction"]):.1%}, {stats["tracks"]} tracks')
+        if threshold == 0 and exact < 1.:
+            print('  The results without a move threshold must be the ones of every frame from scratch')
+            failures += 1
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,46 @@
+"""
+This benchmark script compares the cold start of the scene labeling system with its warm start from a snapshot: the
+construction time of SceneLabeling, the latency of the first image, and the steady state latency of the next images.
+Each start runs in a new process, as an autoscaled worker does
+"""
+from scene_labeling import SceneLabeling
+import cv2
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+IMAGE_DIR = './input/demo_images/'
+NUM_IMAGES = 5
+
+
+def measure_start(snapshot_dir=None, compiled_fis=False):
+    """
+    Construct the system and label the demo images in the current process
+    :param snapshot_dir: Cache directory of the warm-start snapshot. Default None, a cold start
+    :param compiled_fis: Answer the FIS queries from precomputed output surfaces
+    :return: The construction time, the latency of the first image, and the mean latency of the next images in seconds
+    """
+    image_names = sorted(os.listdir(IMAGE_DIR))[:NUM_IMAGES]
+    images = [cv2.imread(os.path.join(IMAGE_DIR, name), cv2.IMREAD_COLOR) for name in image_names]
+    start = time.perf_counter()
+    labeler = SceneLabeling(compiled_fis=compiled_fis, snapshot_dir=snapshot_dir)
+    latencies = [time.perf_counter() - start]
+    for image, name in zip(images, image_names):
+        start = time.perf_counter()
+        labeler.process_image(image, name)
+        latencies.append(time.perf_counter() - start)
+    return latencies[0], latencies[1], sum(latencies[2:]) / max(len(latencies) - 2, 1)
+
+
+if __name__ == '__main__':
+    compiled = '--compiled-fis' in sys.argv
+    context = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory() as snapshot_dir:
+        for name, directory in [('Cold start', None), ('Snapshot build', snapshot_dir),
+                                ('Snapshot restore', snapshot_dir)]:
+            with context.Pool(1, maxtasksperchild=1) as pool:
+                construction, first, steady = pool.apply(measure_start, (directory, compiled))
+            print(f'{name}: construction {construction:.2f}s, first image {first * 1e3:.0f}ms, '
+                  f'next images {steady * 1e3:.0f}ms')
@@ -0,0 +1,91 @@
+"""
+This benchmark script compares the per row decoding of the YOLO output layers with the whole array decoding of
+decode_outputs, on random output layers of the size of a 416x416 YOLOv3 forward pass
+"""
+from libs.object_detection import decode_outputs
+import numpy as np
+import cv2
+import time
+
+# Candidate rows of the three YOLOv3 output layers for a 416x416 input
+LAYER_ROWS = [507, 2028, 8112]
+NUM_CLASSES = 80
+IMG_WIDTH = 640
+IMG_HEIGHT = 480
+CONFIDENCE_THRESHOLD = 0.79
+NMS_THRESHOLD = 0.4
+NUM_RUNS = 20
+
+
+def decode_outputs_loop(outs, img_width, img_height, confidence_threshold):
+    """
+    The per row decoding previously done in YoloObjectDetection.compute_detections
+    """
+    class_ids = []
+    confidences = []
+    boxes = []
+    for out in outs:
+        for detection in out:
+            scores = detection[5:]
+            class_id = np.argmax(scores)
+            confidence = scores[class_id]
+            if confidence > confidence_threshold:
+                center_x = int(detection[0] * img_width)
+                center_y = int(detection[1] * img_height)
+                width = int(detection[2] * img_width)
+                height = int(detection[3] * img_height)
+                left = int(center_x - width / 2)
+                top = int(center_y - height / 2)
+                class_ids.append(class_id)
+                confidences.append(float(confidence))
+                x = max(0, left)
+                y = max(0, top)
+                right = max(0, (left + width))
+                bottom = max(0, (top + height))
+                boxes.append([x, y, right, bottom])
+    return [int(c) for c in class_ids], confidences, boxes
+
+
+def create_outputs(seed=0):
+    """
+    Create random output layers, with a few confident candidates per layer as in a real forward pass
+    :param seed: Seed of the random generator
+    :return: List of the output layers
+    """
+    rng = np.random.default_rng(seed)
+    outs = []
+    for rows in LAYER_ROWS:
+        out = np.zeros((rows, 5 + NUM_CLASSES), dtype=np.float32)
+        out[:, :2] = rng.uniform(-0.05, 1.05, (rows, 2))
+        out[:, 2:4] = rng.uniform(0., 0.5, (rows, 2))
+        out[:, 4:] = rng.uniform(0., 0.1, (rows, 1 + NUM_CLASSES))
+        confident = rng.choice(rows, rows // 100, replace=False)
+        out[confident, 5 + rng.integers(NUM_CLASSES, size=len(confident))] = rng.uniform(0.5, 1., len(confident))
+        outs.append(out)
+    return outs
+
+
+def time_decode(decode, outs):
+    """
+    Time a decoding function and the NMS of its candidates
+    :return: The decoded candidates, and the mean decoding and NMS times in seconds
+    """
+    start = time.perf_counter()
+    for _ in range(NUM_RUNS):
+        result = decode(outs, IMG_WIDTH, IMG_HEIGHT, CONFIDENCE_THRESHOLD)
+    decode_time = (time.perf_counter() - start) / NUM_RUNS
+    start = time.perf_counter()
+    for _ in range(NUM_RUNS):
+        cv2.dnn.NMSBoxes(result[2], result[1], CONFIDENCE_THRESHOLD, NMS_THRESHOLD)
+    nms_time = (time.perf_counter() - start) / NUM_RUNS
+    return result, decode_time, nms_time
+
+
+if __name__ == '__main__':
+    for seed in range(3):
+        outputs = create_outputs(seed)
+        loop_result, loop_time, nms_time = time_decode(decode_outputs_loop, outputs)
+        array_result, array_time, _ = time_decode(decode_outputs, outputs)
+        assert loop_result == array_result, "The decoded candidates differ"
+        print(f'{sum(LAYER_ROWS)} rows, {len(loop_result[0])} candidates: loop {loop_time * 1e3:.2f}ms, '
+              f'arrays {array_time * 1e3:.2f}ms ({loop_time / array_time:.0f}x), NMS {nms_time * 1e3:.2f}ms')
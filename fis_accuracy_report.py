@@ -0,0 +1,62 @@
+"""
+This report script compiles the general and person domain FIS into lookup surfaces, and compares their outputs with
+the live scikit-fuzzy simulations
+"""
+from libs.annotation.general import GeneralRules
+from libs.annotation.person import PersonRules
+from libs.annotation.compiled_fis import find_compiled_simulations
+import numpy as np
+import time
+
+NUM_SAMPLES = 500
+# Share of the realistic inputs without overlap, as for most object tuples of an image
+NO_OVERLAP_RATE = 0.5
+
+
+def realistic_inputs(simulation=None, num_samples=NUM_SAMPLES, seed=0):
+    """
+    Draw inputs resembling the ones of the spatial relationships: overlaps of exactly 0 for the disjoint tuples, and
+    HOF angles in whole degrees
+    :param simulation: The CompiledSimulation to draw inputs for
+    :param num_samples: Number of inputs
+    :param seed: Seed of the random generator
+    :return: Dictionary of input arrays keyed by antecedent label
+    """
+    rng = np.random.default_rng(seed)
+    inputs = {}
+    for antecedent in simulation.ctrl.antecedents:
+        universe = antecedent.universe
+        values = rng.uniform(universe.min(), universe.max(), num_samples)
+        if antecedent.label == 'overlap':
+            values[rng.random(num_samples) < NO_OVERLAP_RATE] = 0.
+        elif antecedent.label == 'spatial_relationships':
+            values = np.round(values)
+        inputs[antecedent.label] = values
+    return inputs
+
+
+def print_report(name, report):
+    print(f'  {name}: max error {report["max_abs_error"]:.2e}, mean error {report["mean_abs_error"]:.2e}, '
+          f'label agreement {report["label_agreement"]:.4f}, live fallback {report["fallback_rate"]:.4f}')
+
+
+if __name__ == '__main__':
+    start = time.perf_counter()
+    simulations = find_compiled_simulations(GeneralRules(compiled_fis=True), prefix='general.')
+    simulations.update(find_compiled_simulations(PersonRules(compiled_fis=True, lazy_rule_bases=False),
+                                                   prefix='person.'))
+    compile_time = time.perf_counter() - start
+    surface_size = sum(s.nbytes for sim in simulations.values() for s in sim.surfaces.values())
+    print(f'{len(simulations)} FIS compiled in {compile_time:.2f}s, surfaces {surface_size / 1e6:.1f} MB')
+
+    for name, simulation in simulations.items():
+        print(name)
+        print_report('Uniform inputs', simulation.accuracy_report(num_samples=NUM_SAMPLES))
+        print_report('Realistic inputs', simulation.accuracy_report(realistic_inputs(simulation)))
+
+        values = {label: values[0] for label, values in realistic_inputs(simulation, 1, seed=1).items()}
+        simulation.input.update(values)
+        start = time.perf_counter()
+        for _ in range(100):
+            simulation.compute()
+        print(f'  Scalar query: {(time.perf_counter() - start) * 1e4:.1f}us')
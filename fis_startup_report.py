@@ -0,0 +1,30 @@
+"""
+This report script measures the startup time of the person domain FIS: the construction time of PersonRules with its
+rule bases built on first use and with all of them built at once, and the construction time of each rule base. Each
+measurement runs in a new process, as the short lived batch workers do
+"""
+from libs.annotation.person import PersonRules
+import multiprocessing
+import time
+
+
+def measure_startup(compiled_fis=False, lazy_rule_bases=True):
+    """
+    Construct PersonRules in the current process
+    :return: The construction time in seconds, and the startup report of the rule bases
+    """
+    start = time.perf_counter()
+    person_rules = PersonRules(compiled_fis=compiled_fis, lazy_rule_bases=lazy_rule_bases)
+    return time.perf_counter() - start, person_rules.startup_report()
+
+
+if __name__ == '__main__':
+    context = multiprocessing.get_context('spawn')
+    for compiled_fis in [False, True]:
+        mode = 'compiled' if compiled_fis else 'live'
+        with context.Pool(1, maxtasksperchild=1) as pool:
+            lazy_time, _ = pool.apply(measure_startup, (compiled_fis, True))
+            eager_time, report = pool.apply(measure_startup, (compiled_fis, False))
+        print(f'PersonRules ({mode}): lazy {lazy_time:.3f}s, all rule bases {eager_time:.3f}s')
+        for gen_cat, build_time in sorted(report.items(), key=lambda item: -item[1]):
+            print(f'  {gen_cat:<26} {build_time:.3f}s')
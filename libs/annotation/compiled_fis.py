@@ -0,0 +1,483 @@
+"""
+Compile the scikit-fuzzy control systems of the scene annotation system into precomputed output surfaces.
+The control systems are evaluated once over a grid of their inputs with a vectorized version of the scikit-fuzzy
+Mamdani inference, and queries are answered by multilinear interpolation of the resulting surfaces.
+"""
+import bisect
+import itertools
+import numpy as np
+import skfuzzy as fuzz
+from skfuzzy import control as ctrl
+from skfuzzy.control.term import Term, TermAggregate
+
+# Number of grid intervals between two consecutive points of an antecedent universe
+DEFAULT_SUBDIVISIONS = 2
+# Inputs with finer universes, such as the HOF angle in degrees, are sampled at the universe points
+UNIVERSE_SUBDIVISIONS = {'spatial_relationships': 1}
+# Grid points whose consequent activations are all below this value only fire through the rounding errors of the
+# universes (an overlap of exactly 0 for instance), and their output cannot be interpolated
+SINGULAR_ACTIVATION = 1e-9
+# Decimals of the values the universe points stand for
+ROUNDING_DECIMALS = 9
+
+
+def _firing_strength(antecedent, rule, memberships):
+    """
+    Compute the firing strength of a rule antecedent for arrays of inputs
+    :param antecedent: A Term or TermAggregate of the rule
+    :param rule: The rule the antecedent belongs to
+    :param memberships: Membership arrays of the antecedent terms, keyed by term id
+    :return: The firing strength array
+    """
+    if isinstance(antecedent, Term):
+        return memberships[id(antecedent)]
+    assert isinstance(antecedent, TermAggregate), f"Unexpected rule antecedent {antecedent}"
+    if antecedent.kind == 'not':
+        return 1. - _firing_strength(antecedent.term1, rule, memberships)
+    term1 = _firing_strength(antecedent.term1, rule, memberships)
+    term2 = _firing_strength(antecedent.term2, rule, memberships)
+    if antecedent.kind == 'and':
+        return rule.and_func(term1, term2)
+    return rule.or_func(term1, term2)
+
+
+def _centroid(universe, term_mfs, cuts):
+    """
+    Defuzzify the clipped consequent terms with the centroid of scikit-fuzzy, upsampling the universe with the points
+    where each term crosses its cut as in skfuzzy.control.CrispValueCalculator. The operations are the ones of
+    scikit-fuzzy, in the same order, so the results are identical
+    :param universe: The consequent universe
+    :param term_mfs: The membership functions of the activated consequent terms
+    :param cuts: The (N,) activation arrays of the terms
+    :return: The (N,) centroids, NaN where the output membership is empty
+    """
+    x1, x2 = universe[:-1], universe[1:]
+    count = len(cuts[0])
+    points = [np.broadcast_to(x1, (count, len(x1))), np.broadcast_to(x2, (count, len(x2)))]
+    for mf, cut in zip(term_mfs, cuts):
+        y = cut[:, None]
+        above = np.where(y == 0., mf > 0., mf >= y)
+        crossing = above[:, :-1] != above[:, 1:]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            point = x1 + (y - mf[:-1]) * (x2 - x1) / (mf[1:] - mf[:-1])
+        # Points without crossing duplicate the end of their segment and add empty segments
+        points.append(np.where(crossing, point, x2))
+    points = np.sort(np.stack(points, axis=2), axis=2).reshape(count, -1)
+
+    output_mf = np.zeros_like(points)
+    for mf, cut in zip(term_mfs, cuts):
+        np.maximum(output_mf, np.minimum(cut[:, None], np.interp(points, universe, mf)), output_mf)
+
+    # Sum the segments in order, as scikit-fuzzy does
+    sum_moment_area = np.zeros(count)
+    sum_area = np.zeros(count)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for i in range(1, points.shape[1]):
+            xa, xb = points[:, i - 1], points[:, i]
+            ya, yb = output_mf[:, i - 1], output_mf[:, i]
+            moment = np.where(ya == yb, 0.5 * (xa + xb),
+                              np.where(ya == 0., 2.0 / 3.0 * (xb - xa) + xa,
+                                       np.where(yb == 0., 1.0 / 3.0 * (xb - xa) + xa,
+                                                (2.0 / 3.0 * (xb - xa) * (yb + 0.5 * ya)) / (ya + yb) + xa)))
+            area = np.where(ya == yb, (xb - xa) * ya,
+                            np.where(ya == 0., 0.5 * (xb - xa) * yb,
+                                     np.where(yb == 0., 0.5 * (xb - xa) * ya, 0.5 * (xb - xa) * (ya + yb))))
+            empty = ((ya == 0.) & (yb == 0.)) | (xa == xb)
+            sum_moment_area += np.where(empty, 0., moment * area)
+            sum_area += np.where(empty, 0., area)
+    result = sum_moment_area / np.fmax(sum_area, np.finfo(float).eps)
+    result[output_mf.sum(axis=1) == 0] = np.nan
+    return result
+
+
+def _evaluate(control_system, inputs, chunk_size):
+    """
+    Vectorized Mamdani inference of a scikit-fuzzy control system
+    :param control_system: The skfuzzy.control.ControlSystem to evaluate
+    :param inputs: Dictionary of equally shaped input arrays, keyed by antecedent label
+    :param chunk_size: Number of inputs evaluated at once
+    :return: Dictionaries of output arrays and of largest term activation arrays, keyed by consequent label
+    """
+    antecedents = list(control_system.antecedents)
+    consequents = list(control_system.consequents)
+    rules = list(control_system.rules)
+    for antecedent in antecedents:
+        assert antecedent.label in inputs, f"Missing input {antecedent.label}"
+    shape = np.shape(inputs[antecedents[0].label])
+    flat_inputs = {a.label: np.asarray(inputs[a.label], dtype=np.float64).ravel() for a in antecedents}
+    size = len(flat_inputs[antecedents[0].label])
+    outputs = {c.label: np.empty(size) for c in consequents}
+    activations = {c.label: np.empty(size) for c in consequents}
+
+    for start in range(0, size, chunk_size):
+        # Fuzzify the inputs, clipped to their universes as in scikit-fuzzy
+        count = min(chunk_size, size - start)
+        memberships = {}
+        for antecedent in antecedents:
+            values = flat_inputs[antecedent.label][start:start + count]
+            for term in antecedent.terms.values():
+                memberships[id(term)] = np.interp(values, antecedent.universe, term.mf)
+
+        # Accumulate the rule activations of each consequent term
+        cuts = {}
+        for rule in rules:
+            firing = _firing_strength(rule.antecedent, rule, memberships)
+            for weighted_term in rule.consequent:
+                term = weighted_term.term
+                activation = firing * weighted_term.weight
+                if id(term) in cuts:
+                    cuts[id(term)] = term.parent.accumulation_method(activation, cuts[id(term)])
+                else:
+                    cuts[id(term)] = activation
+
+        # Defuzzify each distinct set of activations once
+        for consequent in consequents:
+            terms = [t for t in consequent.terms.values() if id(t) in cuts]
+            term_cuts = [np.broadcast_to(cuts[id(t)], (count,)) for t in terms]
+            key = np.zeros(count, dtype=np.int64)
+            for cut in term_cuts:
+                values, index = np.unique(cut, return_inverse=True)
+                _, key = np.unique(key * len(values) + index.ravel(), return_inverse=True)
+            _, first, inverse = np.unique(key, return_index=True, return_inverse=True)
+            centroids = _centroid(consequent.universe, [t.mf for t in terms], [cut[first] for cut in term_cuts])
+            outputs[consequent.label][start:start + count] = centroids[inverse.ravel()]
+            activations[consequent.label][start:start + count] = np.max(term_cuts, axis=0)
+    return ({label: output.reshape(shape) for label, output in outputs.items()},
+            {label: activation.reshape(shape) for label, activation in activations.items()})
+
+
+def evaluate_control_system(control_system=None, inputs=None, chunk_size=65536):
+    """
+    Vectorized Mamdani inference of a scikit-fuzzy control system, giving the outputs of
+    ControlSystemSimulation.compute() for arrays of inputs
+    :param control_system: The skfuzzy.control.ControlSystem to evaluate
+    :param inputs: Dictionary of equally shaped input arrays, keyed by antecedent label
+    :param chunk_size: Number of inputs evaluated at once
+    :return: Dictionary of output arrays keyed by consequent label, NaN where the control system has no output
+    """
+    assert control_system is not None, "Must supply a control system"
+    assert inputs is not None, "Must supply the control system inputs"
+    outputs, _ = _evaluate(control_system, inputs, chunk_size)
+    return outputs
+
+
+def output_labels(consequent=None, outputs=None, terms=None):
+    """
+    Find the consequent term with the highest membership for crisp outputs, the first one on ties
+    :param consequent: The skfuzzy.control.Consequent the outputs belong to
+    :param outputs: Array of crisp outputs
+    :param terms: Labels of the compared terms, in order. Defaults to every consequent term
+    :return: Array of term labels, None where the output is NaN
+    """
+    assert consequent is not None, "Must supply the consequent"
+    assert outputs is not None, "Must supply the outputs"
+    outputs = np.asarray(outputs, dtype=np.float64)
+    terms = list(consequent.terms.keys()) if terms is None else list(terms)
+    memberships = np.stack([fuzz.interp_membership(consequent.universe, consequent[t].mf, outputs) for t in terms])
+    labels = np.array(terms, dtype=object)[np.argmax(memberships, axis=0)]
+    labels[np.isnan(outputs)] = None
+    return labels
+
+
+class CompiledSimulation:
+    def __init__(self, control_system=None, subdivisions=None):
+        """
+        Drop-in replacement of skfuzzy.control.ControlSystemSimulation that answers queries from output surfaces
+        sampled once over a grid of the antecedent universes. Queries next to singular grid points are answered from
+        a grid point with the same memberships pattern when there is one, and by the live simulation otherwise
+        :param control_system: The skfuzzy.control.ControlSystem to compile
+        :param subdivisions: Dictionary of grid intervals between two consecutive universe points, keyed by
+        antecedent label. Defaults to UNIVERSE_SUBDIVISIONS, and DEFAULT_SUBDIVISIONS for the other antecedents
+        """
+        assert control_system is not None, "Must supply a control system"
+        subdivisions = {**UNIVERSE_SUBDIVISIONS, **(subdivisions or {})}
+        self.ctrl = control_system
+        self.input = {}
+        self.output = {}
+        self.__live_sim = ctrl.ControlSystemSimulation(control_system, flush_after_run=100)
+
+        antecedents = sorted(control_system.antecedents, key=lambda a: a.label)
+        self.__labels = [a.label for a in antecedents]
+        self.__grids = []
+        self.__exact_points = []
+        self.__representatives = []
+        for antecedent in antecedents:
+            # The universe points, the values they stand for without the rounding errors of np.arange, and evenly
+            # spaced points between the universe points
+            steps = subdivisions.get(antecedent.label, DEFAULT_SUBDIVISIONS)
+            universe = antecedent.universe.astype(np.float64)
+            exact_points = np.union1d(universe, np.round(universe, ROUNDING_DECIMALS))
+            exact_points = exact_points[(exact_points >= universe.min()) & (exact_points <= universe.max())]
+            between = universe[:-1, None] + np.diff(universe)[:, None] * np.arange(1, steps) / steps
+            grid = np.union1d(exact_points, between.ravel())
+            # A grid point strictly inside each interval between two exact points, or -1
+            first = np.searchsorted(grid, exact_points[:-1], side='right')
+            last = np.searchsorted(grid, exact_points[1:], side='left')
+            self.__representatives.append(np.where(first < last, (first + last - 1) // 2, -1).tolist())
+            self.__exact_points.append(exact_points.tolist())
+            self.__grids.append(grid)
+        self.__grid_lists = [grid.tolist() for grid in self.__grids]
+        self.__corners = list(itertools.product((0, 1), repeat=len(self.__grids)))
+
+        grid_points = np.meshgrid(*self.__grids, indexing='ij')
+        self.__surfaces, activations = _evaluate(control_system, dict(zip(self.__labels, grid_points)), 65536)
+        # NaN outputs have no activation and are singular too
+        self.__singular = {label: activations[label] < SINGULAR_ACTIVATION for label in self.__surfaces}
+
+    @property
+    def surfaces(self):
+        """
+        The sampled output surfaces, keyed by consequent label, with one axis per antecedent in label order
+        """
+        return self.__surfaces
+
+    def __interpolate(self, values):
+        """
+        Multilinear interpolation of the output surfaces for arrays of inputs
+        :param values: Input arrays in antecedent label order
+        :return: Dictionary of interpolated output arrays, and the mask of the inputs next to a singular grid point
+        """
+        indices, weights = [], []
+        for grid, value in zip(self.__grids, values):
+            value = np.clip(value, grid[0], grid[-1])
+            index = np.clip(np.searchsorted(grid, value, side='right') - 1, 0, len(grid) - 2)
+            indices.append(index)
+            weights.append((value - grid[index]) / (grid[index + 1] - grid[index]))
+        outputs = {}
+        singular = np.zeros(np.shape(values[0]), dtype=bool)
+        for label, surface in self.__surfaces.items():
+            output = 0.
+            for corner in self.__corners:
+                weight = 1.
+                for c, w in zip(corner, weights):
+                    weight = weight * (w if c else 1. - w)
+                point = tuple(i + c for i, c in zip(indices, corner))
+                # Corners with a zero weight are skipped, so inputs on the grid are answered from their point alone
+                used = weight > 0.
+                output = output + np.where(used, weight * np.nan_to_num(surface[point]), 0.)
+                singular |= used & self.__singular[label][point]
+            outputs[label] = output
+        return outputs, singular
+
+    def __lookup(self, values):
+        """
+        Answer one query. Singular outputs only come from inputs on the exact points of some antecedents, where the
+        memberships are rounding errors of the universes, and do not change while the other inputs stay between
+        the same two exact points, as long as every membership keeps being 0, 1, or in between
+        :param values: Input values in antecedent label order
+        :return: Dictionary of outputs without the consequents that have no output, and whether the live simulation
+        computed them
+        """
+        cells = []
+        for grid, value in zip(self.__grid_lists, values):
+            value = min(max(float(value), grid[0]), grid[-1])
+            index = min(bisect.bisect_right(grid, value) - 1, len(grid) - 2)
+            cells.append((index, (value - grid[index]) / (grid[index + 1] - grid[index]), value))
+
+        outputs = {}
+        for label, surface in self.__surfaces.items():
+            singular = self.__singular[label]
+            output = 0.
+            for corner in self.__corners:
+                weight = 1.
+                for c, (_, w, _) in zip(corner, cells):
+                    weight *= w if c else 1. - w
+                if weight == 0.:
+                    continue
+                point = tuple(i + c for c, (i, _, _) in zip(corner, cells))
+                if singular[point]:
+                    break
+                output += weight * surface[point]
+            else:
+                outputs[label] = float(output)
+                continue
+
+            point = []
+            for (index, weight, value), exact_points, representatives in zip(cells, self.__exact_points,
+                                                                              self.__representatives):
+                if weight == 0. or weight == 1.:
+                    point.append(index + int(weight))
+                else:
+                    point.append(representatives[min(bisect.bisect_right(exact_points, value) - 1,
+                                                     len(representatives) - 1)])
+            point = tuple(point)
+            if min(point) < 0 or not singular[point]:
+                return self.__compute_live(values), True
+            if not np.isnan(surface[point]):
+                outputs[label] = float(surface[point])
+        return outputs, False
+
+    def __compute_live(self, values):
+        """
+        Compute one query with the live simulation
+        :param values: Input values in antecedent label order
+        :return: Dictionary of outputs, without the consequents that have no output
+        """
+        for label, value in zip(self.__labels, values):
+            self.__live_sim.input[label] = float(value)
+        # The cached results of scikit-fuzzy are copied into the previous outputs, which would keep the consequents
+        # without output of repeated inputs
+        self.__live_sim.output = {}
+        self.__live_sim.compute()
+        return dict(self.__live_sim.output)
+
+    def __compute_arrays(self, values):
+        """
+        Answer queries for arrays of inputs
+        :param values: Input arrays in antecedent label order
+        :return: Dictionary of output arrays, NaN where there is no output, and the mask of the inputs computed by the
+        live simulation
+        """
+        outputs, singular = self.__interpolate(values)
+        live = np.zeros(np.shape(values[0]), dtype=bool)
+        for index in zip(*np.nonzero(singular)):
+            point_outputs, live[index] = self.__lookup([v[index] for v in values])
+            for label, output in outputs.items():
+                output[index] = point_outputs.get(label, np.nan)
+        return outputs, live
+
+    def compute(self):
+        """
+        Compute the outputs for the current inputs, scalars or equally shaped arrays
+        """
+        for label in self.__labels:
+            if label not in self.input:
+                raise ValueError("All antecedents must have input values!")
+        values = [self.input[label] for label in self.__labels]
+        if np.ndim(values[0]) == 0:
+            self.output, _ = self.__lookup(values)
+        else:
+            self.output, _ = self.__compute_arrays([np.asarray(v, dtype=np.float64) for v in values])
+
+    def compute_batch(self, inputs=None):
+        """
+        Compute the outputs for arrays of inputs, leaving the current inputs and outputs unchanged
+        :param inputs: Dictionary of equally shaped input arrays keyed by antecedent label
+        :return: Dictionary of output arrays keyed by consequent label, NaN where there is no output
+        """
+        assert inputs is not None, "Must supply the inputs"
+        for label in self.__labels:
+            assert label in inputs, f"Missing input {label}"
+        outputs, _ = self.__compute_arrays([np.asarray(inputs[label], dtype=np.float64) for label in self.__labels])
+        return outputs
+
+    def accuracy_report(self, inputs=None, num_samples=1000, seed=0):
+        """
+        Compare the compiled outputs with the live simulation
+        :param inputs: Dictionary of equally shaped input arrays keyed by antecedent label. Defaults to random inputs
+        drawn uniformly over the universes
+        :param num_samples: Number of random inputs when inputs is not supplied
+        :param seed: Seed of the random generator
+        :return: Dictionary with the maximum and mean absolute output errors, the rate of identical output labels
+        (counting missing outputs as a label), and the rate of inputs computed by the live simulation
+        """
+        if inputs is None:
+            rng = np.random.default_rng(seed)
+            values = [rng.uniform(grid[0], grid[-1], num_samples) for grid in self.__grids]
+        else:
+            values = [np.asarray(inputs[label], dtype=np.float64).ravel() for label in self.__labels]
+        compiled, fallback = self.__compute_arrays(values)
+        live_outputs = [self.__compute_live([v[i] for v in values]) for i in range(len(values[0]))]
+        errors, agreements = [], []
+        consequents = {c.label: c for c in self.ctrl.consequents}
+        for label, output in compiled.items():
+            live = np.array([o.get(label, np.nan) for o in live_outputs])
+            both = ~np.isnan(live) & ~np.isnan(output)
+            errors.append(np.abs(output - live)[both])
+            agreements.append(output_labels(consequents[label], output) == output_labels(consequents[label], live))
+        errors = np.concatenate(errors)
+        return {
+            'max_abs_error': float(errors.max(initial=0.)),
+            'mean_abs_error': float(errors.mean()) if len(errors) else 0.,
+            'label_agreement': float(np.mean(np.concatenate(agreements))),
+            'fallback_rate': float(fallback.mean())
+        }
+
+
+def create_simulation(control_system=None, compiled=False, flush_after_run=100):
+    """
+    Create the simulation of a control system
+    :param control_system: The skfuzzy.control.ControlSystem to simulate
+    :param compiled: Answer the queries from precomputed output surfaces instead of running the live simulation
+    :param flush_after_run: Passed to the ControlSystemSimulation
+    :return: A ControlSystemSimulation, or a CompiledSimulation when compiled
+    """
+    assert control_system is not None, "Must supply a control system"
+    if compiled:
+        return CompiledSimulation(control_system)
+    return ctrl.ControlSystemSimulation(control_system, flush_after_run=flush_after_run)
+
+
+def find_compiled_simulations(rules=None, prefix=''):
+    """
+    Find the compiled simulations of a rule base and of the rule bases it holds. Only the rule bases already built are
+    searched
+    :param rules: A rule base object, such as GeneralRules or PersonRules
+    :param prefix: Prefix of the returned names
+    :return: Dictionary of CompiledSimulation keyed by attribute path
+    """
+    assert rules is not None, "Must supply a rule base"
+    simulations = {}
+    for name, value in vars(rules).items():
+        name = prefix + name.split('__')[-1]
+        # Rule bases held in a dictionary are named by their key
+        for key, item in (value.items() if isinstance(value, dict) else [(None, value)]):
+            item_name = name if key is None else f'{name}.{key}'
+            if isinstance(item, CompiledSimulation):
+                simulations[item_name] = item
+            elif type(item).__module__.startswith('libs.annotation'):
+                simulations.update(find_compiled_simulations(item, prefix=item_name + '.'))
+    return simulations
+
+
+def compute_outputs(simulation=None, inputs=None):
+    """
+    Compute the outputs of a simulation for arrays of inputs, as its compute() gives them for each input
+    :param simulation: A ControlSystemSimulation, or a CompiledSimulation
+    :param inputs: Dictionary of equally shaped input arrays keyed by antecedent label. Inputs the control system does
+    not use are ignored
+    :return: Dictionary of output arrays keyed by consequent label, NaN where there is no output
+    """
+    assert simulation is not None, "Must supply a simulation"
+    assert inputs is not None, "Must supply the inputs"
+    if isinstance(simulation, CompiledSimulation):
+        return simulation.compute_batch(inputs)
+    return evaluate_control_system(simulation.ctrl, inputs)
+
+
+def create_interaction_inputs(gious=None, ious=None, sr_angles=None):
+    """
+    Create the input arrays of the person domain interaction simulations
+    :param gious: GIOU proximity of each object tuple
+    :param ious: IOU overlap of each object tuple
+    :param sr_angles: Consensus HOF angle of each object tuple
+    :return: Dictionary of input arrays keyed by antecedent label
+    """
+    assert gious is not None, "Must supply the GIOU values"
+    assert ious is not None, "Must supply the IOU values"
+    assert sr_angles is not None, "Must supply the HOF angles"
+    return {'proximity': np.asarray(gious, dtype=np.float64), 'overlap': np.asarray(ious, dtype=np.float64),
+            'spatial_relationships': np.asarray(sr_angles, dtype=np.float64)}
+
+
+def compute_interaction_labels(simulation=None, consequent=None, inputs=None, mask=None, interaction=None,
+                               no_interaction=None):
+    """
+    Label the object tuples selected by a mask as the compute_*_interaction methods of the rule bases do, comparing the
+    memberships of the interaction and no interaction terms in the simulation output
+    :param simulation: The simulation of the interaction
+    :param consequent: The interaction consequent of the simulation
+    :param inputs: Dictionary of input arrays of every tuple, keyed by antecedent label
+    :param mask: Boolean array of the tuples to label
+    :param interaction: Label of the interaction term
+    :param no_interaction: Label of the no interaction term
+    :return: Array of labels of the selected tuples, the interaction or None. Tuples without simulation output, for
+    which compute() gives no output, are labeled None too
+    """
+    assert mask is not None, "Must supply the tuple mask"
+    if not np.any(mask):
+        return np.full(np.count_nonzero(mask), None, dtype=object)
+    outputs = compute_outputs(simulation, {label: values[mask] for label, values in inputs.items()})
+    labels = output_labels(consequent, outputs[consequent.label], [interaction, no_interaction])
+    labels[labels == no_interaction] = None
+    return labels
@@ -1,16 +1,19 @@
 """
 FIS for the person-animal interactions
 """
-from libs.annotation.fuzzy_utils import create_universes_membership_functions
+from libs.annotation.compiled_fis import compute_interaction_labels, create_interaction_inputs, create_simulation
+from libs.annotation.fuzzy_utils import shared_universes_membership_functions
 import skfuzzy as fuzz
 from skfuzzy import control as ctrl
 import numpy as np
 
 
 class AnimalRules:
-    def __init__(self, show_sim_result=None):
-        prox, over, spat = create_universes_membership_functions()
+    def __init__(self, show_sim_result=None, compiled_fis=False):
+        prox, over, spat = shared_universes_membership_functions()
         self.__show_sim_result = show_sim_result
+        # Viewing a simulation result needs the live simulation
+        self.__compiled_fis = compiled_fis and not show_sim_result
         self.__proximity = prox
         self.__overlap = over
         self.__spatial_relationships = spat
@@ -77,7 +80,7 @@ class AnimalRules:
                                               self.__pet_interaction['Not Petting'])
         self.__petting_ctrl = ctrl.ControlSystem([self.__petting_rule, self.__not_petting_rule_1,
                                                   self.__not_petting_rule_2])
-        self.__petting_sim = ctrl.ControlSystemSimulation(self.__petting_ctrl, flush_after_run=100)
+        self.__petting_sim = create_simulation(self.__petting_ctrl, compiled=self.__compiled_fis)
 
     def __create_ridden_animal_rules(self):
         # IF very close OR close AND above left OR above OR above right THEN riding
@@ -101,7 +104,7 @@ class AnimalRules:
                                             self.__ridden_animal_interaction['Not Riding'])
         self.__ridden_animal_ctrl = ctrl.ControlSystem([self.__riding_rule1, self.__not_riding_rule1,
                                                         self.__not_riding_rule2])
-        self.__ridden_animal_sim = ctrl.ControlSystemSimulation(self.__ridden_animal_ctrl, flush_after_run=100)
+        self.__ridden_animal_sim = create_simulation(self.__ridden_animal_ctrl, compiled=self.__compiled_fis)
 
     def __create_large_animal_rules(self):
         # IF overlap AND very close OR close AND SR is any THEN interacting
@@ -116,7 +119,7 @@ class AnimalRules:
 
         self.__large_animal_ctrl = ctrl.ControlSystem([self.__large_animal_interacting_rule,
                                                        self.__large_animal_not_interacting_rule])
-        self.__large_animal_sim = ctrl.ControlSystemSimulation(self.__large_animal_ctrl, flush_after_run=100)
+        self.__large_animal_sim = create_simulation(self.__large_animal_ctrl, compiled=self.__compiled_fis)
 
     def compute_pet_interaction(self, giou, iou, sr_angle):
         self.__petting_sim.input['proximity'] = giou
@@ -191,4 +194,28 @@ class AnimalRules:
             res_label = self.compute_pet_interaction(giou, iou, sr_angle)
             return res_label
 
-
+    def compute_interaction_batch(self, labels, dom_cats, sub_cats, gious, ious, sr_angles):
+        """
+        Vectorized compute_interaction, computing each animal simulation once for all of its object tuples
+        :param labels: Base labels of the reference objects
+        :param dom_cats: Domain categories of the reference objects
+        :param sub_cats: Subdomain categories of the reference objects
+        :param gious: GIOU proximity array
+        :param ious: IOU overlap array
+        :param sr_angles: Consensus HOF angle array
+        :return: Array of interaction labels, None where there is no interaction
+        """
+        labels = np.asarray(labels, dtype=object)
+        sub_cats = np.asarray(sub_cats, dtype=object)
+        inputs = create_interaction_inputs(gious, ious, sr_angles)
+        res_labels = np.full(len(labels), None, dtype=object)
+        ridden = (labels == 'horse') | (labels == 'elephant')
+        large = ~ridden & ((sub_cats == 'large') | (sub_cats == 'farm'))
+        pet = ~ridden & ~large & (sub_cats == 'pet')
+        res_labels[ridden] = compute_interaction_labels(self.__ridden_animal_sim, self.__ridden_animal_interaction,
+                                                        inputs, ridden, 'Riding', 'Not Riding')
+        res_labels[large] = compute_interaction_labels(self.__large_animal_sim, self.__large_animal_interaction, inputs,
+                                                       large, 'Interacting', 'Not Interacting')
+        res_labels[pet] = compute_interaction_labels(self.__petting_sim, self.__pet_interaction, inputs, pet, 'Petting',
+                                                     'Not Petting')
+        return res_labels
@@ -4,13 +4,16 @@ FIS for the person-appliance interactions
 from skfuzzy import control as ctrl
 import skfuzzy as fuzz
 import numpy as np
-from libs.annotation.fuzzy_utils import create_universes_membership_functions
+from libs.annotation.compiled_fis import compute_interaction_labels, create_interaction_inputs, create_simulation
+from libs.annotation.fuzzy_utils import shared_universes_membership_functions
 
 
 class AppliancesRules:
-    def __init__(self, show_sim_result=None):
-        prox, over, spat = create_universes_membership_functions()
+    def __init__(self, show_sim_result=None, compiled_fis=False):
+        prox, over, spat = shared_universes_membership_functions()
         self.__show_sim_result = show_sim_result
+        # Viewing a simulation result needs the live simulation
+        self.__compiled_fis = compiled_fis and not show_sim_result
         self.__proximity = prox
         self.__overlap = over
         self.__spatial_relationships = spat
@@ -45,7 +48,7 @@ class AppliancesRules:
                                            self.__appliance_interaction['Not Using'])
         self.__appliance_ctrl = ctrl.ControlSystem([self.__using_rule1, self.__using_rule2, self.__not_using_rule1,
                                                     self.__not_using_rule2])
-        self.__appliance_sim = ctrl.ControlSystemSimulation(self.__appliance_ctrl, flush_after_run=100)
+        self.__appliance_sim = create_simulation(self.__appliance_ctrl, compiled=self.__compiled_fis)
 
     def compute_interaction(self, giou, iou, sr_angle):
         self.__appliance_sim.input['proximity'] = giou
@@ -64,3 +67,15 @@ class AppliancesRules:
             return None
         else:
             return ret_label
+
+    def compute_interaction_batch(self, gious, ious, sr_angles):
+        """
+        Vectorized compute_interaction, computing the appliance simulation once for all of the object tuples
+        :param gious: GIOU proximity array
+        :param ious: IOU overlap array
+        :param sr_angles: Consensus HOF angle array
+        :return: Array of interaction labels, None where there is no interaction
+        """
+        inputs = create_interaction_inputs(gious, ious, sr_angles)
+        return compute_interaction_labels(self.__appliance_sim, self.__appliance_interaction, inputs,
+                                          np.ones(len(inputs['proximity']), dtype=bool), 'Using', 'Not Using')
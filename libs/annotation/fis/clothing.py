@@ -4,13 +4,16 @@ FIS for the person-clothing interactions
 from skfuzzy import control as ctrl
 import skfuzzy as fuzz
 import numpy as np
-from libs.annotation.fuzzy_utils import create_universes_membership_functions
+from libs.annotation.compiled_fis import compute_interaction_labels, create_interaction_inputs, create_simulation
+from libs.annotation.fuzzy_utils import shared_universes_membership_functions
 
 
 class ClothingRules:
-    def __init__(self, show_sim_result=None):
-        prox, over, spat = create_universes_membership_functions()
+    def __init__(self, show_sim_result=None, compiled_fis=False):
+        prox, over, spat = shared_universes_membership_functions()
         self.__show_sim_result = show_sim_result
+        # Viewing a simulation result needs the live simulation
+        self.__compiled_fis = compiled_fis and not show_sim_result
         self.__proximity = prox
         self.__overlap = over
         self.__spatial_relationships = spat
@@ -42,7 +45,7 @@ class ClothingRules:
                                               self.__proximity['Very Far']), self.__worn_interaction['Not Wearing'])
         self.__wearing_ctrl = ctrl.ControlSystem([self.__wearing_rule, self.__not_wearing_rule1,
                                                   self.__not_wearing_rule2])
-        self.__wearing_sim = ctrl.ControlSystemSimulation(self.__wearing_ctrl, flush_after_run=100)
+        self.__wearing_sim = create_simulation(self.__wearing_ctrl, compiled=self.__compiled_fis)
 
         # clothing items. Go back through and check again after running these rules. Ties and umbrellas for example
         self.__carrying_rule = ctrl.Rule(self.__overlap['Overlap'] &
@@ -55,7 +58,7 @@ class ClothingRules:
                                                self.__proximity['Far']), self.__carried_interaction['Not Carrying'])
         self.__carrying_ctrl = ctrl.ControlSystem([self.__carrying_rule, self.__not_carrying_rule1,
                                                    self.__not_carrying_rule2])
-        self.__carrying_sim = ctrl.ControlSystemSimulation(self.__carrying_ctrl, flush_after_run=100)
+        self.__carrying_sim = create_simulation(self.__carrying_ctrl, compiled=self.__compiled_fis)
 
     def __create_carried_clothing_rules(self):
         # clothing items. Go back through and check again after running these rules. Ties and umbrellas for example
@@ -69,7 +72,7 @@ class ClothingRules:
                                                self.__proximity['Far']), self.__carried_interaction['Not Carrying'])
         self.__carrying_ctrl = ctrl.ControlSystem([self.__carrying_rule, self.__not_carrying_rule1,
                                                    self.__not_carrying_rule2])
-        self.__carrying_sim = ctrl.ControlSystemSimulation(self.__carrying_ctrl, flush_after_run=100)
+        self.__carrying_sim = create_simulation(self.__carrying_ctrl, compiled=self.__compiled_fis)
 
     def compute_worn_interaction(self, giou, iou, sr_angle):
         self.__wearing_sim.input['overlap'] = iou
@@ -115,3 +118,25 @@ class ClothingRules:
         elif sub_cat == 'carried':
             res_label = self.compute_carried_interaction(giou, iou, sr_angle)
             return res_label
+
+    def compute_interaction_batch(self, labels, dom_cats, sub_cats, gious, ious, sr_angles):
+        """
+        Vectorized compute_interaction, computing the worn and carried simulations once for all of their object tuples
+        :param labels: Base labels of the reference objects
+        :param dom_cats: Domain categories of the reference objects
+        :param sub_cats: Subdomain categories of the reference objects
+        :param gious: GIOU proximity array
+        :param ious: IOU overlap array
+        :param sr_angles: Consensus HOF angle array
+        :return: Array of interaction labels, None where there is no interaction
+        """
+        sub_cats = np.asarray(sub_cats, dtype=object)
+        inputs = create_interaction_inputs(gious, ious, sr_angles)
+        res_labels = np.full(len(sub_cats), None, dtype=object)
+        worn = sub_cats == 'worn'
+        carried = sub_cats == 'carried'
+        res_labels[worn] = compute_interaction_labels(self.__wearing_sim, self.__worn_interaction, inputs, worn,
+                                                      'Wearing', 'Not Wearing')
+        res_labels[carried] = compute_interaction_labels(self.__carrying_sim, self.__carried_interaction, inputs,
+                                                         carried, 'Carrying', 'Not Carrying')
+        return res_labels
@@ -4,13 +4,16 @@ FIS for the person-electronic interactions
 from skfuzzy import control as ctrl
 import skfuzzy as fuzz
 import numpy as np
-from libs.annotation.fuzzy_utils import create_universes_membership_functions
+from libs.annotation.compiled_fis import compute_interaction_labels, create_interaction_inputs, create_simulation
+from libs.annotation.fuzzy_utils import shared_universes_membership_functions
 
 
 class ElectronicsRules:
-    def __init__(self, show_sim_result=None):
-        prox, over, spat = create_universes_membership_functions()
+    def __init__(self, show_sim_result=None, compiled_fis=False):
+        prox, over, spat = shared_universes_membership_functions()
         self.__show_sim_result = show_sim_result
+        # Viewing a simulation result needs the live simulation
+        self.__compiled_fis = compiled_fis and not show_sim_result
         self.__proximity = prox
         self.__overlap = over
         self.__spatial_relationships = spat
@@ -62,7 +65,7 @@ class ElectronicsRules:
                                                self.__proximity['Very Far']), self.__tv_interaction['Not Watching'])
         self.__watching_ctrl = ctrl.ControlSystem([self.__watching_rule1, self.__watching_rule2,
                                                   self.__not_watching_rule1, self.__not_watching_rule2])
-        self.__watching_sim = ctrl.ControlSystemSimulation(self.__watching_ctrl, flush_after_run=100)
+        self.__watching_sim = create_simulation(self.__watching_ctrl, compiled=self.__compiled_fis)
 
     def __create_cell_phone_rules(self):
         # IF overlap AND very close OR close THEN talking
@@ -81,7 +84,7 @@ class ElectronicsRules:
                                              self.__cell_phone_interaction['Not Talking On'])
         self.__talking_ctrl = ctrl.ControlSystem([self.__talking_rule1, self.__not_talking_rule1,
                                                   self.__not_talking_rule2])
-        self.__talking_sim = ctrl.ControlSystemSimulation(self.__talking_ctrl, flush_after_run=100)
+        self.__talking_sim = create_simulation(self.__talking_ctrl, compiled=self.__compiled_fis)
 
     def __create_device_rules(self):
         # IF overlap OR no overlap AND very close OR close AND left OR above left OR above OR above right OR right
@@ -111,7 +114,7 @@ class ElectronicsRules:
                                            self.__device_interaction['Not Using'])
         self.__using_ctrl = ctrl.ControlSystem([self.__using_rule1, self.__using_rule2,
                                                 self.__not_using_rule1, self.__not_using_rule2])
-        self.__using_sim = ctrl.ControlSystemSimulation(self.__using_ctrl, flush_after_run=100)
+        self.__using_sim = create_simulation(self.__using_ctrl, compiled=self.__compiled_fis)
 
     def compute_tv_interaction(self, giou, iou, sr_angle):
         self.__watching_sim.input['proximity'] = giou
@@ -178,3 +181,28 @@ class ElectronicsRules:
         else:
             res_label = self.compute_device_interaction(giou, iou, sr_angle)
             return res_label
+
+    def compute_interaction_batch(self, labels, dom_cats, sub_cats, gious, ious, sr_angles):
+        """
+        Vectorized compute_interaction, computing each electronics simulation once for all of its object tuples
+        :param labels: Base labels of the reference objects
+        :param dom_cats: Domain categories of the reference objects
+        :param sub_cats: Subdomain categories of the reference objects
+        :param gious: GIOU proximity array
+        :param ious: IOU overlap array
+        :param sr_angles: Consensus HOF angle array
+        :return: Array of interaction labels, None where there is no interaction
+        """
+        labels = np.asarray(labels, dtype=object)
+        inputs = create_interaction_inputs(gious, ious, sr_angles)
+        res_labels = np.full(len(labels), None, dtype=object)
+        tv = (labels == 'tv') | (labels == 'tvmonitor')
+        cell_phone = labels == 'cell_phone'
+        device = ~tv & ~cell_phone
+        res_labels[tv] = compute_interaction_labels(self.__watching_sim, self.__tv_interaction, inputs, tv, 'Watching',
+                                                    'Not Watching')
+        res_labels[cell_phone] = compute_interaction_labels(self.__talking_sim, self.__cell_phone_interaction, inputs,
+                                                            cell_phone, 'Talking On', 'Not Talking On')
+        res_labels[device] = compute_interaction_labels(self.__using_sim, self.__device_interaction, inputs, device,
+                                                        'Using', 'Not Using')
+        return res_labels
@@ -4,13 +4,16 @@ FIS for the person-food interactions
 from skfuzzy import control as ctrl
 import skfuzzy as fuzz
 import numpy as np
-from libs.annotation.fuzzy_utils import create_universes_membership_functions
+from libs.annotation.compiled_fis import compute_interaction_labels, create_interaction_inputs, create_simulation
+from libs.annotation.fuzzy_utils import shared_universes_membership_functions
 
 
 class FoodRules:
-    def __init__(self, show_sim_result=None):
-        prox, over, spat = create_universes_membership_functions()
+    def __init__(self, show_sim_result=None, compiled_fis=False):
+        prox, over, spat = shared_universes_membership_functions()
         self.__show_sim_result = show_sim_result
+        # Viewing a simulation result needs the live simulation
+        self.__compiled_fis = compiled_fis and not show_sim_result
         self.__proximity = prox
         self.__overlap = over
         self.__spatial_relationships = spat
@@ -55,7 +58,7 @@ class FoodRules:
         # IF no overlap THEN not using
         self.__not_using_rule2 = ctrl.Rule(self.__overlap['No Overlap'], self.__using_interaction['Not Using'])
         self.__using_ctrl = ctrl.ControlSystem([self.__using_rule, self.__not_using_rule1, self.__not_using_rule2])
-        self.__using_sim = ctrl.ControlSystemSimulation(self.__using_ctrl, flush_after_run=100)
+        self.__using_sim = create_simulation(self.__using_ctrl, compiled=self.__compiled_fis)
 
     def __create_drinking_rules(self):
         """
@@ -72,7 +75,7 @@ class FoodRules:
                                               self.__drinking_interaction['Not Drinking'])
         self.__drinking_ctrl = ctrl.ControlSystem([self.__drinking_rule, self.__not_drinking_rule1,
                                                    self.__not_drinking_rule2])
-        self.__drinking_sim = ctrl.ControlSystemSimulation(self.__drinking_ctrl, flush_after_run=100)
+        self.__drinking_sim = create_simulation(self.__drinking_ctrl, compiled=self.__compiled_fis)
 
     def __create_eating_rules(self):
         """
@@ -92,7 +95,7 @@ class FoodRules:
         # IF no overlap THEN not eating
         self.__not_eating_rule2 = ctrl.Rule(self.__overlap['No Overlap'], self.__eating_interaction['Not Eating'])
         self.__eating_ctrl = ctrl.ControlSystem([self.__eating_rule, self.__not_eating_rule1, self.__not_eating_rule2])
-        self.__eating_sim = ctrl.ControlSystemSimulation(self.__eating_ctrl, flush_after_run=100)
+        self.__eating_sim = create_simulation(self.__eating_ctrl, compiled=self.__compiled_fis)
 
     def compute_using_interaction(self, giou, iou, sr_angle):
         self.__using_sim.input['proximity'] = giou
@@ -161,3 +164,28 @@ class FoodRules:
         if sub_cat is not None and sub_cat == 'used':
             res_label = self.compute_using_interaction(giou, iou, sr_angle)
             return res_label
+
+    def compute_interaction_batch(self, labels, dom_cats, sub_cats, gious, ious, sr_angles):
+        """
+        Vectorized compute_interaction, computing each food and tableware simulation once for all of its object tuples
+        :param labels: Base labels of the reference objects
+        :param dom_cats: Domain categories of the reference objects
+        :param sub_cats: Subdomain categories of the reference objects
+        :param gious: GIOU proximity array
+        :param ious: IOU overlap array
+        :param sr_angles: Consensus HOF angle array
+        :return: Array of interaction labels, None where there is no interaction
+        """
+        sub_cats = np.asarray(sub_cats, dtype=object)
+        inputs = create_interaction_inputs(gious, ious, sr_angles)
+        res_labels = np.full(len(sub_cats), None, dtype=object)
+        drink = sub_cats == 'drink'
+        eaten = sub_cats == 'eaten'
+        used = sub_cats == 'used'
+        res_labels[drink] = compute_interaction_labels(self.__drinking_sim, self.__drinking_interaction, inputs, drink,
+                                                       'Drinking', 'Not Drinking')
+        res_labels[eaten] = compute_interaction_labels(self.__eating_sim, self.__eating_interaction, inputs, eaten,
+                                                       'Eating', 'Not Eating')
+        res_labels[used] = compute_interaction_labels(self.__using_sim, self.__using_interaction, inputs, used, 'Using',
+                                                      'Not Using')
+        return res_labels
@@ -4,13 +4,16 @@ FIS for the person-furniture interactions
 from skfuzzy import control as ctrl
 import skfuzzy as fuzz
 import numpy as np
-from libs.annotation.fuzzy_utils import create_universes_membership_functions
+from libs.annotation.compiled_fis import compute_interaction_labels, create_interaction_inputs, create_simulation
+from libs.annotation.fuzzy_utils import shared_universes_membership_functions
 
 
 class FurnitureRules:
-    def __init__(self, show_sim_result=None):
-        prox, over, spat = create_universes_membership_functions()
+    def __init__(self, show_sim_result=None, compiled_fis=False):
+        prox, over, spat = shared_universes_membership_functions()
         self.__show_sim_result = show_sim_result
+        # Viewing a simulation result needs the live simulation
+        self.__compiled_fis = compiled_fis and not show_sim_result
         self.__proximity = prox
         self.__overlap = over
         self.__spatial_relationships = spat
@@ -68,7 +71,7 @@ class FurnitureRules:
         self.__couch_bed_ctrl = ctrl.ControlSystem([self.__couch_bed_interacting_rule1,
                                                     self.__couch_bed_not_interacting_rule1,
                                                     self.__couch_bed_not_interacting_rule2])
-        self.__couch_bed_sim = ctrl.ControlSystemSimulation(self.__couch_bed_ctrl, flush_after_run=100)
+        self.__couch_bed_sim = create_simulation(self.__couch_bed_ctrl, compiled=self.__compiled_fis)
 
     def __create_chair_rules(self):
         """
@@ -102,7 +105,7 @@ class FurnitureRules:
 
         self.__chair_ctrl = ctrl.ControlSystem([self.__chair_sitting_rule1, self.__chair_not_sitting_rule1,
                                                 self.__chair_not_sitting_rule2, self.__chair_not_sitting_rule3])
-        self.__chair_sim = ctrl.ControlSystemSimulation(self.__chair_ctrl, flush_after_run=100)
+        self.__chair_sim = create_simulation(self.__chair_ctrl, compiled=self.__compiled_fis)
 
     def __create_furniture_rules(self):
         """
@@ -125,7 +128,7 @@ class FurnitureRules:
         self.__furniture_ctrl = ctrl.ControlSystem([self.__furniture_sitting_rule1,
                                                     self.__furniture_not_sitting_rule1,
                                                     self.__furniture_not_sitting_rule2])
-        self.__furniture_sim = ctrl.ControlSystemSimulation(self.__furniture_ctrl, flush_after_run=100)
+        self.__furniture_sim = create_simulation(self.__furniture_ctrl, compiled=self.__compiled_fis)
 
     def __create_decoration_rules(self):
         """
@@ -144,7 +147,7 @@ class FurnitureRules:
                                                  self.__decoration_interaction['Not Interacting'])
         self.__decoration_ctrl = ctrl.ControlSystem([self.__interacting_rule1, self.__not_interacting_rule1,
                                                      self.__not_interacting_rule2])
-        self.__decoration_sim = ctrl.ControlSystemSimulation(self.__decoration_ctrl, flush_after_run=100)
+        self.__decoration_sim = create_simulation(self.__decoration_ctrl, compiled=self.__compiled_fis)
 
     def compute_furniture_interaction(self, giou, iou, sr_angle):
         self.__furniture_sim.input['overlap'] = iou
@@ -241,3 +244,36 @@ class FurnitureRules:
         if dom_cat == 'furniture':
             res_label = self.compute_furniture_interaction(giou, iou, sr_angle)
             return res_label
+
+    def compute_interaction_batch(self, labels, dom_cats, sub_cats, gious, ious, sr_angles):
+        """
+        Vectorized compute_interaction, computing each furniture simulation once for all of its object tuples
+        :param labels: Base labels of the reference objects
+        :param dom_cats: Domain categories of the reference objects
+        :param sub_cats: Subdomain categories of the reference objects
+        :param gious: GIOU proximity array
+        :param ious: IOU overlap array
+        :param sr_angles: Consensus HOF angle array
+        :return: Array of interaction labels, None where there is no interaction
+        """
+        labels = np.asarray(labels, dtype=object)
+        dom_cats = np.asarray(dom_cats, dtype=object)
+        inputs = create_interaction_inputs(gious, ious, sr_angles)
+        res_labels = np.full(len(labels), None, dtype=object)
+        decoration = dom_cats == 'decoration'
+        couch_bed = ~decoration & ((labels == 'couch') | (labels == 'bed'))
+        chair = ~decoration & (labels == 'chair')
+        furniture = ~decoration & ~couch_bed & ~chair & (dom_cats == 'furniture')
+        res_labels[decoration] = compute_interaction_labels(self.__decoration_sim, self.__decoration_interaction,
+                                                            inputs, decoration, 'Interacting', 'Not Interacting')
+        res_labels[couch_bed] = compute_interaction_labels(self.__couch_bed_sim, self.__couch_bed_interaction, inputs,
+                                                           couch_bed, 'Interacting', 'Not Interacting')
+        res_labels[chair] = compute_interaction_labels(self.__chair_sim, self.__chair_interaction, inputs, chair,
+                                                       'Sitting', 'Not Sitting')
+        res_labels[furniture] = compute_interaction_labels(self.__furniture_sim, self.__furniture_interaction, inputs,
+                                                           furniture, 'Sitting', 'Not Sitting')
+        # A couch is sat on, and a bed is laid on
+        interacting = res_labels != None  # noqa: E711
+        res_labels[interacting & (labels == 'couch')] = 'Sitting'
+        res_labels[interacting & (labels == 'bed')] = 'Laying'
+        return res_labels
@@ -4,13 +4,16 @@ FIS for the person-household interactions
 from skfuzzy import control as ctrl
 import skfuzzy as fuzz
 import numpy as np
-from libs.annotation.fuzzy_utils import create_universes_membership_functions
+from libs.annotation.compiled_fis import compute_interaction_labels, create_interaction_inputs, create_simulation
+from libs.annotation.fuzzy_utils import shared_universes_membership_functions
 
 
 class HouseholdRules:
-    def __init__(self, show_sim_result=None):
-        prox, over, spat = create_universes_membership_functions()
+    def __init__(self, show_sim_result=None, compiled_fis=False):
+        prox, over, spat = shared_universes_membership_functions()
         self.__show_sim_result = show_sim_result
+        # Viewing a simulation result needs the live simulation
+        self.__compiled_fis = compiled_fis and not show_sim_result
         self.__proximity = prox
         self.__overlap = over
         self.__spatial_relationships = spat
@@ -42,7 +45,7 @@ class HouseholdRules:
                                                  self.__household_interaction['Not Interacting'])
         self.__household_ctrl = ctrl.ControlSystem([self.__interacting_rule1, self.__not_interacting_rule1,
                                                     self.__not_interacting_rule2])
-        self.__household_sim = ctrl.ControlSystemSimulation(self.__household_ctrl, flush_after_run=100)
+        self.__household_sim = create_simulation(self.__household_ctrl, compiled=self.__compiled_fis)
 
     def compute_household_interaction(self, giou, iou, sr_angle):
         self.__household_sim.input['overlap'] = iou
@@ -76,3 +79,24 @@ class HouseholdRules:
                 return res_label
         else:
             return res_label
+
+    def compute_interaction_batch(self, labels, dom_cats, sub_cats, gious, ious, sr_angles):
+        """
+        Vectorized compute_interaction, computing the household simulation once for all of the object tuples
+        :param labels: Base labels of the reference objects
+        :param dom_cats: Domain categories of the reference objects
+        :param sub_cats: Subdomain categories of the reference objects
+        :param gious: GIOU proximity array
+        :param ious: IOU overlap array
+        :param sr_angles: Consensus HOF angle array
+        :return: Array of interaction labels, None where there is no interaction
+        """
+        labels = np.asarray(labels, dtype=object)
+        inputs = create_interaction_inputs(gious, ious, sr_angles)
+        res_labels = compute_interaction_labels(self.__household_sim, self.__household_interaction, inputs,
+                                                np.ones(len(labels), dtype=bool), 'Interacting', 'Not Interacting')
+        interacting = res_labels != None  # noqa: E711
+        res_labels[interacting & (labels == 'toothbrush')] = 'Brushing Teeth'
+        res_labels[interacting & (labels == 'teddy_bear')] = 'Holding'
+        res_labels[interacting & (labels == 'book')] = 'Reading'
+        return res_labels
@@ -4,13 +4,16 @@ FIS for the person-sports interactions
 from skfuzzy import control as ctrl
 import skfuzzy as fuzz
 import numpy as np
-from libs.annotation.fuzzy_utils import create_universes_membership_functions
+from libs.annotation.compiled_fis import compute_interaction_labels, create_interaction_inputs, create_simulation
+from libs.annotation.fuzzy_utils import shared_universes_membership_functions
 
 
 class SportsRules:
-    def __init__(self, show_sim_result=None):
-        prox, over, spat = create_universes_membership_functions()
+    def __init__(self, show_sim_result=None, compiled_fis=False):
+        prox, over, spat = shared_universes_membership_functions()
         self.__show_sim_result = show_sim_result
+        # Viewing a simulation result needs the live simulation
+        self.__compiled_fis = compiled_fis and not show_sim_result
         self.__proximity = prox
         self.__overlap = over
         self.__spatial_relationships = spat
@@ -113,7 +116,7 @@ class SportsRules:
         self.__boarding_ctrl = ctrl.ControlSystem([self.__boarding_rule1, self.__boarding_rule2,
                                                    self.__not_boarding_rule1, self.__not_boarding_rule2,
                                                    self.__not_boarding_rule3])
-        self.__boarding_sim = ctrl.ControlSystemSimulation(self.__boarding_ctrl, flush_after_run=100)
+        self.__boarding_sim = create_simulation(self.__boarding_ctrl, compiled=self.__compiled_fis)
 
     def __create_baseball_rules(self):
         # IF overlap AND very close OR close OR medium THEN playing
@@ -128,7 +131,7 @@ class SportsRules:
         self.__not_baseball_rule2 = ctrl.Rule(self.__overlap['No Overlap'], self.__baseball_interaction['Not Playing'])
         self.__baseball_ctrl = ctrl.ControlSystem([self.__baseball_rule1, self.__not_baseball_rule1,
                                                    self.__not_baseball_rule2])
-        self.__baseball_sim = ctrl.ControlSystemSimulation(self.__baseball_ctrl, flush_after_run=100)
+        self.__baseball_sim = create_simulation(self.__baseball_ctrl, compiled=self.__compiled_fis)
 
     def __create_tennis_rules(self):
         # IF overlap AND very close OR close THEN playing
@@ -144,7 +147,7 @@ class SportsRules:
         self.__not_tennis_rule2 = ctrl.Rule(self.__overlap['No Overlap'], self.__tennis_interaction['Not Playing'])
         self.__tennis_ctrl = ctrl.ControlSystem([self.__tennis_rule1, self.__not_tennis_rule1,
                                                  self.__not_tennis_rule2])
-        self.__tennis_sim = ctrl.ControlSystemSimulation(self.__tennis_ctrl, flush_after_run=100)
+        self.__tennis_sim = create_simulation(self.__tennis_ctrl, compiled=self.__compiled_fis)
 
     def __create_frisbee_rules(self):
         # IF overlap AND very close THEN throwing
@@ -181,7 +184,7 @@ class SportsRules:
         self.__frisbee_ctrl = ctrl.ControlSystem([self.__frisbee_rule1, self.__frisbee_rule2,
                                                   self.__not_frisbee_rule1, self.__not_frisbee_rule2,
                                                   self.__not_frisbee_rule3])
-        self.__frisbee_sim = ctrl.ControlSystemSimulation(self.__frisbee_ctrl, flush_after_run=100)
+        self.__frisbee_sim = create_simulation(self.__frisbee_ctrl, compiled=self.__compiled_fis)
 
     def __create_kite_rules(self):
         # IF no overlap AND far OR very far AND below THEN flying
@@ -213,7 +216,7 @@ class SportsRules:
 
         self.__kite_ctrl = ctrl.ControlSystem([self.__kite_rule1, self.__not_kite_rule1,
                                               self.__not_kite_rule2, self.__not_kite_rule3])
-        self.__kite_sim = ctrl.ControlSystemSimulation(self.__kite_ctrl, flush_after_run=100)
+        self.__kite_sim = create_simulation(self.__kite_ctrl, compiled=self.__compiled_fis)
 
     def __create_soccer_rules(self):
         self.__soccer_rule1 = ctrl.Rule((self.__proximity['Very Close'] | self.__proximity['Close'] |
@@ -221,7 +224,7 @@ class SportsRules:
                                         self.__soccer_interaction['Playing'])
         self.__not_soccer_rule1 = ctrl.Rule(self.__proximity['Very Far'], self.__soccer_interaction['Not Playing'])
         self.__soccer_ctrl = ctrl.ControlSystem([self.__soccer_rule1, self.__not_soccer_rule1])
-        self.__soccer_sim = ctrl.ControlSystemSimulation(self.__soccer_ctrl, flush_after_run=100)
+        self.__soccer_sim = create_simulation(self.__soccer_ctrl, compiled=self.__compiled_fis)
 
     def __create_tennis_ball_rules(self):
         """
@@ -235,7 +238,7 @@ class SportsRules:
         self.__not_tennis_ball_rule1 = ctrl.Rule((self.__proximity['Far'] | self.__proximity['Very Far']),
                                                  self.__tennis_ball_interaction['Not Playing'])
         self.__tennis_ball_ctrl = ctrl.ControlSystem([self.__tennis_ball_rule1, self.__not_tennis_ball_rule1])
-        self.__tennis_ball_sim = ctrl.ControlSystemSimulation(self.__tennis_ball_ctrl, flush_after_run=100)
+        self.__tennis_ball_sim = create_simulation(self.__tennis_ball_ctrl, compiled=self.__compiled_fis)
 
     def __create_baseball_ball_rules(self):
         """
@@ -255,7 +258,7 @@ class SportsRules:
                                                     self.__spatial_relationships['Left']),
                                                    self.__baseball_ball_interaction['Not Playing'])
         self.__baseball_ball_ctrl = ctrl.ControlSystem([self.__baseball_ball_rule1, self.__not_baseball_ball_rule1])
-        self.__baseball_ball_sim = ctrl.ControlSystemSimulation(self.__baseball_ball_ctrl, flush_after_run=100)
+        self.__baseball_ball_sim = create_simulation(self.__baseball_ball_ctrl, compiled=self.__compiled_fis)
 
     def compute_boarding_interaction(self, giou, iou, sr_angle):
         self.__boarding_sim.input['overlap'] = iou
@@ -444,3 +447,53 @@ class SportsRules:
                     return None
             else:
                 return None
+
+    def compute_interaction_batch(self, labels, dom_cats, sub_cats, gious, ious, sr_angles, metadata):
+        """
+        Vectorized compute_interaction, computing each sports simulation once for all of its object tuples
+        :param labels: Base labels of the reference objects
+        :param dom_cats: Domain categories of the reference objects
+        :param sub_cats: Subdomain categories of the reference objects
+        :param gious: GIOU proximity array
+        :param ious: IOU overlap array
+        :param sr_angles: Consensus HOF angle array
+        :param metadata: Metadata labels of the images of the object tuples
+        :return: Array of interaction labels, None where there is no interaction
+        """
+        labels = np.asarray(labels, dtype=object)
+        metadata = np.asarray(metadata, dtype=object)
+        inputs = create_interaction_inputs(gious, ious, sr_angles)
+        res_labels = np.full(len(labels), None, dtype=object)
+        boarding = ((labels == 'snowboard') | (labels == 'skateboard') | (labels == 'surfboard') |
+                    (labels == 'skis'))
+        baseball = (labels == 'baseball_bat') | (labels == 'baseball_glove')
+        tennis = labels == 'tennis_racket'
+        frisbee = labels == 'frisbee'
+        kite = labels == 'kite'
+        sports_ball = labels == 'sports_ball'
+        soccer = sports_ball & (metadata == 'soccer_ball')
+        baseball_ball = sports_ball & (metadata == 'baseball')
+        tennis_ball = sports_ball & (metadata == 'tennis_ball')
+        res_labels[boarding] = compute_interaction_labels(self.__boarding_sim, self.__boarding_interaction, inputs,
+                                                          boarding, 'Riding', 'Not Riding')
+        res_labels[baseball] = compute_interaction_labels(self.__baseball_sim, self.__baseball_interaction, inputs,
+                                                          baseball, 'Playing', 'Not Playing')
+        res_labels[tennis] = compute_interaction_labels(self.__tennis_sim, self.__tennis_interaction, inputs, tennis,
+                                                        'Playing', 'Not Playing')
+        res_labels[frisbee] = compute_interaction_labels(self.__frisbee_sim, self.__frisbee_interaction, inputs,
+                                                         frisbee, 'Throwing', 'Not Throwing')
+        res_labels[kite] = compute_interaction_labels(self.__kite_sim, self.__kite_interaction, inputs, kite, 'Flying',
+                                                      'Not Flying')
+        res_labels[soccer] = compute_interaction_labels(self.__soccer_sim, self.__soccer_interaction, inputs, soccer,
+                                                        'Playing', 'Not Playing')
+        res_labels[baseball_ball] = compute_interaction_labels(self.__baseball_ball_sim,
+                                                               self.__baseball_ball_interaction, inputs, baseball_ball,
+                                                               'Playing', 'Not Playing')
+        res_labels[tennis_ball] = compute_interaction_labels(self.__tennis_ball_sim, self.__tennis_ball_interaction,
+                                                             inputs, tennis_ball, 'Playing', 'Not Playing')
+        # The ball games are labeled by the game played
+        playing = res_labels != None  # noqa: E711
+        res_labels[playing & (baseball | baseball_ball)] = 'Playing Baseball With'
+        res_labels[playing & (tennis | tennis_ball)] = 'Playing Tennis With'
+        res_labels[playing & soccer] = 'Playing Soccer With'
+        return res_labels
@@ -4,13 +4,16 @@ FIS for the person-urban interactions
 from skfuzzy import control as ctrl
 import skfuzzy as fuzz
 import numpy as np
-from libs.annotation.fuzzy_utils import create_universes_membership_functions
+from libs.annotation.compiled_fis import compute_interaction_labels, create_interaction_inputs, create_simulation
+from libs.annotation.fuzzy_utils import shared_universes_membership_functions
 
 
 class UrbanRules:
-    def __init__(self, show_sim_result=None):
-        prox, over, spat = create_universes_membership_functions()
+    def __init__(self, show_sim_result=None, compiled_fis=False):
+        prox, over, spat = shared_universes_membership_functions()
         self.__show_sim_result = show_sim_result
+        # Viewing a simulation result needs the live simulation
+        self.__compiled_fis = compiled_fis and not show_sim_result
         self.__proximity = prox
         self.__overlap = over
         self.__spatial_relationships = spat
@@ -63,7 +66,7 @@ class UrbanRules:
 
         self.__bench_ctrl = ctrl.ControlSystem([self.__sitting_rule1, self.__not_sitting_rule1,
                                                 self.__not_sitting_rule2])
-        self.__bench_sim = ctrl.ControlSystemSimulation(self.__bench_ctrl, flush_after_run=100)
+        self.__bench_sim = create_simulation(self.__bench_ctrl, compiled=self.__compiled_fis)
 
     def __create_traffic_light_rules(self):
         # IF not below THEN at intersection
@@ -80,7 +83,7 @@ class UrbanRules:
                                                    self.__spatial_relationships['Above Right']),
                                                   self.__traffic_light_interaction['Not At Intersection'])
         self.__traffic_light_ctrl = ctrl.ControlSystem([self.__intersection_rule1, self.__not_intersection_rule1])
-        self.__traffic_light_sim = ctrl.ControlSystemSimulation(self.__traffic_light_ctrl, flush_after_run=100)
+        self.__traffic_light_sim = create_simulation(self.__traffic_light_ctrl, compiled=self.__compiled_fis)
 
     def __create_parking_meter_rules(self):
         # IF overlap AND very close THEN using
@@ -97,7 +100,7 @@ class UrbanRules:
 
         self.__parking_meter_ctrl = ctrl.ControlSystem([self.__using_rule1, self.__not_using_rule1,
                                                         self.__not_using_rule2])
-        self.__parking_meter_sim = ctrl.ControlSystemSimulation(self.__parking_meter_ctrl, flush_after_run=100)
+        self.__parking_meter_sim = create_simulation(self.__parking_meter_ctrl, compiled=self.__compiled_fis)
 
     def __create_general_rules(self):
         # IF overlap AND very close OR close THEN interacting
@@ -114,7 +117,7 @@ class UrbanRules:
                                                  self.__general_interaction['Not Interacting'])
         self.__general_ctrl = ctrl.ControlSystem([self.__interacting_rule1, self.__not_interacting_rule1,
                                                   self.__not_interacting_rule2])
-        self.__general_sim = ctrl.ControlSystemSimulation(self.__general_ctrl, flush_after_run=100)
+        self.__general_sim = create_simulation(self.__general_ctrl, compiled=self.__compiled_fis)
 
     def compute_bench_interaction(self, giou, iou, sr_angle):
         self.__bench_sim.input['overlap'] = iou
@@ -201,3 +204,33 @@ class UrbanRules:
             return res_label
         res_label = self.compute_general_interaction(giou, iou, sr_angle)
         return res_label
+
+    def compute_interaction_batch(self, labels, dom_cats, sub_cats, gious, ious, sr_angles):
+        """
+        Vectorized compute_interaction, computing each urban simulation once for all of its object tuples
+        :param labels: Base labels of the reference objects
+        :param dom_cats: Domain categories of the reference objects
+        :param sub_cats: Subdomain categories of the reference objects
+        :param gious: GIOU proximity array
+        :param ious: IOU overlap array
+        :param sr_angles: Consensus HOF angle array
+        :return: Array of interaction labels, None where there is no interaction
+        """
+        labels = np.asarray(labels, dtype=object)
+        inputs = create_interaction_inputs(gious, ious, sr_angles)
+        res_labels = np.full(len(labels), None, dtype=object)
+        bench = labels == 'bench'
+        parking_meter = labels == 'parking_meter'
+        traffic_light = labels == 'traffic_light'
+        general = ~bench & ~parking_meter & ~traffic_light
+        res_labels[bench] = compute_interaction_labels(self.__bench_sim, self.__bench_interaction, inputs, bench,
+                                                       'Sitting', 'Not Sitting')
+        res_labels[parking_meter] = compute_interaction_labels(self.__parking_meter_sim,
+                                                               self.__parking_meter_interaction, inputs, parking_meter,
+                                                               'Using', 'Not Using')
+        res_labels[traffic_light] = compute_interaction_labels(self.__traffic_light_sim,
+                                                               self.__traffic_light_interaction, inputs, traffic_light,
+                                                               'At Intersection', 'Not At Intersection')
+        res_labels[general] = compute_interaction_labels(self.__general_sim, self.__general_interaction, inputs,
+                                                         general, 'Interacting', 'Not Interacting')
+        return res_labels
@@ -4,13 +4,16 @@ FIS for the person-vehicle interactions
 from skfuzzy import control as ctrl
 import skfuzzy as fuzz
 import numpy as np
-from libs.annotation.fuzzy_utils import create_universes_membership_functions
+from libs.annotation.compiled_fis import compute_interaction_labels, create_interaction_inputs, create_simulation
+from libs.annotation.fuzzy_utils import shared_universes_membership_functions
 
 
 class VehicleRules:
-    def __init__(self, show_sim_result=None):
-        prox, over, spat = create_universes_membership_functions()
+    def __init__(self, show_sim_result=None, compiled_fis=False):
+        prox, over, spat = shared_universes_membership_functions()
         self.__show_sim_result = show_sim_result
+        # Viewing a simulation result needs the live simulation
+        self.__compiled_fis = compiled_fis and not show_sim_result
         self.__proximity = prox
         self.__overlap = over
         self.__spatial_relationships = spat
@@ -64,7 +67,7 @@ class VehicleRules:
 
         self.__riding_ctrl = ctrl.ControlSystem([self.__riding_rule1, self.__not_riding_rule1,
                                                  self.__not_riding_rule2, self.__not_riding_rule3])
-        self.__riding_sim = ctrl.ControlSystemSimulation(self.__riding_ctrl, flush_after_run=100)
+        self.__riding_sim = create_simulation(self.__riding_ctrl, compiled=self.__compiled_fis)
 
     def __create_passenger_rules(self):
         # IF overlap AND very close THEN riding
@@ -81,7 +84,7 @@ class VehicleRules:
 
         self.__passenger_ctrl = ctrl.ControlSystem([self.__riding_in_rule1, self.__not_riding_in_rule1,
                                                     self.__not_riding_in_rule2])
-        self.__passenger_sim = ctrl.ControlSystemSimulation(self.__passenger_ctrl, flush_after_run=100)
+        self.__passenger_sim = create_simulation(self.__passenger_ctrl, compiled=self.__compiled_fis)
 
     def __create_personal_rules(self):
         # IF overlap AND very close THEN driving
@@ -110,7 +113,7 @@ class VehicleRules:
 
         self.__personal_ctrl = ctrl.ControlSystem([self.__driving_rule1, self.__not_driving_rule1,
                                                    self.__not_driving_rule2, self.__not_driving_rule3])
-        self.__personal_sim = ctrl.ControlSystemSimulation(self.__personal_ctrl, flush_after_run=100)
+        self.__personal_sim = create_simulation(self.__personal_ctrl, compiled=self.__compiled_fis)
 
     def compute_cycle_interaction(self, giou, iou, sr_angle):
         self.__riding_sim.input['overlap'] = iou
@@ -177,4 +180,30 @@ class VehicleRules:
             return res_label
         if dom_cat == 'personal':
             res_label = self.compute_personal_interaction(giou, iou, sr_angle)
-            return res_label
\ No newline at end of file
+            return res_label
+
+    def compute_interaction_batch(self, labels, dom_cats, sub_cats, gious, ious, sr_angles):
+        """
+        Vectorized compute_interaction, computing each vehicle simulation once for all of its object tuples
+        :param labels: Base labels of the reference objects
+        :param dom_cats: Domain categories of the reference objects
+        :param sub_cats: Subdomain categories of the reference objects
+        :param gious: GIOU proximity array
+        :param ious: IOU overlap array
+        :param sr_angles: Consensus HOF angle array
+        :return: Array of interaction labels, None where there is no interaction
+        """
+        labels = np.asarray(labels, dtype=object)
+        dom_cats = np.asarray(dom_cats, dtype=object)
+        inputs = create_interaction_inputs(gious, ious, sr_angles)
+        res_labels = np.full(len(labels), None, dtype=object)
+        cycle = (labels == 'motorcycle') | (labels == 'bicycle') | (labels == 'motorbike')
+        passenger = ~cycle & (dom_cats == 'passenger')
+        personal = ~cycle & (dom_cats == 'personal')
+        res_labels[cycle] = compute_interaction_labels(self.__riding_sim, self.__cycle_interaction, inputs, cycle,
+                                                       'Riding', 'Not Riding')
+        res_labels[passenger] = compute_interaction_labels(self.__passenger_sim, self.__passenger_interaction, inputs,
+                                                           passenger, 'Riding', 'Not Riding')
+        res_labels[personal] = compute_interaction_labels(self.__personal_sim, self.__personal_interaction, inputs,
+                                                          personal, 'Driving', 'Not Driving')
+        return res_labels
@@ -2,6 +2,7 @@
 This class constructs the universes and memberships of discourse for the proximity, overlap, and spatial
 relationship fuzzy variables.
 """
+from functools import lru_cache
 from skfuzzy import control as ctrl
 import skfuzzy as fuzz
 import numpy as np
@@ -40,3 +41,13 @@ def create_universes_membership_functions():
     spatial_relationships['Below Right'] = fuzz.trimf(spatial_relationships.universe, [300, 315, 331])
 
     return proximity, overlap, spatial_relationships
+
+
+@lru_cache(maxsize=None)
+def shared_universes_membership_functions():
+    """
+    The proximity, overlap, and spatial relationship antecedents shared by the rule bases, built on the first call.
+    The rule bases only read them, and skfuzzy keeps the inputs and memberships of each simulation apart
+    :return: The proximity, overlap, and spatial relationships antecedents
+    """
+    return create_universes_membership_functions()
@@ -2,22 +2,35 @@
 Implement the general interaction rule base for the scene annotation system
 """
 from collections import defaultdict
-from libs.annotation.fuzzy_utils import create_universes_membership_functions
+from libs.annotation.compiled_fis import compute_outputs, create_simulation, output_labels
+from libs.annotation.fuzzy_utils import shared_universes_membership_functions
+from libs.tuple_records import ImageTuples, tuple_column
 import numpy as np
 import skfuzzy as fuzz
 from skfuzzy import control as ctrl
 
 
 class GeneralRules:
-    def __init__(self):
+    def __init__(self, compiled_fis=False):
+        """
+        Construct the general interaction FIS
+        :param compiled_fis: Answer the FIS queries from precomputed output surfaces. Default False
+        """
+        self.__compiled_fis = compiled_fis
         self.__general_categories_lookup = defaultdict(list)
-        prox, over, spat = create_universes_membership_functions()
+        prox, over, spat = shared_universes_membership_functions()
         self.__proximity = prox
         self.__overlap = over
         self.__spatial_relationships = spat
         self.__create_membership_functions()
         self.__create_rules()
 
+    def parameters(self):
+        """
+        :return: Dictionary of the parameters the general interactions depend on
+        """
+        return {'compiled_fis': self.__compiled_fis}
+
     def __create_membership_functions(self):
         """
         Construct the consequent membership function for the interaction fuzzy variable
@@ -48,7 +61,7 @@ class GeneralRules:
 
         self.__interaction_ctrl = ctrl.ControlSystem([self.__interacting_rule_1, self.__interacting_rule_2,
                                                       self.__not_interacting_rule1, self.__not_interacting_rule2])
-        self.__interaction_sim = ctrl.ControlSystemSimulation(self.__interaction_ctrl, flush_after_run=100)
+        self.__interaction_sim = create_simulation(self.__interaction_ctrl, compiled=self.__compiled_fis)
 
     def compute_interactions(self, sr_result=None):
         """
@@ -63,6 +76,11 @@ class GeneralRules:
         # All results will have the same relative path. This will be returned as a key
         rel_path = sr_result[0]['relative_path']
         for r in sr_result:
+            if r.get('pruned', False):
+                # Only the Very Far and No Overlap rule fires for the pruned tuples
+                r['general_interaction'] = 'Not Interacting'
+                general_annotations.append(r)
+                continue
             proximity = r['proximity']
             overlap = r['overlap']
             self.__interaction_sim.input['proximity'] = proximity
@@ -78,4 +96,36 @@ class GeneralRules:
             interacting_label = max(membership, key=membership.get)
             r['general_interaction'] = interacting_label
             general_annotations.append(r)
+        # The compact record holds the annotations of its tuples, and is returned instead of a list of its views
+        if isinstance(sr_result, ImageTuples):
+            return rel_path, sr_result
         return rel_path, general_annotations
+
+    def compute_interaction_labels(self, proximities=None, overlaps=None):
+        """
+        Vectorized general interaction labels, computing the interaction simulation once for all of the object tuples
+        :param proximities: GIOU array of the object tuples
+        :param overlaps: IOU array of the object tuples
+        :return: Array of general interaction labels, None where the simulation has no output
+        """
+        assert proximities is not None, "Must supply the tuple proximities"
+        assert overlaps is not None, "Must supply the tuple overlaps"
+        outputs = compute_outputs(self.__interaction_sim, {'proximity': np.asarray(proximities, dtype=np.float64),
+                                                           'overlap': np.asarray(overlaps, dtype=np.float64)})
+        return output_labels(self.__interaction, outputs['interaction'], ['Interacting', 'Not Interacting'])
+
+    def compute_interactions_batch(self, sr_results=None):
+        """
+        Compute the general interaction annotations for a batch of images, labeling the object tuples of all the images
+        at once. The annotations are the ones of compute_interactions
+        :param sr_results: List of the GIOU and IOU scores for each tuple of each image
+        :return: List of the general interaction annotations of each image
+        """
+        assert sr_results is not None, "Must supply the spatial relationships of the images"
+        tuples = [r for sr_result in sr_results for r in sr_result]
+        labels = self.compute_interaction_labels(tuple_column(sr_results, 'proximity', np.float64),
+                                                 tuple_column(sr_results, 'overlap', np.float64))
+        for r, label in zip(tuples, labels):
+            r['general_interaction'] = 'Not Interacting' if r.get('pruned', False) else label
+        return [(sr_result[0]['relative_path'], sr_result if isinstance(sr_result, ImageTuples) else list(sr_result))
+                for sr_result in sr_results]
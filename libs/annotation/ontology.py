@@ -0,0 +1,95 @@
+"""
+This module compiles the object ontology into a lookup table of the person domain categories of each object.
+The table maps an object label, with words joined by underscores, to its (general category, domain category, subdomain
+category). It is cached in a small pickle file next to the ontology CSV file, with the hash of the CSV contents, and is
+rebuilt when the CSV file changes. Loading the cached table does not parse the CSV file.
+"""
+import csv
+import hashlib
+import os
+import pickle
+from utils import atomic_write
+
+# Version of the cached table format
+INDEX_VERSION = 1
+# Cells read as missing values, as by pandas.read_csv
+NA_VALUES = {'', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN', '<NA>', 'N/A',
+             'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null'}
+# Subdomain category of the objects without one
+NO_SUBDOMAIN = 'None'
+
+
+def index_file_path(ontology_file=None):
+    """
+    :param ontology_file: File path to the object ontology structure
+    :return: File path of the cached table of the ontology
+    """
+    assert ontology_file is not None, "Must supply ontology file path"
+    return os.path.splitext(ontology_file)[0] + '.index.pkl'
+
+
+def compile_ontology(ontology_file=None, contents=None):
+    """
+    Compile the object ontology into the category table. The person object is left out, as in PersonRules. An
+    object listed more than once keeps the categories of its first listed general, domain, and subdomain categories
+    :param ontology_file: File path to the object ontology structure
+    :param contents: Contents of the ontology file, read from the file when not supplied
+    :return: Dictionary of the (general category, domain category, subdomain category) of each object label.
+    Categories missing from the ontology are None, and the subdomain category is 'None'
+    """
+    if contents is None:
+        assert ontology_file is not None, "Must supply ontology file path"
+        with open(ontology_file, 'rb') as f:
+            contents = f.read()
+    rows = list(csv.DictReader(contents.decode('utf-8').splitlines()))
+    rows = [{k: None if v in NA_VALUES else v for k, v in row.items()} for row in rows]
+    rows = [row for row in rows if row['object'] != 'person']
+
+    def first_categories(column, candidates):
+        # The category whose objects come first in the order of the categories of the ontology
+        categories = {}
+        for category in dict.fromkeys(row[column] for row in candidates if row[column] is not None):
+            for row in candidates:
+                if row[column] == category and row['object'] is not None:
+                    categories.setdefault('_'.join(row['object'].split(' ')), category)
+        return categories
+
+    general = first_categories('general_category', rows)
+    domain = first_categories('subcategory_1', rows)
+    # Only the objects without any missing value have a subdomain category
+    subdomain = first_categories('subcategory_2', [row for row in rows if None not in row.values()])
+    labels = dict.fromkeys(list(general) + list(domain) + list(subdomain))
+    return {label: (general.get(label), domain.get(label), subdomain.get(label, NO_SUBDOMAIN)) for label in labels}
+
+
+def load_ontology_index(ontology_file=None, cache=True):
+    """
+    Load the category table of the object ontology from its cache file, compiling and caching it when the cache file is
+    missing or was built from different ontology contents
+    :param ontology_file: File path to the object ontology structure
+    :param cache: Read and write the cache file. Default True
+    :return: Dictionary of the (general category, domain category, subdomain category) of each object label
+    """
+    assert ontology_file is not None, "Must supply ontology file path"
+    with open(ontology_file, 'rb') as f:
+        contents = f.read()
+    if not cache:
+        return compile_ontology(contents=contents)
+
+    digest = hashlib.sha1(contents).hexdigest()
+    index_file = index_file_path(ontology_file)
+    try:
+        with open(index_file, 'rb') as f:
+            version, index_digest, table = pickle.load(f)
+        if version == INDEX_VERSION and index_digest == digest:
+            return table
+    except (OSError, pickle.UnpicklingError, EOFError, ValueError, TypeError):
+        pass  # Missing or unreadable cache, rebuilt below
+
+    table = compile_ontology(contents=contents)
+    try:
+        atomic_write(index_file, lambda f: pickle.dump((INDEX_VERSION, digest, table), f,
+                                                       protocol=pickle.HIGHEST_PROTOCOL))
+    except OSError:
+        pass  # The table is still usable when the directory is read only
+    return table
@@ -1,9 +1,9 @@
 """
 Construct a person domain FIS to process all person-object interactions
 """
-from collections import defaultdict
-import pandas as pd
 import json
+import time
+import numpy as np
 from libs.annotation.fis.animal import AnimalRules
 from libs.annotation.fis.appliances import AppliancesRules
 from libs.annotation.fis.clothing import ClothingRules
@@ -14,84 +14,124 @@ from libs.annotation.fis.household import HouseholdRules
 from libs.annotation.fis.sports import SportsRules
 from libs.annotation.fis.urban import UrbanRules
 from libs.annotation.fis.vehicle import VehicleRules
+from libs.annotation.ontology import load_ontology_index, NO_SUBDOMAIN
+from libs.tuple_records import ImageTuples, tuple_column
 from utils import get_consensus_angle, convert_meta_labels
 
+# Rule base class of each general category
+RULE_BASE_CLASSES = {'animal': AnimalRules, 'appliances': AppliancesRules, 'clothing': ClothingRules,
+                     'electronics': ElectronicsRules, 'food and tableware': FoodRules,
+                     'furniture and home decor': FurnitureRules, 'household items': HouseholdRules,
+                     'urban': UrbanRules, 'vehicle': VehicleRules, 'sports': SportsRules}
+
+
+def object_interaction(compute, base_label, dom_cat, sub_cat, giou, iou, sr_angle, meta_label):
+    """
+    Call the interaction function of a rule base labeling its tuples from the object label and categories
+    :param compute: compute_interaction or compute_interaction_batch of the rule base
+    :return: The interaction labels of the tuples
+    """
+    return compute(base_label, dom_cat, sub_cat, giou, iou, sr_angle)
+
+
+def appliances_interaction(compute, base_label, dom_cat, sub_cat, giou, iou, sr_angle, meta_label):
+    """
+    Call the interaction function of the appliances rule base, which only uses the spatial relationships
+    """
+    return compute(giou, iou, sr_angle)
+
+
+def sports_interaction(compute, base_label, dom_cat, sub_cat, giou, iou, sr_angle, meta_label):
+    """
+    Call the interaction function of the sports rule base, which also uses the metadata label
+    """
+    return compute(base_label, dom_cat, sub_cat, giou, iou, sr_angle, meta_label)
+
+
+# Handler adapting the arguments of the interaction functions of each general category to its rule base
+RULE_BASE_HANDLERS = {gen_cat: object_interaction for gen_cat in RULE_BASE_CLASSES}
+RULE_BASE_HANDLERS.update({'appliances': appliances_interaction, 'sports': sports_interaction})
+
 
 class PersonRules:
     def __init__(self,
                  ontology_file='./input/object_ontology.csv',
-                 show_sim_result=False):
+                 show_sim_result=False,
+                 compiled_fis=False,
+                 lazy_rule_bases=True):
         """
         Construct the Person domain FIS for object tuple inference
         :param ontology_file: File path to the object ontology structure
         :param show_sim_result: Display the resultant output of the FIS. Default False
+        :param compiled_fis: Answer the FIS queries from precomputed output surfaces. Default False
+        :param lazy_rule_bases: Build the rule base of a general category on the first tuple of the category. Otherwise
+        build all of them now. Default True
         """
         assert ontology_file is not None, "Must supply ontology file path"
-        self.__ontology_df = pd.read_csv(ontology_file, encoding='utf-8', engine='python')
-        self.__ontology_df.drop(self.__ontology_df[self.__ontology_df['object'] == 'person'].index, inplace=True)
-        self.__general_categories_lookup = defaultdict(list)
-        self.__domain_categories_lookup = defaultdict(list)
-        self.__subdomain_categories_lookup = defaultdict(list)
-
-        self.__create_general_categories_lookup()
-        self.__create_domain_categories_lookup()
-        self.__create_subdomain_categories_lookup()
-
-        self.__animal_rules = AnimalRules(show_sim_result)
-        self.__appliance_rules = AppliancesRules(show_sim_result)
-        self.__clothing_rules = ClothingRules(show_sim_result)
-        self.__electronics_rules = ElectronicsRules(show_sim_result)
-        self.__food_rules = FoodRules(show_sim_result)
-        self.__furniture_rules = FurnitureRules(show_sim_result)
-        self.__household_rules = HouseholdRules(show_sim_result)
-        self.__urban_rules = UrbanRules(show_sim_result)
-        self.__vehicle_rules = VehicleRules(show_sim_result)
-        self.__sports_rules = SportsRules(show_sim_result)
-
-    def __create_general_categories_lookup(self):
-        general_categories = self.__ontology_df['general_category'].unique().flatten().tolist()
-        for gc in general_categories:
-            objects = list(self.__ontology_df.loc[self.__ontology_df['general_category'] == gc]['object'])
-            objects = ['_'.join(o.split(' ')) for o in objects]
-            self.__general_categories_lookup[gc] = objects
-
-    def __create_domain_categories_lookup(self):
-        domain_categories = self.__ontology_df['subcategory_1'].unique().flatten().tolist()
-        for dc in domain_categories:
-            objects = list(self.__ontology_df.loc[self.__ontology_df['subcategory_1'] == dc]['object'])
-            objects = ['_'.join(o.split(' ')) for o in objects]
-            self.__domain_categories_lookup[dc] = objects
-
-    def __create_subdomain_categories_lookup(self):
-        subdomain_df = self.__ontology_df.dropna()
-        subdomain_categories = subdomain_df['subcategory_2'].unique().flatten().tolist()
-        for sc in subdomain_categories:
-            objects = list(subdomain_df.loc[subdomain_df['subcategory_2'] == sc]['object'])
-            objects = ['_'.join(o.split(' ')) for o in objects]
-            self.__subdomain_categories_lookup[sc] = objects
-
-    def __get_general_category(self, label=None):
-        for k, v in self.__general_categories_lookup.items():
-            if label in v:
-                return k
-
-    def __get_domain_category(self, label=None):
-        for k, v in self.__domain_categories_lookup.items():
-            if label in v:
-                return k
-
-    def __get_subdomain_category(self, label=None):
-        for k, v in self.__subdomain_categories_lookup.items():
-            if label in v:
-                return k
-        return 'None'  # There is no subdomain for this object
+        # Categories of each object label of the ontology, and of each numbered label seen so far
+        self.__ontology_file = ontology_file
+        self.__ontology_index = load_ontology_index(ontology_file)
+        self.__label_categories = {}
+
+        # The rule base of a general category is built on its first use
+        self.__show_sim_result = show_sim_result
+        self.__compiled_fis = compiled_fis
+        self.__rule_bases = {}
+        self.__build_times = {}
+        if not lazy_rule_bases:
+            self.build_rule_bases()
+
+    def parameters(self):
+        """
+        :return: Dictionary of the parameters the person domain interactions depend on
+        """
+        return {'ontology_file': self.__ontology_file, 'compiled_fis': self.__compiled_fis}
+
+    def build_rule_bases(self, categories=None):
+        """
+        Build the rule bases of general categories now instead of on their first use
+        :param categories: General categories of the rule bases. Defaults to all of them
+        """
+        for gen_cat in RULE_BASE_CLASSES if categories is None else categories:
+            self.__get_rule_base(gen_cat)
+
+    def __get_rule_base(self, gen_cat):
+        """
+        The rule base of a general category, built and timed on the first call. None for an unknown category
+        """
+        rules = self.__rule_bases.get(gen_cat)
+        if rules is None and gen_cat in RULE_BASE_CLASSES:
+            start = time.perf_counter()
+            rules = RULE_BASE_CLASSES[gen_cat](self.__show_sim_result, self.__compiled_fis)
+            self.__build_times[gen_cat] = time.perf_counter() - start
+            self.__rule_bases[gen_cat] = rules
+        return rules
+
+    def startup_report(self):
+        """
+        Report the construction time of the rule bases
+        :return: Dictionary of the construction time in seconds of the rule base of each general category, None for
+        the rule bases not built yet
+        """
+        return {gen_cat: self.__build_times.get(gen_cat) for gen_cat in RULE_BASE_CLASSES}
+
+    def __get_label_entry(self, label):
+        """
+        The categories, base label, and rule base handler of an object label, looked up once per label. The handler is
+        None for the labels without a rule base
+        """
+        entry = self.__label_categories.get(label)
+        if entry is None:
+            base_label = '_'.join(label.split('_')[:-1])
+            general_category, domain_category, subdomain_category = self.__ontology_index.get(
+                base_label, (None, None, NO_SUBDOMAIN))
+            entry = (general_category, domain_category, subdomain_category, base_label,
+                     RULE_BASE_HANDLERS.get(general_category))
+            self.__label_categories[label] = entry
+        return entry
 
     def get_categories(self, label=None):
-        base_label = '_'.join(label.split('_')[:-1])
-        general_category = self.__get_general_category(base_label)
-        domain_category = self.__get_domain_category(base_label)
-        subdomain_category = self.__get_subdomain_category(base_label)
-        return general_category, domain_category, subdomain_category, base_label
+        return self.__get_label_entry(label)[:4]
 
     def compute_interactions(self, sr_result=None):
         """
@@ -107,11 +147,17 @@ class PersonRules:
 
         # All results will have the same relative path. This will be returned as a key
         rel_path = sr_result[0]['relative_path']
+        # The pruned tuples, far apart, are labeled together after the others
+        pruned_tuples = []
         for r in sr_result:
             if 'person' not in r['arg_label']:
                 r['person_interaction'] = 'None'
                 person_annotations.append(r)
                 continue  # Cannot compute person object annotation if tuple does not contain a person
+            if r.get('pruned', False):
+                pruned_tuples.append(r)
+                person_annotations.append(r)
+                continue
             label = r['ref_label']
             giou = r['proximity']
             iou = r['overlap']
@@ -121,34 +167,13 @@ class PersonRules:
             sr_angle = get_consensus_angle(f0, f2, hybrid)
             meta_label = r['metadata']
 
-            gen_cat, dom_cat, sub_cat, base_label = self.get_categories(label)
-            if gen_cat == 'animal':
-                res_label = self.__animal_rules.compute_interaction(base_label, dom_cat, sub_cat, giou, iou, sr_angle)
-            elif gen_cat == 'appliances':
-                res_label = self.__appliance_rules.compute_interaction(giou, iou, sr_angle)
-            elif gen_cat == 'clothing':
-                res_label = self.__clothing_rules.compute_interaction(base_label, dom_cat, sub_cat, giou, iou, sr_angle)
-            elif gen_cat == 'electronics':
-                res_label = self.__electronics_rules.compute_interaction(base_label, dom_cat,
-                                                                         sub_cat, giou, iou, sr_angle)
-            elif gen_cat == 'food and tableware':
-                res_label = self.__food_rules.compute_interaction(base_label, dom_cat, sub_cat, giou, iou, sr_angle)
-            elif gen_cat == 'furniture and home decor':
-                res_label = self.__furniture_rules.compute_interaction(base_label, dom_cat, sub_cat, giou, iou,
-                                                                       sr_angle)
-            elif gen_cat == 'household items':
-                res_label = self.__household_rules.compute_interaction(base_label, dom_cat, sub_cat, giou, iou,
-                                                                       sr_angle)
-            elif gen_cat == 'urban':
-                res_label = self.__urban_rules.compute_interaction(base_label, dom_cat, sub_cat, giou, iou, sr_angle)
-            elif gen_cat == 'vehicle':
-                res_label = self.__vehicle_rules.compute_interaction(base_label, dom_cat, sub_cat, giou, iou, sr_angle)
-            elif gen_cat == 'sports':
-                res_label = self.__sports_rules.compute_interaction(base_label, dom_cat, sub_cat, giou, iou, sr_angle,
-                                                                    meta_label)
-            else:
+            gen_cat, dom_cat, sub_cat, base_label, handler = self.__get_label_entry(label)
+            if handler is None:
                 # Invalid category, assign as None
                 res_label = 'None'
+            else:
+                res_label = handler(self.__get_rule_base(gen_cat).compute_interaction, base_label, dom_cat, sub_cat,
+                                    giou, iou, sr_angle, meta_label)
 
             # Change the res label to be 'None' if None was returned from an FIS
             if res_label is None:
@@ -156,4 +181,73 @@ class PersonRules:
 
             r['person_interaction'] = res_label
             person_annotations.append(r)
+        if pruned_tuples:
+            pruned_labels = self.compute_interaction_labels(
+                [r['arg_label'] for r in pruned_tuples], [r['ref_label'] for r in pruned_tuples],
+                [r['proximity'] for r in pruned_tuples], [r['overlap'] for r in pruned_tuples],
+                [get_consensus_angle(r['f0'], r['f2'], r['hybrid']) for r in pruned_tuples],
+                [r['metadata'] for r in pruned_tuples])
+            for r, res_label in zip(pruned_tuples, pruned_labels):
+                r['person_interaction'] = 'None' if res_label is None else res_label
+        # The compact record holds the annotations of its tuples, and is returned instead of a list of its views
+        if isinstance(sr_result, ImageTuples):
+            return rel_path, sr_result
         return rel_path, person_annotations
+
+    def compute_interaction_labels(self, arg_labels=None, ref_labels=None, gious=None, ious=None, sr_angles=None,
+                                   meta_labels=None):
+        """
+        Vectorized person domain interaction labels. The object tuples are grouped by rule base, and each rule base
+        labels its tuples at once. The labels are the ones of compute_interactions
+        :param arg_labels: Labels of the argument objects
+        :param ref_labels: Labels of the referent objects
+        :param gious: GIOU array of the object tuples
+        :param ious: IOU array of the object tuples
+        :param sr_angles: Consensus HOF angle array of the object tuples
+        :param meta_labels: Metadata labels of the images of the object tuples
+        :return: Array of person domain interaction labels, 'None' where there is no interaction
+        """
+        assert arg_labels is not None, "Must supply the argument labels"
+        assert ref_labels is not None, "Must supply the referent labels"
+        gious, ious, sr_angles = (np.asarray(a, dtype=np.float64) for a in (gious, ious, sr_angles))
+        meta_labels = np.asarray(meta_labels, dtype=object)
+        person = np.array(['person' in label for label in arg_labels], dtype=bool)
+        categories = np.array([self.__get_label_entry(label) if p else (None, None, None, None, None)
+                               for label, p in zip(ref_labels, person)], dtype=object).reshape(-1, 5)
+        gen_cats, dom_cats, sub_cats, base_labels, handlers = categories.T
+
+        res_labels = np.full(len(person), None, dtype=object)
+        for gen_cat in RULE_BASE_CLASSES:
+            mask = person & (gen_cats == gen_cat)
+            if not np.any(mask):
+                continue
+            handler = handlers[mask][0]
+            res_labels[mask] = handler(self.__get_rule_base(gen_cat).compute_interaction_batch, base_labels[mask],
+                                       dom_cats[mask], sub_cats[mask], gious[mask], ious[mask], sr_angles[mask],
+                                       meta_labels[mask])
+
+        # Change the res labels to be 'None' if None was returned from an FIS
+        res_labels[res_labels == None] = 'None'  # noqa: E711
+        return res_labels
+
+    def compute_interactions_batch(self, sr_results=None):
+        """
+        Compute the person-object image annotations for a batch of images, labeling the object tuples of all the images
+        at once. The annotations are the ones of compute_interactions
+        :param sr_results: List of the computed spatial relationship results of each image
+        :return: List of the person domain image annotations of each image
+        """
+        assert sr_results is not None, "Must supply spatial relationship results for the images"
+        tuples = [r for sr_result in sr_results for r in sr_result]
+        # The columns are read from the arrays of the compact records
+        sr_angles = [get_consensus_angle(f0, f2, hybrid)
+                     for f0, f2, hybrid in zip(*[tuple_column(sr_results, key) for key in ['f0', 'f2', 'hybrid']])]
+        labels = self.compute_interaction_labels(tuple_column(sr_results, 'arg_label'),
+                                                 tuple_column(sr_results, 'ref_label'),
+                                                 tuple_column(sr_results, 'proximity', np.float64),
+                                                 tuple_column(sr_results, 'overlap', np.float64), sr_angles,
+                                                 tuple_column(sr_results, 'metadata'))
+        for r, label in zip(tuples, labels):
+            r['person_interaction'] = label
+        return [(sr_result[0]['relative_path'], sr_result if isinstance(sr_result, ImageTuples) else list(sr_result))
+                for sr_result in sr_results]
@@ -0,0 +1,192 @@
+"""
+This module implements the headless batch runner of the scene labeling system.
+A pool of worker processes each builds its own SceneLabeling once, receives the images of a directory in chunks, and
+sends back the results of each image. The results are streamed to the output as the chunks complete, either to a JSON
+lines file with one line per image, or to Parquet or Arrow tables with one row group per chunk.
+"""
+from collections.abc import Mapping
+import multiprocessing
+import json
+import os
+import queue
+import sys
+import time
+import numpy as np
+from libs.columnar_export import ColumnarWriter, EXPORT_FORMATS
+from libs.tuple_records import ImageTuples
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+OUTPUT_FORMATS = ('jsonl',) + EXPORT_FORMATS
+
+# The SceneLabeling of a worker process, built once by the pool initializer, or the error that prevented it
+_labeler = None
+_init_error = None
+
+
+def list_images(image_dir=None, extensions=IMAGE_EXTENSIONS):
+    """
+    List the image files of a directory and its subdirectories
+    :param image_dir: The image directory
+    :param extensions: File extensions of the images, lower case
+    :return: Sorted list of the image paths relative to the directory
+    """
+    assert image_dir is not None, "Must supply the image directory"
+    image_names = []
+    for root, dirs, files in os.walk(image_dir):
+        for f in files:
+            if os.path.splitext(f)[1].lower() in extensions:
+                image_names.append(os.path.relpath(os.path.join(root, f), image_dir))
+    return sorted(image_names)
+
+
+def _to_json(value):
+    # NumPy scalars of the spatial relationship results
+    if isinstance(value, np.generic):
+        return value.item()
+    # Compact tuple records and their dictionary views
+    if isinstance(value, ImageTuples):
+        return value.to_dicts()
+    if isinstance(value, Mapping):
+        return dict(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class JsonLinesWriter:
+    def __init__(self, output_file=None):
+        """
+        Construct the writer of the JSON lines output, one line per image
+        :param output_file: The JSON lines output file
+        """
+        assert output_file is not None, "Must supply the output file"
+        self.__out = open(output_file, 'w', encoding='utf-8')
+
+    def write_batch(self, records=None):
+        """
+        Write the results of a batch of images and flush them
+        :param records: List of the (image key, results, error) of each image
+        """
+        for key, results, error in records:
+            if error is not None:
+                record = {'key': key, 'error': error}
+            else:
+                od_result, meta, annotations = results
+                record = {'key': key, 'object_detection': od_result, 'metadata': meta, 'annotations': annotations}
+            self.__out.write(json.dumps(record, default=_to_json) + '\n')
+        self.__out.flush()
+
+    def close(self):
+        self.__out.close()
+
+
+def _init_worker(labeler_kwargs, threads_per_job):
+    """
+    Build the SceneLabeling of a worker process, limiting the threads of the libraries so the workers do not
+    oversubscribe the cores
+    """
+    global _labeler, _init_error
+    # An initializer that raises makes the pool restart the worker endlessly, so the error is reported by the chunks
+    try:
+        import cv2
+        cv2.setNumThreads(threads_per_job)
+        # torch is only loaded with the metadata model, which may never be needed. It reads its number of threads from
+        # the environment when it is imported, and is only set directly when it is already loaded
+        os.environ['OMP_NUM_THREADS'] = str(threads_per_job)
+        if 'torch' in sys.modules:
+            sys.modules['torch'].set_num_threads(threads_per_job)
+        from scene_labeling import SceneLabeling
+        _labeler = SceneLabeling(**labeler_kwargs)
+    except Exception as e:
+        _init_error = f'{type(e).__name__}: {e}'
+
+
+def _process_chunk(chunk):
+    """
+    Process a chunk of images in a worker process
+    :param chunk: The (image directory, image names) of the chunk
+    :return: The process id of the worker, the error that prevented building its scene labeling system or None, the
+    chunk, and the list of the (image key, results, error) of each image. The results are the (object detection
+    results, metadata results, image annotations) of the image, None when it failed with the error. A worker without a
+    scene labeling system returns no records, and the run stops
+    """
+    if _labeler is None:
+        return os.getpid(), _init_error, chunk, []
+    import cv2
+    image_dir, image_names = chunk
+    records = []
+    for name in image_names:
+        try:
+            image = cv2.imread(os.path.join(image_dir, name), cv2.IMREAD_COLOR)
+            assert image is not None, "Could not read the image"
+            _labeler.process_image(image, name)
+            records.append((name, _labeler.pop_results(name), None))
+        except Exception as e:
+            records.append((name, None, f'{type(e).__name__}: {e}'))
+    return os.getpid(), None, chunk, records
+
+
+def run_directory(image_dir=None, output_file=None, jobs=None, chunk_size=16, threads_per_job=1, labeler_kwargs=None,
+                  verbose=True, output_format='jsonl'):
+    """
+    Label the images of a directory with a pool of worker processes
+    :param image_dir: The image directory
+    :param output_file: The JSON lines output file, with one result per image, or the directory of the tables of the
+    columnar formats
+    :param jobs: Number of worker processes. Defaults to the number of cores
+    :param chunk_size: Number of images handed to a worker at a time
+    :param threads_per_job: Number of OpenCV and torch threads of each worker
+    :param labeler_kwargs: Keyword arguments of the SceneLabeling of the workers
+    :param verbose: Print the progress
+    :param output_format: 'jsonl', or one of the columnar export formats 'parquet' and 'arrow'. Default 'jsonl'
+    :return: The number of processed images, and the number of images that failed. Raises a RuntimeError as soon as a
+    worker could not build its scene labeling system
+    """
+    assert image_dir is not None, "Must supply the image directory"
+    assert output_file is not None, "Must supply the output file"
+    jobs = jobs or os.cpu_count()
+    assert jobs > 0, "Must use at least one worker"
+    assert chunk_size > 0, "Chunk size must be positive"
+    assert output_format in OUTPUT_FORMATS, f"Output format must be one of {OUTPUT_FORMATS}"
+    image_names = list_images(image_dir)
+    chunks = [(image_dir, image_names[i:i + chunk_size]) for i in range(0, len(image_names), chunk_size)]
+
+    num_images = 0
+    num_errors = 0
+    start = time.perf_counter()
+    with multiprocessing.Pool(jobs, initializer=_init_worker, initargs=(labeler_kwargs or {}, threads_per_job)) as pool:
+        if output_format == 'jsonl':
+            writer = JsonLinesWriter(output_file)
+        else:
+            writer = ColumnarWriter(output_file, output_format)
+        # The pool cannot replace a worker without a scene labeling system, which would take back any chunk handed
+        # back to the other workers. The failures to build it, such as a missing model file, are the same in every
+        # worker, so the run stops at the first one
+        completed = queue.Queue()
+        failed_workers = {}
+        for image_chunk in chunks:
+            pool.apply_async(_process_chunk, (image_chunk,), callback=completed.put, error_callback=completed.put)
+        try:
+            for _ in chunks:
+                result = completed.get()
+                if isinstance(result, BaseException):
+                    raise result
+                pid, init_error, _, records = result
+                if init_error is not None:
+                    failed_workers[pid] = init_error
+                    break
+                writer.write_batch(records)
+                num_errors += sum(error is not None for _, _, error in records)
+                num_images += len(records)
+                if verbose:
+                    rate = num_images / (time.perf_counter() - start)
+                    print(f'{num_images}/{len(image_names)} images, {num_errors} errors, {rate:.2f} images/s')
+        finally:
+            writer.close()
+        if failed_workers:
+            # The errors of the other failed workers already returned are reported together
+            while not completed.empty():
+                result = completed.get()
+                if not isinstance(result, BaseException) and result[1] is not None:
+                    failed_workers[result[0]] = result[1]
+            raise RuntimeError('Could not build the scene labeling system of the workers: '
+                               + '; '.join(f'{pid}: {error}' for pid, error in failed_workers.items()))
+    return num_images, num_errors
@@ -0,0 +1,229 @@
+"""
+This module implements the columnar export of the scene labeling results.
+The object detections, metadata, and tuple annotations of the images are written as typed Arrow tables, to Parquet
+files or Arrow IPC files, instead of as dictionaries of JSON strings. The JSON encoded boxes, labels, and confidences of
+the results are parsed once at export, so the readers of the tables scan typed columns. Each written batch of images
+becomes one row group of each table it has rows for.
+The tables are written to a directory:
+    detections: One row per detected object
+    metadata: One row per metadata label of an image
+    tuples: One row per object tuple, with its spatial relationships and annotations
+    errors: One row per image that failed
+"""
+import json
+import os
+
+# pyarrow is imported by the first writer, so importing the module does not load it
+pa = None
+pq = None
+
+EXPORT_FORMATS = ('parquet', 'arrow')
+TABLE_NAMES = ('detections', 'metadata', 'tuples', 'errors')
+
+# Columns of each table and their Arrow types, given as pyarrow type factory names so the module imports without pyarrow
+_BOX_COLUMNS = ['x1', 'y1', 'x2', 'y2']
+_COLUMNS = {
+    'detections': [('key', 'string'), ('object_index', 'int32'), ('label', 'string')]
+                  + [(c, 'int32') for c in _BOX_COLUMNS]
+                  + [('confidence', 'float32'), ('img_width', 'int32'), ('img_height', 'int32')],
+    'metadata': [('key', 'string'), ('rank', 'int16'), ('label', 'string'), ('confidence', 'float32'),
+                 ('skipped', 'bool_')],
+    'tuples': [('key', 'string'), ('tuple_key', 'string'), ('arg_label', 'string'), ('ref_label', 'string')]
+              + [(f'arg_{c}', 'int32') for c in _BOX_COLUMNS] + [(f'ref_{c}', 'int32') for c in _BOX_COLUMNS]
+              + [('metadata', 'string'), ('giou', 'float64'), ('iou', 'float64'), ('f0', 'int16'), ('f2', 'int16'),
+                 ('hybrid', 'int16'), ('spatial_relationship', 'string'), ('general_interaction', 'string'),
+                 ('person_interaction', 'string')],
+    'errors': [('key', 'string'), ('error', 'string')]
+}
+
+
+def _import_pyarrow():
+    """
+    Import pyarrow on first use
+    :return: True if pyarrow is installed
+    """
+    global pa, pq
+    if pa is None:
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            return False
+        pa, pq = pyarrow, pyarrow.parquet
+    return True
+
+
+def _empty_columns(table_name):
+    return {name: [] for name, _ in _COLUMNS[table_name]}
+
+
+def detections_to_columns(od_results=None, columns=None):
+    """
+    Convert object detection results into the columns of the detections table
+    :param od_results: Iterable of the object detection results of the images
+    :param columns: Dictionary of column lists to append to. Defaults to new lists
+    :return: Dictionary of the column lists keyed by column name
+    """
+    assert od_results is not None, "Must supply the object detection results"
+    columns = _empty_columns('detections') if columns is None else columns
+    for od_result in od_results:
+        labels = json.loads(od_result['labels'])
+        boxes = json.loads(od_result['bounding_boxes'])
+        confidences = json.loads(od_result['confidences'])
+        for idx, (label, box, confidence) in enumerate(zip(labels, boxes, confidences)):
+            columns['key'].append(od_result['key'])
+            columns['object_index'].append(idx)
+            columns['label'].append(label)
+            for c, value in zip(_BOX_COLUMNS, box):
+                columns[c].append(int(value))
+            columns['confidence'].append(float(confidence))
+            columns['img_width'].append(int(od_result['img_width']))
+            columns['img_height'].append(int(od_result['img_height']))
+    return columns
+
+
+def metadata_to_columns(keys=None, metadata_results=None, columns=None):
+    """
+    Convert metadata results into the columns of the metadata table. An image whose metadata was skipped gets a
+    single row with a null label
+    :param keys: Iterable of the image keys
+    :param metadata_results: Iterable of the metadata results of the images
+    :param columns: Dictionary of column lists to append to. Defaults to new lists
+    :return: Dictionary of the column lists keyed by column name
+    """
+    assert keys is not None, "Must supply the image keys"
+    assert metadata_results is not None, "Must supply the metadata results"
+    columns = _empty_columns('metadata') if columns is None else columns
+    for key, meta in zip(keys, metadata_results):
+        if meta.get('skipped', False):
+            rows = [(None, None)]
+        else:
+            rows = zip(json.loads(meta['labels']), json.loads(meta['confidences']))
+        for rank, (label, confidence) in enumerate(rows):
+            columns['key'].append(key)
+            columns['rank'].append(rank)
+            columns['label'].append(label)
+            columns['confidence'].append(None if confidence is None else float(confidence))
+            columns['skipped'].append(meta.get('skipped', False))
+    return columns
+
+
+def annotations_to_columns(keys=None, annotations=None, columns=None):
+    """
+    Convert the tuple annotations into the columns of the tuples table
+    :param keys: Iterable of the image keys
+    :param annotations: Iterable of the lists of tuple annotations of the images
+    :param columns: Dictionary of column lists to append to. Defaults to new lists
+    :return: Dictionary of the column lists keyed by column name
+    """
+    assert keys is not None, "Must supply the image keys"
+    assert annotations is not None, "Must supply the image annotations"
+    columns = _empty_columns('tuples') if columns is None else columns
+    for key, image_annotations in zip(keys, annotations):
+        for r in image_annotations:
+            columns['key'].append(key)
+            columns['tuple_key'].append(r['key'])
+            columns['arg_label'].append(r['arg_label'])
+            columns['ref_label'].append(r['ref_label'])
+            for prefix in ['arg', 'ref']:
+                for c, value in zip(_BOX_COLUMNS, json.loads(r[f'{prefix}_bounding_box'])):
+                    columns[f'{prefix}_{c}'].append(int(value))
+            columns['metadata'].append(r['metadata'])
+            columns['giou'].append(float(r['proximity']))
+            columns['iou'].append(float(r['overlap']))
+            for c in ['f0', 'f2', 'hybrid']:
+                columns[c].append(int(r[c]))
+            for c in ['spatial_relationship', 'general_interaction', 'person_interaction']:
+                columns[c].append(r.get(c))
+    return columns
+
+
+class ColumnarWriter:
+    def __init__(self, output_dir=None, export_format='parquet', compression='zstd'):
+        """
+        Construct the writer of the result tables. Requires pyarrow
+        :param output_dir: Directory of the table files, created if needed
+        :param export_format: 'parquet' writes <table>.parquet files, 'arrow' writes <table>.arrow IPC files. Default
+        'parquet'
+        :param compression: Compression codec of the Parquet files. Default 'zstd'
+        """
+        assert _import_pyarrow(), "The columnar export requires pyarrow"
+        assert output_dir is not None, "Must supply the output directory"
+        assert export_format in EXPORT_FORMATS, f"Export format must be one of {EXPORT_FORMATS}"
+        os.makedirs(output_dir, exist_ok=True)
+        self.__output_dir = output_dir
+        self.__export_format = export_format
+        self.__compression = compression
+        self.__schemas = {name: pa.schema([(c, getattr(pa, t)()) for c, t in columns])
+                          for name, columns in _COLUMNS.items()}
+        self.__sinks = {}
+        self.__writers = {}
+        self.__closed = False
+
+    @property
+    def schemas(self):
+        return self.__schemas
+
+    def table_path(self, table_name):
+        return os.path.join(self.__output_dir, f'{table_name}.{self.__export_format}')
+
+    def write_batch(self, records=None):
+        """
+        Write the results of a batch of images as one row group of each table
+        :param records: List of the (image key, results, error) of each image. The results are the (object detection
+        results, metadata results, image annotations) of the image, None when it failed with the error
+        """
+        assert records is not None, "Must supply the records"
+        assert not self.__closed, "The writer is closed"
+        columns = {name: _empty_columns(name) for name in TABLE_NAMES}
+        keys = [key for key, results, _ in records if results is not None]
+        results = [results for _, results, _ in records if results is not None]
+        detections_to_columns([r[0] for r in results], columns['detections'])
+        metadata_to_columns(keys, [r[1] for r in results], columns['metadata'])
+        annotations_to_columns(keys, [r[2] for r in results], columns['tuples'])
+        for key, _, error in records:
+            if error is not None:
+                columns['errors']['key'].append(key)
+                columns['errors']['error'].append(error)
+        for name in TABLE_NAMES:
+            self.__write_table(name, pa.Table.from_pydict(columns[name], schema=self.__schemas[name]))
+
+    def __write_table(self, name, table):
+        if name not in self.__writers:
+            # The table files are created on the first batch, so every table exists even when it has no rows
+            if self.__export_format == 'parquet':
+                self.__writers[name] = pq.ParquetWriter(self.table_path(name), self.__schemas[name],
+                                                        compression=self.__compression)
+            else:
+                self.__sinks[name] = pa.OSFile(self.table_path(name), 'wb')
+                self.__writers[name] = pa.ipc.new_file(self.__sinks[name], self.__schemas[name])
+        if table.num_rows == 0:
+            return
+        if self.__export_format == 'parquet':
+            # One row group per batch
+            self.__writers[name].write_table(table, row_group_size=table.num_rows)
+        else:
+            self.__writers[name].write_table(table)
+
+    def close(self):
+        """
+        Finish the table files. The tables without rows are written empty
+        """
+        if self.__closed:
+            return
+        self.__closed = True
+        for name in TABLE_NAMES:
+            if name not in self.__writers:
+                self.__write_table(name, self.__schemas[name].empty_table())
+        for writer in self.__writers.values():
+            writer.close()
+        for sink in self.__sinks.values():
+            sink.close()
+        self.__writers = {}
+        self.__sinks = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
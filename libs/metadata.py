@@ -7,12 +7,33 @@ import cv2
 import numpy as np
 import os
 import json
+from utils import atomic_write
 
 
 class MetaData:
     def __init__(self,
                  labels_file='./input/labels/ilsvrc2012_wordnet_lemmas.txt',
-                 torch_dir='./input/models/torchvision_models/resnet/'):
+                 torch_dir='./input/models/torchvision_models/resnet/',
+                 top_k=5,
+                 batch_size=16,
+                 num_threads=None,
+                 model_file=None):
+        """
+        Construct the ResNet-50 image metadata classifier
+        :param labels_file: File path to the ImageNet labels
+        :param torch_dir: Directory of the torchvision models
+        :param top_k: Number of most probable labels returned for an image
+        :param batch_size: Number of images per forward pass of compute_metadata_batch
+        :param num_threads: Intra-op thread count of torch, which is process wide. Default keeps the torch setting
+        :param model_file: File path to a TorchScript model saved by export_model, loaded instead of building the
+        torchvision model. Default None
+        """
+        assert top_k > 0, "Must return at least one label"
+        assert batch_size > 0, "Batch size must be positive"
+        if num_threads is not None:
+            torch.set_num_threads(num_threads)
+        self.__top_k = top_k
+        self.__batch_size = batch_size
         # Constants used by the resnet model in torch
         os.environ['TORCH_HOME'] = torch_dir
         self.__mean = [0.485, 0.456, 0.406]
@@ -21,9 +42,34 @@ class MetaData:
         # Load the image net model. If it does not exist it will be
         # downloaded to the torch_dir directory
         self.__imagenet_labels = dict(enumerate(open(labels_file)))
-        self.__model = models.resnet50(weights='ResNet50_Weights.DEFAULT')
-        self.__model.to('cpu')
+        if model_file is not None:
+            self.__model = torch.jit.load(model_file, map_location='cpu')
+        else:
+            self.__model = models.resnet50(weights='ResNet50_Weights.DEFAULT')
+            self.__model.to('cpu')
         self.__model.eval()
+        self.__parameters = {'labels_file': labels_file, 'top_k': top_k,
+                             'model_file': model_file if model_file is not None else 'ResNet50_Weights.DEFAULT'}
+
+    def parameters(self):
+        """
+        :return: Dictionary of the parameters the metadata depends on
+        """
+        return dict(self.__parameters)
+
+    def export_model(self, model_file=None):
+        """
+        Save the model as a frozen TorchScript model, with its batch normalizations folded into the convolutions, for
+        the model_file argument of later instances. The top labels match the ones of the torchvision model, the
+        probabilities up to rounding
+        :param model_file: File path of the saved model
+        """
+        assert model_file is not None, "Must supply the model file path"
+        example = torch.zeros(1, 3, self.__image_size, self.__image_size)
+        with torch.no_grad():
+            model = self.__model if isinstance(self.__model, torch.jit.ScriptModule) else \
+                torch.jit.freeze(torch.jit.trace(self.__model, example))
+        atomic_write(model_file, lambda f: torch.jit.save(model, f))
 
     def __preprocess_image(self, img):
         image = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
@@ -35,22 +81,33 @@ class MetaData:
         return image
 
     def compute_metadata(self, img):
-        image = self.__preprocess_image(img)
-        image = torch.from_numpy(image)
-        image = image.to('cpu')
-        logits = self.__model(image)
-        probabilities = torch.nn.Softmax(dim=1)(logits)
-        sorted_probabilities = torch.argsort(probabilities, dim=1, descending=True)
-
-        labels = []
-        confidences = []
-        for (_, idx) in enumerate(sorted_probabilities[0, :5]):
-            _label = self.__imagenet_labels[idx.item()].strip()
-            _conf = float(probabilities[0, idx.item()])
-            labels.append(_label)
-            confidences.append(_conf)
-        results = {'labels': json.dumps(labels),
-                   'confidences': json.dumps(confidences),
-                   'num_labels': len(labels)}
-        return results
+        return self.compute_metadata_batch([img])[0]
 
+    def compute_metadata_batch(self, imgs=None, batch_size=None):
+        """
+        Compute the metadata of a list of images, running batch_size images per forward pass in inference mode
+        :param imgs: The input images
+        :param batch_size: Number of images per forward pass. Defaults to the batch size of the class
+        :return: List of the metadata results of each image
+        """
+        assert imgs is not None, "Must supply input images"
+        batch_size = self.__batch_size if batch_size is None else batch_size
+        assert batch_size > 0, "Batch size must be positive"
+
+        results = []
+        for start in range(0, len(imgs), batch_size):
+            images = np.concatenate([self.__preprocess_image(img) for img in imgs[start:start + batch_size]])
+            # No autograd graph is recorded for the forward pass
+            with torch.inference_mode():
+                images = torch.from_numpy(images).to('cpu')
+                logits = self.__model(images)
+                probabilities = torch.nn.Softmax(dim=1)(logits)
+                top_probabilities, top_indices = torch.topk(probabilities, self.__top_k, dim=1)
+
+            for image_probabilities, image_indices in zip(top_probabilities.tolist(), top_indices.tolist()):
+                labels = [self.__imagenet_labels[idx].strip() for idx in image_indices]
+                results.append({'labels': json.dumps(labels),
+                                'confidences': json.dumps(image_probabilities),
+                                'num_labels': len(labels),
+                                'skipped': False})
+        return results
@@ -6,12 +6,44 @@ The class will take an image as input and return the bounding boxes and labels f
 Based on code similar to here: https://opencv-tutorial.readthedocs.io/en/latest/yolo/yolo.html
 """
 
-import cv2
 import numpy as np
 import json
 from utils import load_label_map
 
 
+def decode_outputs(outs=None, img_width=None, img_height=None, confidence_threshold=None):
+    """
+    Decode the YOLO output layers of an image into the candidate boxes above the confidence threshold, with whole array
+    operations over the candidate rows of every layer
+    :param outs: The output layers of the image, each with one (center x, center y, width, height, objectness, class
+    scores) row per candidate
+    :param img_width: Width of the image in pixels
+    :param img_height: Height of the image in pixels
+    :param confidence_threshold: Candidates with a best class score at or below this threshold are discarded
+    :return: Lists of the class ids, confidences, and [x, y, right, bottom] boxes of the kept candidates
+    """
+    assert outs is not None, "Must supply the output layers"
+    assert img_width is not None and img_height is not None, "Must supply the image size"
+    assert confidence_threshold is not None, "Must supply the confidence threshold"
+    detections = np.concatenate([np.reshape(out, (-1, np.shape(out)[-1])) for out in outs])
+    scores = detections[:, 5:]
+    class_ids = np.argmax(scores, axis=1)
+    confidences = scores[np.arange(len(scores)), class_ids]
+    keep = confidences > confidence_threshold
+    detections, class_ids, confidences = detections[keep], class_ids[keep], confidences[keep]
+
+    # Truncate toward zero as int() does
+    center_x = (detections[:, 0] * img_width).astype(np.int64)
+    center_y = (detections[:, 1] * img_height).astype(np.int64)
+    width = (detections[:, 2] * img_width).astype(np.int64)
+    height = (detections[:, 3] * img_height).astype(np.int64)
+    left = (center_x - width / 2).astype(np.int64)
+    top = (center_y - height / 2).astype(np.int64)
+    # Prevent negative coords
+    boxes = np.maximum(np.stack([left, top, left + width, top + height], axis=1), 0)
+    return class_ids.tolist(), confidences.tolist(), boxes.tolist()
+
+
 class YoloObjectDetection:
     def __init__(self,
                  model_file='./input/models/yolo/yolov3.cfg',
@@ -20,8 +52,11 @@ class YoloObjectDetection:
                  box_confidence_threshold=0.79,
                  nms_threshold=0.4,
                  input_width=416,
-                 input_height=416
+                 input_height=416,
+                 batch_size=8
                  ):
+        # OpenCV is only loaded with the detector, so importing the module stays light
+        import cv2
         self.__yolo_model = cv2.dnn.readNetFromDarknet(model_file, weights_file)
         self.__yolo_model.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
 
@@ -33,8 +68,18 @@ class YoloObjectDetection:
         self.__nms_threshold = nms_threshold
         self.__input_width = input_width
         self.__input_height = input_height
+        self.__batch_size = batch_size
 
         self.__labels_dict = load_label_map(labels_file)
+        self.__parameters = {'model_file': model_file, 'weights_file': weights_file, 'labels_file': labels_file,
+                             'box_confidence_threshold': box_confidence_threshold, 'nms_threshold': nms_threshold,
+                             'input_width': input_width, 'input_height': input_height}
+
+    def parameters(self):
+        """
+        :return: Dictionary of the parameters the detections depend on
+        """
+        return dict(self.__parameters)
 
     def compute_detections(self, image=None, image_key=None):
         """
@@ -45,43 +90,60 @@ class YoloObjectDetection:
         """
         assert image is not None, "Must supply input image"
         assert image_key is not None, "Must supply image key for future lookup. Usually relative path of the image"
+        import cv2
 
         blob = cv2.dnn.blobFromImage(image, 1/255, (self.__input_width, self.__input_height), [0, 0, 0], 1, crop=False)
         self.__yolo_model.setInput(blob)
         outs = self.__yolo_model.forward(self.__layer_names)
+        return self.__decode_detections(outs, image, image_key)
 
+    def compute_detections_batch(self, images=None, image_keys=None, batch_size=None):
+        """
+        Perform YOLOv3 object detection on a list of images, running batch_size images per forward pass
+        :param images: The input images to process
+        :param image_keys: The lookup keys of the returned results. Usually the image paths
+        :param batch_size: Number of images per forward pass. Defaults to the batch size of the class
+        :return: List of the (image key, object detection results) of each input image
+        """
+        assert images is not None, "Must supply input images"
+        assert image_keys is not None, "Must supply image keys for future lookup. Usually relative paths of the images"
+        assert len(images) == len(image_keys), "Must supply one image key per image"
+        batch_size = self.__batch_size if batch_size is None else batch_size
+        assert batch_size > 0, "Batch size must be positive"
+        import cv2
+
+        results = []
+        for start in range(0, len(images), batch_size):
+            batch_images = images[start:start + batch_size]
+            blob = cv2.dnn.blobFromImages(batch_images, 1/255, (self.__input_width, self.__input_height), [0, 0, 0],
+                                          1, crop=False)
+            self.__yolo_model.setInput(blob)
+            outs = self.__yolo_model.forward(self.__layer_names)
+            # The output layers hold the rows of every image, either stacked along a batch axis or concatenated
+            outs = [out.reshape(len(batch_images), -1, out.shape[-1]) for out in outs]
+            for i, (image, image_key) in enumerate(zip(batch_images, image_keys[start:start + batch_size])):
+                results.append(self.__decode_detections([out[i] for out in outs], image, image_key))
+        return results
+
+    def __decode_detections(self, outs=None, image=None, image_key=None):
+        """
+        Convert the output layers of the forward pass of an image into object detection results
+        :param outs: The output layers of the image
+        :param image: The input image
+        :param image_key: A lookup key for the returned results
+        :return: Dictionary containing the object detection results for the input image
+        """
         img_height = image.shape[0]
         img_width = image.shape[1]
 
-        class_ids = []
-        confidences = []
-        boxes = []
+        class_ids, confidences, boxes = decode_outputs(outs, img_width, img_height, self.__box_confidence_threshold)
 
         json_boxes = []
         json_labels = []
         json_confidences = []
 
-        for out in outs:
-            for detection in out:
-                scores = detection[5:]
-                class_id = np.argmax(scores)
-                confidence = scores[class_id]
-                if confidence > self.__box_confidence_threshold:
-                    center_x = int(detection[0] * img_width)
-                    center_y = int(detection[1] * img_height)
-                    width = int(detection[2] * img_width)
-                    height = int(detection[3] * img_height)
-                    left = int(center_x - width / 2)
-                    top = int(center_y - height / 2)
-                    class_ids.append(class_id)
-                    confidences.append(float(confidence))
-                    # Prevent negative coords
-                    x = max(0, left)
-                    y = max(0, top)
-                    right = max(0, (left + width))
-                    bottom = max(0, (top + height))
-                    boxes.append([x, y, right, bottom])
         # Perform NMS to eliminate redundant overlapping bounding boxes with lower confidences
+        import cv2
         indices = cv2.dnn.NMSBoxes(boxes, confidences, self.__box_confidence_threshold, self.__nms_threshold)
         obj_labels = {}
         for idx in indices:
@@ -0,0 +1,152 @@
+"""
+This class implements a pipelined executor for multi-stage image processing.
+Each stage runs in its own worker threads, and consecutive stages are connected by bounded queues. A full queue blocks
+the stage feeding it, so a slow stage holds back the ones before it instead of letting the results pile up in memory.
+The stages overlap on different images: image N+1 can be in object detection while image N is in the spatial
+relationships stage.
+"""
+import queue
+import threading
+
+# Marks the end of the input items in the queues
+_END = object()
+# Handling of the items failing in a stage: raise the error when the item is reached, or skip the item
+ON_ERROR_MODES = ('raise', 'skip')
+
+
+class _StageError:
+    def __init__(self, stage_name, error, item=None):
+        """
+        Carries the exception raised by a stage for an item down the pipeline
+        :param stage_name: Name of the stage that raised the exception
+        :param error: The raised exception
+        :param item: The input of the stage that raised the exception, None when the input item could not be produced
+        """
+        self.stage_name = stage_name
+        self.error = error
+        self.item = item
+
+
+class StagePipeline:
+    def __init__(self, stages=None, queue_size=4):
+        """
+        Construct the pipeline
+        :param stages: List of (name, function, num_workers) stages, in order. Each function takes the output of the
+        previous stage and returns the input of the next one. Stages with several workers must be thread safe
+        :param queue_size: Maximum number of items waiting in the queue in front of each stage
+        """
+        assert stages, "Must supply the pipeline stages"
+        assert queue_size > 0, "Queue size must be positive"
+        for name, function, num_workers in stages:
+            assert callable(function), f"Stage {name} must be callable"
+            assert num_workers > 0, f"Stage {name} must have at least one worker"
+        self.__stages = list(stages)
+        self.__queue_size = queue_size
+        self.__failures = []
+
+    def __run_stage(self, name, function, in_queue, out_queue, num_next_workers, stage_state, cancelled):
+        """
+        Worker loop of a stage. Items carry their input index, so the outputs can be put back in order. The last worker
+        of the stage to finish puts one end marker per worker of the next stage
+        """
+        while True:
+            item = in_queue.get()
+            if item is _END:
+                break
+            index, value = item
+            # Once cancelled, the items are only passed along to empty the queues
+            if not isinstance(value, _StageError) and not cancelled.is_set():
+                try:
+                    value = function(value)
+                except Exception as e:
+                    value = _StageError(name, e, value)
+            out_queue.put((index, value))
+        with stage_state['lock']:
+            stage_state['running'] -= 1
+            if stage_state['running'] == 0:
+                for _ in range(num_next_workers):
+                    out_queue.put(_END)
+
+    @staticmethod
+    def __feed(items, in_queue, num_workers, cancelled):
+        """
+        Put the input items in the first queue, then one end marker per worker of the first stage
+        """
+        index = 0
+        try:
+            for value in items:
+                if cancelled.is_set():
+                    break
+                in_queue.put((index, value))
+                index += 1
+        except Exception as e:
+            # The item that could not be produced fails in place of its output
+            in_queue.put((index, _StageError('input', e)))
+        finally:
+            for _ in range(num_workers):
+                in_queue.put(_END)
+
+    def failures(self):
+        """
+        :return: List of the (item index, stage name, stage input, exception) of the items skipped by the current or
+        last run, in the order of the items
+        """
+        return list(self.__failures)
+
+    def run(self, items=None, on_error='raise'):
+        """
+        Run the items through the pipeline
+        :param items: Iterable of the inputs of the first stage. It is consumed as the pipeline makes room for them
+        :param on_error: 'raise' raises the exception of a stage for an item, as a RuntimeError, when its output is
+        reached, and stops the run. 'skip' records the failure of the item in failures() and goes on with the next
+        items. Default 'raise'
+        :return: Generator of the outputs of the last stage, in the order of the items
+        """
+        assert items is not None, "Must supply the pipeline items"
+        assert on_error in ON_ERROR_MODES, f"Error handling must be one of {ON_ERROR_MODES}"
+        self.__failures = []
+        cancelled = threading.Event()
+        queues = [queue.Queue(maxsize=self.__queue_size) for _ in range(len(self.__stages) + 1)]
+        threads = [threading.Thread(target=self.__feed, args=(items, queues[0], self.__stages[0][2], cancelled),
+                                    daemon=True)]
+        for i, (name, function, num_workers) in enumerate(self.__stages):
+            # The collector of the outputs counts as the single worker after the last stage
+            num_next_workers = self.__stages[i + 1][2] if i + 1 < len(self.__stages) else 1
+            stage_state = {'lock': threading.Lock(), 'running': num_workers}
+            for _ in range(num_workers):
+                threads.append(threading.Thread(target=self.__run_stage,
+                                                args=(name, function, queues[i], queues[i + 1], num_next_workers,
+                                                      stage_state, cancelled),
+                                                daemon=True))
+        for thread in threads:
+            thread.start()
+
+        out_queue = queues[-1]
+        item = None
+        pending = {}
+        next_index = 0
+        try:
+            while True:
+                item = out_queue.get()
+                if item is _END:
+                    break
+                index, value = item
+                pending[index] = value
+                # Yield the outputs in input order, buffering the ones that arrive early
+                while next_index in pending:
+                    value = pending.pop(next_index)
+                    next_index += 1
+                    if isinstance(value, _StageError):
+                        if on_error == 'raise':
+                            raise RuntimeError(f"Stage {value.stage_name} failed on item {next_index - 1}") \
+                                from value.error
+                        self.__failures.append((next_index - 1, value.stage_name, value.item, value.error))
+                        continue
+                    yield value
+        finally:
+            # Stop feeding the pipeline when it fails or the caller stops early, and let the items in flight drain
+            cancelled.set()
+            while item is not _END:
+                item = out_queue.get()
+            for thread in threads:
+                thread.join()
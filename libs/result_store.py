@@ -0,0 +1,257 @@
+"""
+This module implements the result stores of the scene labeling system.
+A ResultStore keeps the results of the processed images in memory, in least recently used order. When it holds more
+results than its count or byte limit, the least recently used results are evicted to its spill store, and loaded back
+into memory when they are accessed again. Without a spill store, the evicted results are discarded.
+DiskResultStore is the spill store saving each result to a pickle file of a directory.
+ResultsView is a read-only mapping of one of the results of each image of a store, read on access, so all the results
+can be read without loading the spilled ones back into memory at once.
+"""
+from collections import OrderedDict
+from collections.abc import Mapping
+import hashlib
+import os
+import pickle
+import shutil
+import tempfile
+import weakref
+from utils import atomic_write
+
+# First object of each result file, followed by the key of the result then the result itself, so the keys of the files
+# left in a directory are read without their results
+RESULT_FILE_HEADER = 'scene_labeling_result_v2'
+
+
+class DiskResultStore:
+    def __init__(self, directory=None):
+        """
+        Construct the on-disk store
+        :param directory: Directory of the result files, created if needed. The results left in it are kept, and the
+        unreadable files are skipped. Defaults to a new temporary directory, removed with its files by close or when
+        the store is garbage collected
+        """
+        if directory is None:
+            directory = tempfile.mkdtemp(prefix='scene_labeling_results_')
+            self.__finalizer = weakref.finalize(self, shutil.rmtree, directory, ignore_errors=True)
+        else:
+            self.__finalizer = None
+        os.makedirs(directory, exist_ok=True)
+        self.__directory = directory
+        # Keys of the stored results, including the ones left in the directory. The file names are hashes of the keys
+        self.__keys = {}
+        for f in sorted(os.listdir(directory)):
+            if f.endswith('.pkl'):
+                key = self.__read_key(os.path.join(directory, f))
+                if key is not None:
+                    self.__keys[key] = None
+
+    @property
+    def directory(self):
+        return self.__directory
+
+    def close(self):
+        """
+        Remove the temporary directory of the store with its results. The directories supplied by the caller are kept
+        """
+        if self.__finalizer is not None:
+            self.__finalizer()
+            self.__keys = {}
+
+    def __path(self, key):
+        return os.path.join(self.__directory, hashlib.sha1(repr(key).encode('utf-8')).hexdigest() + '.pkl')
+
+    @staticmethod
+    def __read_key(path):
+        """
+        Read the key of a result file, without its result
+        :return: The key, None for the unreadable files and the files of other formats
+        """
+        try:
+            with open(path, 'rb') as rf:
+                if pickle.load(rf) != RESULT_FILE_HEADER:
+                    return None
+                return pickle.load(rf)
+        except (OSError, pickle.UnpicklingError, EOFError, ValueError, TypeError, AttributeError, ImportError):
+            return None
+
+    def __setitem__(self, key, value):
+        def write(wf):
+            for obj in (RESULT_FILE_HEADER, key, value):
+                pickle.dump(obj, wf, protocol=pickle.HIGHEST_PROTOCOL)
+
+        atomic_write(self.__path(key), write)
+        self.__keys[key] = None
+
+    def __getitem__(self, key):
+        if key not in self.__keys:
+            raise KeyError(key)
+        with open(self.__path(key), 'rb') as rf:
+            pickle.load(rf)
+            pickle.load(rf)
+            return pickle.load(rf)
+
+    def __delitem__(self, key):
+        if key not in self.__keys:
+            raise KeyError(key)
+        os.remove(self.__path(key))
+        del self.__keys[key]
+
+    def __contains__(self, key):
+        return key in self.__keys
+
+    def __len__(self):
+        return len(self.__keys)
+
+    def keys(self):
+        return list(self.__keys)
+
+    def pop(self, key):
+        value = self[key]
+        del self[key]
+        return value
+
+
+class ResultStore:
+    def __init__(self, max_items=None, max_bytes=None, spill_store=None):
+        """
+        Construct the result store
+        :param max_items: Maximum number of results kept in memory. Default None, no limit
+        :param max_bytes: Maximum size in bytes of the results kept in memory, measured by their pickled size. Default
+        None, no limit
+        :param spill_store: Store receiving the evicted results, such as a DiskResultStore. It must support item
+        access, deletion, membership, len, keys, and pop. Default None, the evicted results are discarded
+        """
+        assert max_items is None or max_items > 0, "Maximum number of results must be positive"
+        assert max_bytes is None or max_bytes > 0, "Maximum size of the results must be positive"
+        self.__max_items = max_items
+        self.__max_bytes = max_bytes
+        self.__spill_store = spill_store
+        # In memory results, from least to most recently used, and their sizes when a byte limit is set
+        self.__results = OrderedDict()
+        self.__sizes = {}
+        self.__num_bytes = 0
+        self.__num_evicted = 0
+        self.__num_loaded = 0
+
+    def __setitem__(self, key, value):
+        if key in self.__results:
+            self.__remove(key)
+        elif self.__spill_store is not None and key in self.__spill_store:
+            del self.__spill_store[key]
+        self.__add(key, value)
+        self.__evict()
+
+    def __getitem__(self, key):
+        if key in self.__results:
+            self.__results.move_to_end(key)
+            return self.__results[key]
+        if self.__spill_store is None or key not in self.__spill_store:
+            raise KeyError(key)
+        # Load the spilled result back as the most recently used one
+        value = self.__spill_store.pop(key)
+        self.__num_loaded += 1
+        self.__add(key, value)
+        self.__evict()
+        return value
+
+    def __delitem__(self, key):
+        self.pop(key)
+
+    def __contains__(self, key):
+        return key in self.__results or (self.__spill_store is not None and key in self.__spill_store)
+
+    def __len__(self):
+        return len(self.__results) + (len(self.__spill_store) if self.__spill_store is not None else 0)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def keys(self):
+        """
+        :return: List of the keys of the spilled results, then of the in memory results from least to most recently
+        used
+        """
+        spilled = self.__spill_store.keys() if self.__spill_store is not None else []
+        return [k for k in spilled if k not in self.__results] + list(self.__results)
+
+    def pop(self, key):
+        """
+        Remove a result from the store, in memory or spilled, and return it
+        """
+        if key in self.__results:
+            return self.__remove(key)
+        if self.__spill_store is None or key not in self.__spill_store:
+            raise KeyError(key)
+        return self.__spill_store.pop(key)
+
+    def peek(self, key):
+        """
+        Read a result, in memory or spilled, without changing the recently used order or loading it back into memory
+        """
+        if key in self.__results:
+            return self.__results[key]
+        if self.__spill_store is None or key not in self.__spill_store:
+            raise KeyError(key)
+        return self.__spill_store[key]
+
+    def stats(self):
+        """
+        :return: Dictionary of the numbers of in memory and spilled results, the in memory size in bytes when a byte
+        limit is set, and the numbers of evicted and loaded back results
+        """
+        return {'in_memory': len(self.__results),
+                'spilled': len(self.__spill_store) if self.__spill_store is not None else 0,
+                'in_memory_bytes': self.__num_bytes, 'evicted': self.__num_evicted, 'loaded': self.__num_loaded}
+
+    def __add(self, key, value):
+        self.__results[key] = value
+        if self.__max_bytes is not None:
+            size = len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+            self.__sizes[key] = size
+            self.__num_bytes += size
+
+    def __remove(self, key):
+        self.__num_bytes -= self.__sizes.pop(key, 0)
+        return self.__results.pop(key)
+
+    def __evict(self):
+        """
+        Evict the least recently used results until the store is within its limits. The most recently used result is
+        kept in memory even if it exceeds the byte limit on its own
+        """
+        while len(self.__results) > 1 and self.__over_limit():
+            key, value = self.__results.popitem(last=False)
+            self.__num_bytes -= self.__sizes.pop(key, 0)
+            self.__num_evicted += 1
+            if self.__spill_store is not None:
+                self.__spill_store[key] = value
+
+    def __over_limit(self):
+        return (self.__max_items is not None and len(self.__results) > self.__max_items) or \
+            (self.__max_bytes is not None and self.__num_bytes > self.__max_bytes)
+
+
+class ResultsView(Mapping):
+    def __init__(self, store=None, index=None):
+        """
+        Read-only mapping of one of the results of each image of a store, read with peek on access
+        :param store: The ResultStore
+        :param index: Index of the result in the (object detections, metadata, annotations) of each image. Default
+        None, the whole results
+        """
+        assert store is not None, "Must supply the result store"
+        self.__store = store
+        self.__index = index
+
+    def __getitem__(self, key):
+        results = self.__store.peek(key)
+        return results if self.__index is None else results[self.__index]
+
+    def __contains__(self, key):
+        return key in self.__store
+
+    def __iter__(self):
+        return iter(self.__store.keys())
+
+    def __len__(self):
+        return len(self.__store)
@@ -0,0 +1,87 @@
+"""
+This module saves and restores the warm-start snapshot of the scene labeling system.
+The snapshot holds the fully built state of the system that does not depend on the neural network models: the spatial
+relationship system with its animate object list, and the general and person domain rule bases with their fuzzy control
+systems, compiled surfaces, and ontology table. It is a pickle file in a cache directory, stored with a fingerprint of
+the settings, the data files, and the source code the state was built from, and is rebuilt when any of them change.
+The directory also holds the optimized artifacts of the models, such as the frozen TorchScript metadata model.
+"""
+import glob
+import hashlib
+import os
+import pickle
+from utils import atomic_write
+
+# Version of the snapshot file format
+SNAPSHOT_VERSION = 1
+STATE_FILE = 'state.pkl'
+METADATA_MODEL_FILE = 'resnet50.torchscript.pt'
+# Source files whose code builds the state of the snapshot
+SOURCE_FILES = sorted(glob.glob(os.path.join(os.path.dirname(__file__), 'annotation', '**', '*.py'), recursive=True)
+                      + [os.path.join(os.path.dirname(__file__), name)
+                         for name in ['spatial_relationships.py', 'tuple_records.py']])
+
+
+def snapshot_fingerprint(settings=None, data_files=None):
+    """
+    Fingerprint of the state of a snapshot
+    :param settings: Dictionary of the settings the state is built with
+    :param data_files: File paths of the data files the state is built from
+    :return: Hash of the snapshot version, settings, and contents of the data files and source files
+    """
+    assert settings is not None, "Must supply the settings"
+    assert data_files is not None, "Must supply the data files"
+    digest = hashlib.sha1(repr((SNAPSHOT_VERSION, sorted(settings.items()))).encode('utf-8'))
+    for file_path in list(data_files) + SOURCE_FILES:
+        with open(file_path, 'rb') as f:
+            digest.update(hashlib.sha1(f.read()).digest())
+    return digest.hexdigest()
+
+
+def snapshot_path(snapshot_dir=None, file_name=STATE_FILE):
+    """
+    :param snapshot_dir: Directory of the snapshot
+    :param file_name: Name of a file of the snapshot. Defaults to the state file
+    :return: File path of the file in the snapshot directory
+    """
+    assert snapshot_dir is not None, "Must supply the snapshot directory"
+    return os.path.join(snapshot_dir, file_name)
+
+
+def load_snapshot(snapshot_dir=None, fingerprint=None):
+    """
+    Load the state of a snapshot
+    :param snapshot_dir: Directory of the snapshot
+    :param fingerprint: Fingerprint of the expected state, from snapshot_fingerprint
+    :return: Dictionary of the state objects keyed by name, None when the snapshot is missing, unreadable, or was built
+    with another fingerprint
+    """
+    assert fingerprint is not None, "Must supply the snapshot fingerprint"
+    try:
+        with open(snapshot_path(snapshot_dir), 'rb') as f:
+            version, state_fingerprint, state = pickle.load(f)
+        if version == SNAPSHOT_VERSION and state_fingerprint == fingerprint:
+            return state
+    except (OSError, pickle.UnpicklingError, EOFError, ValueError, TypeError, AttributeError, ImportError):
+        pass  # Missing, unreadable, or stale snapshot
+    return None
+
+
+def save_snapshot(snapshot_dir=None, fingerprint=None, state=None):
+    """
+    Save the state of a snapshot, replacing the previous one
+    :param snapshot_dir: Directory of the snapshot, created if needed
+    :param fingerprint: Fingerprint of the state, from snapshot_fingerprint
+    :param state: Dictionary of the state objects keyed by name
+    :return: True if the snapshot was written, False when the directory is not writable
+    """
+    assert fingerprint is not None, "Must supply the snapshot fingerprint"
+    assert state is not None, "Must supply the snapshot state"
+    state_file = snapshot_path(snapshot_dir)
+    try:
+        os.makedirs(snapshot_dir, exist_ok=True)
+        atomic_write(state_file, lambda f: pickle.dump((SNAPSHOT_VERSION, fingerprint, state), f,
+                                                       protocol=pickle.HIGHEST_PROTOCOL))
+    except OSError:
+        return False
+    return True
@@ -2,15 +2,14 @@
 This class will compute the proximity and overlap between an object tuple using GIOU.
 Additionally, the cardinal direction will be computed using the HOF algorithm.
 """
+from collections import OrderedDict
+import csv
 import json
-import pandas as pd
 import numpy as np
-import skfuzzy as fuzz
-from skfuzzy import control as ctrl
-from sklearn.preprocessing import minmax_scale
 import hofpy
-from utils import convert_boxes, get_image_tuples, convert_meta_labels
-import cv2
+from utils import convert_boxes, get_image_tuples, convert_meta_labels, SKIPPED_METADATA_LABEL
+from libs.annotation.ontology import NA_VALUES
+from libs.tuple_records import ImageTuples, tuple_column, tuple_geometry_keys
 
 
 def compute_giou(arg_box=None, ref_box=None):
@@ -58,29 +57,192 @@ def compute_giou(arg_box=None, ref_box=None):
     return GIoU, IoU
 
 
-def compute_hof(arg_object=None, ref_object=None, num_directions=360):
+def compute_giou_batch(boxes=None, pairs=None):
+    """
+    Compute the GIOU and IOU of object tuples at once, with the arithmetic of compute_giou
+    :param boxes: The [x1, y1, x2, y2] bounding boxes of the objects of the image
+    :param pairs: The (argument, referrant) indices into boxes of each object tuple
+    :return: Arrays of the GIOU and IOU of each tuple
+    """
+    assert boxes is not None, "Must supply the image boxes"
+    assert pairs is not None, "Must supply the object tuples"
+    boxes = np.asarray(boxes, dtype=np.int64).reshape(-1, 4)
+    pairs = np.asarray(pairs, dtype=np.int64).reshape(-1, 2)
+    arg_boxes = boxes[pairs[:, 0]]
+    ref_boxes = boxes[pairs[:, 1]]
+    area_arg_obj = (arg_boxes[:, 2] - arg_boxes[:, 0]) * (arg_boxes[:, 3] - arg_boxes[:, 1])
+    area_ref_obj = (ref_boxes[:, 2] - ref_boxes[:, 0]) * (ref_boxes[:, 3] - ref_boxes[:, 1])
+    x_1_I = np.maximum(arg_boxes[:, 0], ref_boxes[:, 0])
+    x_2_I = np.minimum(arg_boxes[:, 2], ref_boxes[:, 2])
+    y_1_I = np.maximum(arg_boxes[:, 1], ref_boxes[:, 1])
+    y_2_I = np.minimum(arg_boxes[:, 3], ref_boxes[:, 3])
+    I = np.where((x_2_I > x_1_I) & (y_2_I > y_1_I), (x_2_I - x_1_I) * (y_2_I - y_1_I), 0)
+    area_b_c = (np.maximum(arg_boxes[:, 2], ref_boxes[:, 2]) - np.minimum(arg_boxes[:, 0], ref_boxes[:, 0])) * \
+               (np.maximum(arg_boxes[:, 3], ref_boxes[:, 3]) - np.minimum(arg_boxes[:, 1], ref_boxes[:, 1]))
+    U = area_arg_obj + area_ref_obj - I
+    IoU = I / U
+    GIoU = IoU - ((area_b_c - U) / area_b_c)
+    return GIoU, IoU
+
+
+def compute_center_angles(boxes=None, pairs=None, num_directions=360):
+    """
+    Direction of the argument box center from the referrant box center of object tuples, in HOF direction units
+    counter-clockwise from the right with the image y axis pointing down. For objects far apart it is within a few
+    degrees of the HOF max angles
+    :param boxes: The [x1, y1, x2, y2] bounding boxes of the objects of the image
+    :param pairs: The (argument, referrant) indices into boxes of each object tuple
+    :param num_directions: The number of HOF directions (default 360)
+    :return: Array of the direction of each tuple, rounded to the nearest HOF direction
+    """
+    assert boxes is not None, "Must supply the image boxes"
+    assert pairs is not None, "Must supply the object tuples"
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    pairs = np.asarray(pairs, dtype=np.int64).reshape(-1, 2)
+    centers = (boxes[:, :2] + boxes[:, 2:]) / 2
+    offsets = centers[pairs[:, 0]] - centers[pairs[:, 1]]
+    angles = np.arctan2(-offsets[:, 1], offsets[:, 0]) * num_directions / (2 * np.pi)
+    return np.round(angles).astype(np.int64) % num_directions
+
+
+def create_box_mask(box=None, img_height=None, img_width=None, origin=(0, 0)):
+    """
+    Create the binary mask image of a bounding box for use with the raster HOF
+    :param box: The [x1, y1, x2, y2] bounding box of the object
+    :param img_height: Height of the image the box belongs to
+    :param img_width: Width of the image the box belongs to
+    :param origin: (x, y) position in the image of the mask's top left pixel (default (0, 0))
+    :return: A uint8 image set to 255 inside the box
+    """
+    assert box is not None, "Must supply a bounding box"
+    mask = np.zeros((img_height, img_width), dtype='uint8')
+    x1, y1 = max(box[0] - origin[0], 0), max(box[1] - origin[1], 0)
+    mask[y1:box[3] - origin[1], x1:box[2] - origin[0]] = 255
+    return mask
+
+
+def create_roi_masks(arg_box=None, ref_box=None, img_height=None, img_width=None):
+    """
+    Create the binary mask images of an object tuple cropped to the union of their bounding boxes
+    :param arg_box: The [x1, y1, x2, y2] bounding box of the argument object
+    :param ref_box: The [x1, y1, x2, y2] bounding box of the referrant object
+    :param img_height: Height of the image the boxes belong to
+    :param img_width: Width of the image the boxes belong to
+    :return: The cropped argument and referrant masks, and the (x, y) position of the crop in the image
+    """
+    assert arg_box is not None, "Must supply argument image box"
+    assert ref_box is not None, "Must supply referrant image box"
+    x1 = max(min(arg_box[0], ref_box[0]), 0)
+    y1 = max(min(arg_box[1], ref_box[1]), 0)
+    x2 = max(min(max(arg_box[2], ref_box[2]), img_width), x1)
+    y2 = max(min(max(arg_box[3], ref_box[3]), img_height), y1)
+    arg_mask = create_box_mask(arg_box, y2 - y1, x2 - x1, origin=(x1, y1))
+    ref_mask = create_box_mask(ref_box, y2 - y1, x2 - x1, origin=(x1, y1))
+    return arg_mask, ref_mask, (x1, y1)
+
+
+def compute_hof_histograms(arg_object=None, ref_object=None, num_directions=360, img_shape=None, roi_origin=None):
+    """
+    Compute the F0, F2, and Hybrid histograms of forces for an object tuple
+    :param arg_object: A binary mask image representing the argument object, or its [x1, y1, x2, y2] bounding box
+    :param ref_object: A binary mask image representing the referrant object, or its [x1, y1, x2, y2] bounding box
+    :param num_directions: The number of histogram of forces directions to compute (default 360)
+    :param img_shape: (height, width) of the image the objects belong to. When supplied without roi_origin the
+    objects are bounding boxes and the histograms are computed directly from them without building mask images
+    :param roi_origin: (x, y) position in the image of masks cropped around the objects. The histograms are the ones
+    of the full image masks, at a cost that depends on the size of the crop
+    :return: The F0, F2, and Hybrid histograms
+    """
+    assert arg_object is not None, "Must supply argument object"
+    assert ref_object is not None, "Must supply referrant object"
+    if img_shape is None:
+        # One sweep over the images for the three force types
+        f0, f2, hybrid = np.nan_to_num(hofpy.MultiHist(arg_object, ref_object, forces=[0, 2, 'hybrid'],
+                                                       numberDirections=num_directions))
+        return f0, f2, hybrid
+
+    img_height, img_width = img_shape[0], img_shape[1]
+    if roi_origin is not None:
+        roi_x, roi_y = int(roi_origin[0]), int(roi_origin[1])
+        f0, f2, hybrid = np.nan_to_num(hofpy.MultiHistROI(arg_object, ref_object, roi_x, roi_y, img_width, img_height,
+                                                          forces=[0, 2, 'hybrid'], numberDirections=num_directions))
+        return f0, f2, hybrid
+
+    arg_box = [int(c) for c in arg_object]
+    ref_box = [int(c) for c in ref_object]
+    f0, f2, hybrid = np.nan_to_num(hofpy.MultiBoxHist(arg_box, ref_box, img_width, img_height,
+                                                      forces=[0, 2, 'hybrid'], numberDirections=num_directions))
+    return f0, f2, hybrid
+
+
+def compute_hof(arg_object=None, ref_object=None, num_directions=360, img_shape=None, roi_origin=None, coarse_step=0,
+                tolerance=0.1):
     """
         Compute HOF for an object tuple and return the max angles for F0, F2, and Hybrid
-        :param arg_object: A binary mask image representing the argument object
-        :param ref_object: A binary mask image representing the referrant object
+        :param arg_object: A binary mask image representing the argument object, or its bounding box
+        :param ref_object: A binary mask image representing the referrant object, or its bounding box
         :param num_directions: The number of histogram of forces directions to compute (default 360)
+        :param img_shape: (height, width) of the image when the objects are given as bounding boxes or cropped masks
+        :param roi_origin: (x, y) position in the image of cropped masks
+        :param coarse_step: Find the max angles with a coarse-to-fine search that computes one direction out of
+        coarse_step before refining around the best ones, instead of computing the full histograms (default 0, full
+        histograms). num_directions must be a multiple of 4
+        :param tolerance: Directions around coarse values within this fraction of the best one are refined
+        (default 0.1). Higher is slower and closer to the full histogram angles, 1 always gives them
         :return: The maximum F0, F2, and Hybrid HOF angles
         """
-    assert arg_object is not None, "Must supply argument image"
-    assert ref_object is not None, "Must supply referrant image"
-    f0 = hofpy.F0Hist(arg_object, ref_object, numberDirections=num_directions)
-    f2 = hofpy.F2Hist(arg_object, ref_object, numberDirections=num_directions)
-    hybrid = hofpy.F02Hist(arg_object, ref_object, numberDirections=num_directions)
-
-    f0 = np.nan_to_num(f0)
-    f2 = np.nan_to_num(f2)
-    hybrid = np.nan_to_num(hybrid)
+    if coarse_step:
+        assert arg_object is not None, "Must supply argument object"
+        assert ref_object is not None, "Must supply referrant object"
+        search = dict(forces=[0, 2, 'hybrid'], numberDirections=num_directions, coarseStep=coarse_step,
+                      tolerance=tolerance)
+        if img_shape is None:
+            max_f0_angle, max_f2_angle, max_hybrid_angle = hofpy.MultiArgMax(arg_object, ref_object, **search)
+        elif roi_origin is not None:
+            max_f0_angle, max_f2_angle, max_hybrid_angle = hofpy.MultiArgMaxROI(
+                arg_object, ref_object, int(roi_origin[0]), int(roi_origin[1]), img_shape[1], img_shape[0], **search)
+        else:
+            max_f0_angle, max_f2_angle, max_hybrid_angle = hofpy.MultiBoxArgMax(
+                [int(c) for c in arg_object], [int(c) for c in ref_object], img_shape[1], img_shape[0], **search)
+        return max_f0_angle, max_f2_angle, max_hybrid_angle
+
+    f0, f2, hybrid = compute_hof_histograms(arg_object, ref_object, num_directions, img_shape, roi_origin)
     max_f0_angle = np.argmax(f0)
     max_f2_angle = np.argmax(f2)
     max_hybrid_angle = np.argmax(hybrid)
     return max_f0_angle, max_f2_angle, max_hybrid_angle
 
 
+def compute_hof_batch(boxes=None, pairs=None, img_shape=None, num_directions=360, num_threads=0, coarse_step=0,
+                      tolerance=0.1):
+    """
+    Compute HOF for all the object tuples of an image at once and return their max angles for F0, F2, and Hybrid.
+    The tuples are shared between threads in hofpy
+    :param boxes: The [x1, y1, x2, y2] bounding boxes of the objects of the image
+    :param pairs: The (argument, referrant) indices into boxes of each object tuple
+    :param img_shape: (height, width) of the image the boxes belong to
+    :param num_directions: The number of histogram of forces directions to compute (default 360)
+    :param num_threads: The number of threads used by hofpy (default 0, one per core)
+    :param coarse_step: Find the max angles with a coarse-to-fine search instead of computing the full histograms
+    (default 0, full histograms), see compute_hof
+    :param tolerance: Refinement tolerance of the coarse-to-fine search (default 0.1), see compute_hof
+    :return: An array with the maximum F0, F2, and Hybrid HOF angles of each tuple
+    """
+    assert boxes is not None, "Must supply the image boxes"
+    assert pairs is not None, "Must supply the object tuples"
+    assert img_shape is not None, "Must supply the image shape"
+    boxes = np.asarray(boxes, dtype=np.int32).reshape(-1, 4)
+    pairs = np.asarray(pairs, dtype=np.int32).reshape(-1, 2)
+    if coarse_step:
+        return hofpy.MultiBoxArgMaxBatch(boxes, pairs, img_shape[1], img_shape[0], forces=[0, 2, 'hybrid'],
+                                         numberDirections=num_directions, coarseStep=coarse_step,
+                                         tolerance=tolerance, numberThreads=num_threads)
+    histograms = np.nan_to_num(hofpy.MultiBoxHistBatch(boxes, pairs, img_shape[1], img_shape[0],
+                                                       forces=[0, 2, 'hybrid'], numberDirections=num_directions,
+                                                       numberThreads=num_threads))
+    return np.argmax(histograms, axis=2)
+
+
 def compute_hof_display(arg_object=None, ref_object=None, num_directions=360):
     """
     Compute HOF for an object two-tuple and return the histograms for display
@@ -91,12 +253,9 @@ def compute_hof_display(arg_object=None, ref_object=None, num_directions=360):
     """
     assert arg_object is not None, "Must supply the argument mask image"
     assert ref_object is not None, "Must supply the referrant mask image"
-    f0 = hofpy.F0Hist(arg_object, ref_object, numberDirections=num_directions)
-    f2 = hofpy.F2Hist(arg_object, ref_object, numberDirections=num_directions)
-    hybrid = hofpy.F02Hist(arg_object, ref_object, numberDirections=num_directions)
-    f0 = np.nan_to_num(f0)
-    f2 = np.nan_to_num(f2)
-    hybrid = np.nan_to_num(hybrid)
+    # scikit-learn is only needed for the display histograms
+    from sklearn.preprocessing import minmax_scale
+    f0, f2, hybrid = compute_hof_histograms(arg_object, ref_object, num_directions=num_directions)
     f0_histograms = minmax_scale(f0, feature_range=(0, 100))
     f2_histograms = minmax_scale(f2, feature_range=(0, 100))
     hyb_histograms = minmax_scale(hybrid, feature_range=(0, 100))
@@ -106,6 +265,9 @@ def compute_hof_display(arg_object=None, ref_object=None, num_directions=360):
 
 class Defuzz:
     def __init__(self):
+        # scikit-fuzzy is imported on the first construction, so importing the module does not load it
+        from skfuzzy import control as ctrl
+        import skfuzzy as fuzz
         self.overlap = ctrl.Antecedent(universe=np.arange(-1.1, 1.1, 0.1), label='overlap')
         self.sr = ctrl.Antecedent(universe=np.arange(-1, 361, 1), label='spatial_relationships')
 
@@ -130,43 +292,106 @@ class Defuzz:
         # 301 < HOF < 330: Below Right
         self.sr['Below Right'] = fuzz.trimf(self.sr.universe, [300, 315, 331])
 
+        # Direction label of each integer HOF angle, the only angles the HOF gives
+        self.__sr_terms = ['Right1', 'Right2', 'Above Right', 'Above', 'Above Left', 'Left', 'Below Left', 'Below',
+                           'Below Right']
+        self.__angle_labels = self.__direction_labels(np.arange(0, 361))
+
+    def __direction_labels(self, sr_angles):
+        # Direction labels of the angles, the first term of the highest membership as max does for the dictionary
+        memberships = np.array([np.interp(sr_angles, self.sr.universe, self.sr[term].mf, left=0., right=0.)
+                                for term in self.__sr_terms])
+        labels = np.array(self.__sr_terms, dtype=object)[np.argmax(memberships, axis=0)]
+        labels[(labels == 'Right1') | (labels == 'Right2')] = 'Right'
+        return labels
+
     def defuzzify_results(self, iou, sr_angle):
-        # Compute the overlap result
-        overlap = fuzz.interp_membership(self.overlap.universe, self.overlap['Overlap'].mf, iou)
-        no_overlap = fuzz.interp_membership(self.overlap.universe, self.overlap['No Overlap'].mf, iou)
-        membership = {'Overlap': overlap, 'No Overlap': no_overlap}
-        overlap_label = max(membership, key=membership.get)
-
-        # Compute the spatial relationship result
-        right_1 = fuzz.interp_membership(self.sr.universe, self.sr['Right1'].mf, sr_angle)
-        right_2 = fuzz.interp_membership(self.sr.universe, self.sr['Right2'].mf, sr_angle)
-        above_right = fuzz.interp_membership(self.sr.universe, self.sr['Above Right'].mf, sr_angle)
-        above = fuzz.interp_membership(self.sr.universe, self.sr['Above'].mf, sr_angle)
-        above_left = fuzz.interp_membership(self.sr.universe, self.sr['Above Left'].mf, sr_angle)
-        left = fuzz.interp_membership(self.sr.universe, self.sr['Left'].mf, sr_angle)
-        below_left = fuzz.interp_membership(self.sr.universe, self.sr['Below Left'].mf, sr_angle)
-        below = fuzz.interp_membership(self.sr.universe, self.sr['Below'].mf, sr_angle)
-        below_right = fuzz.interp_membership(self.sr.universe, self.sr['Below Right'].mf, sr_angle)
-        membership = {'Right1': right_1, 'Right2': right_2, 'Above Right': above_right, 'Above': above,
-                      'Above Left': above_left, 'Left': left, 'Below Left': below_left, 'Below': below,
-                      'Below Right': below_right}
-        sr_label = max(membership, key=membership.get)
-        if sr_label == 'Right1' or sr_label == 'Right2':
-            sr_label = 'Right'
-        return overlap_label, sr_label
+        overlap_labels, sr_labels = self.defuzzify_batch([iou], [sr_angle])
+        return overlap_labels[0], sr_labels[0]
+
+    def defuzzify_batch(self, ious=None, sr_angles=None):
+        """
+        Vectorized defuzzify_results over the tuples of an image. The direction labels of the integer angles are read
+        from the table of the angles, the others are interpolated. The overlap labels are interpolated, as the IOU is
+        continuous and the memberships cross within the smallest IOU values
+        :param ious: IOU of each tuple
+        :param sr_angles: Consensus HOF angle of each tuple
+        :return: Lists of the overlap label and spatial relationship label of each tuple
+        """
+        assert ious is not None, "Must supply the IOU of the tuples"
+        assert sr_angles is not None, "Must supply the HOF angles of the tuples"
+        ious = np.asarray(ious, dtype=np.float64)
+        sr_angles = np.asarray(sr_angles, dtype=np.float64)
+        overlap = np.interp(ious, self.overlap.universe, self.overlap['Overlap'].mf, left=0., right=0.)
+        no_overlap = np.interp(ious, self.overlap.universe, self.overlap['No Overlap'].mf, left=0., right=0.)
+        # Ties go to Overlap, the first key of the dictionary of defuzzify_results
+        overlap_labels = np.where(overlap >= no_overlap, 'Overlap', 'No Overlap').tolist()
+
+        in_table = (sr_angles == np.round(sr_angles)) & (sr_angles >= 0) & (sr_angles < len(self.__angle_labels))
+        sr_labels = np.empty(len(sr_angles), dtype=object)
+        sr_labels[in_table] = self.__angle_labels[sr_angles[in_table].astype(np.int64)]
+        if not in_table.all():
+            sr_labels[~in_table] = self.__direction_labels(sr_angles[~in_table])
+        return overlap_labels, sr_labels.tolist()
 
 
 class SpatialRelationships:
     def __init__(self,
-                 animate_objects_file='./input/animate_objects.csv'):
+                 animate_objects_file='./input/animate_objects.csv',
+                 box_hof=True,
+                 hof_threads=0,
+                 hof_coarse_step=0,
+                 hof_tolerance=0.1,
+                 compact_results=False,
+                 prune_far_pairs=False,
+                 far_giou=-0.85,
+                 pair_memo_size=0,
+                 pair_memo_step=0.):
         """
         Compute the proximity, overlap, and cardinal directions between object tuples in an image
         :param animate_objects_file: File containing a list of animate objects in the data set
+        :param box_hof: Compute the HOF directly from the bounding boxes instead of from full image masks
+        :param hof_threads: Number of threads computing the bounding box HOF of an image (default 0, one per core)
+        :param hof_coarse_step: Find the HOF angles with a coarse-to-fine search over one direction out of
+        hof_coarse_step instead of computing the full histograms (default 0, full histograms)
+        :param hof_tolerance: Refinement tolerance of the coarse-to-fine HOF search (default 0.1)
+        :param compact_results: Return the tuples of an image as an ImageTuples record of NumPy columns, whose items are
+        dictionary views of the tuples, instead of a list of JSON serializable dictionaries (default False)
+        :param prune_far_pairs: Screen the tuples of an image with a single GIOU computation over all of them, and skip
+        the HOF of the disjoint tuples whose GIOU is below far_giou. Their angles are the directions between the box
+        centers, and they are marked 'pruned' so the rule bases give them default annotations (default False)
+        :param far_giou: GIOU below which disjoint tuples are pruned. The default -0.85 is where the Far proximity set
+        ends, so the pruned tuples are only Very Far
+        :param pair_memo_size: Number of tuple geometries whose GIOU, IOU, and HOF angles are memoized, in least
+        recently used order, so the tuples of the objects repeating across the frames of a fixed camera are not
+        computed again (default 0, no memo)
+        :param pair_memo_step: Quantization step of the memo keys, as a fraction of the image width and height. The
+        tuples whose boxes fall in the same quantization cells get the results of the first of them (default 0., the
+        keys are the exact boxes and image size, and the results are unchanged)
         """
         assert animate_objects_file is not None, "Must supply animate objects file"
 
-        self.__animate_objects = list(pd.read_csv(animate_objects_file, encoding='utf-8', engine='python')['object'])
-        self.__defuzzer = Defuzz()
+        self.__box_hof = box_hof
+        self.__hof_threads = hof_threads
+        self.__hof_coarse_step = hof_coarse_step
+        self.__hof_tolerance = hof_tolerance
+        self.__compact_results = compact_results
+        self.__prune_far_pairs = prune_far_pairs
+        self.__far_giou = far_giou
+        self.__animate_objects_file = animate_objects_file
+        assert pair_memo_size >= 0, "Pair memo size must not be negative"
+        assert pair_memo_step >= 0, "Pair memo step must not be negative"
+        self.__pair_memo_size = pair_memo_size
+        self.__pair_memo_step = pair_memo_step
+        # The (GIOU, IOU, F0, F2, Hybrid) of each memoized tuple geometry, from least to most recently used
+        self.__pair_memo = OrderedDict()
+        self.__pair_memo_hits = 0
+        self.__pair_memo_misses = 0
+
+        with open(animate_objects_file, encoding='utf-8', newline='') as f:
+            self.__animate_objects = [row['object'] for row in csv.DictReader(f) if row['object'] not in NA_VALUES]
+        # Built on the first image, as it loads scikit-fuzzy
+        self.__defuzzer = None
         self.__direction_lookup = {
             'Right': 'is to the right of',
             'Above Right': 'is above and to the right of',
@@ -178,6 +403,65 @@ class SpatialRelationships:
             'Below Right': 'is below and to the right of'
         }
 
+    def parameters(self):
+        """
+        :return: Dictionary of the parameters the spatial relationship results depend on
+        """
+        return {'animate_objects_file': self.__animate_objects_file, 'box_hof': self.__box_hof,
+                'hof_coarse_step': self.__hof_coarse_step, 'hof_tolerance': self.__hof_tolerance,
+                'compact_results': self.__compact_results, 'prune_far_pairs': self.__prune_far_pairs,
+                'far_giou': self.__far_giou, 'num_directions': 360, 'pair_memo_size': self.__pair_memo_size,
+                'pair_memo_step': self.__pair_memo_step}
+
+    def pair_memo_stats(self):
+        """
+        :return: Dictionary of the hits, misses, hit rate, and size of the pair memo
+        """
+        lookups = self.__pair_memo_hits + self.__pair_memo_misses
+        return {'hits': self.__pair_memo_hits, 'misses': self.__pair_memo_misses,
+                'hit_rate': self.__pair_memo_hits / lookups if lookups else 0., 'size': len(self.__pair_memo)}
+
+    def __pair_memo_key(self, arg_box, ref_box, img_width, img_height):
+        if not self.__pair_memo_step:
+            return img_width, img_height, *arg_box, *ref_box
+        # Quantized box coordinates, relative to the image size
+        x_step = self.__pair_memo_step * img_width
+        y_step = self.__pair_memo_step * img_height
+        return (img_width, img_height) + tuple(round(c / step) for c, step in zip(arg_box + ref_box,
+                                                                                 [x_step, y_step] * 4))
+
+    def __lookup_pair_memo(self, memo_keys, pruned):
+        """
+        Read the memoized results of the tuples of an image. The pruned tuples are not looked up
+        :return: The memoized (GIOU, IOU, F0, F2, Hybrid) of each tuple, None for the tuples without one
+        """
+        results = []
+        for memo_key, is_pruned in zip(memo_keys, pruned):
+            result = None
+            if not is_pruned:
+                result = self.__pair_memo.get(memo_key)
+                if result is None:
+                    self.__pair_memo_misses += 1
+                else:
+                    self.__pair_memo.move_to_end(memo_key)
+                    self.__pair_memo_hits += 1
+            results.append(result)
+        return results
+
+    def __store_pair_memo(self, memo_key, result):
+        self.__pair_memo[memo_key] = result
+        if len(self.__pair_memo) > self.__pair_memo_size:
+            self.__pair_memo.popitem(last=False)
+
+    def __previous_pair_results(self, previous_results):
+        """
+        Index the tuple results of a previous image, such as the previous frame of a video
+        :return: Dictionary of the (GIOU, IOU, F0, F2, Hybrid) of each tuple, keyed by its labels and boxes
+        """
+        values = zip(*[tuple_column([previous_results], key, np.float64).tolist() for key in ['proximity', 'overlap']],
+                     *[tuple_column([previous_results], key, np.int64).tolist() for key in ['f0', 'f2', 'hybrid']])
+        return dict(zip(tuple_geometry_keys(previous_results), values))
+
     def __order_arg_ref_pair(self, arg_label, ref_label):
         """
         Order the labels for the tuple according to person -> animate -> inanimate
@@ -263,17 +547,23 @@ class SpatialRelationships:
         GIoU = IoU - ((area_b_c - U) / area_b_c)
         return GIoU, IoU
 
-    def compute_spatial_relationships(self, object_detection_results=None, metadata=None):
+    def compute_spatial_relationships(self, object_detection_results=None, metadata=None, previous_results=None):
         """
         :param object_detection_results:
         :param metadata:
-        :return:
+        :param previous_results: Tuple results of a previous image, such as the previous frame of a video. The tuples
+        with the same labels and boxes as one of them reuse its GIOU, IOU, and HOF angles (default None)
+        :return: The relative path to the image, and its tuple results as an ImageTuples record or a list of
+        dictionaries
         """
         assert object_detection_results is not None, "Must supply image's object detection results"
         assert metadata is not None, "Must supply image's metadata results"
 
         # Grab the metadata label and append to the spatial relationship results. Will be used in the FIS computations
-        meta_label = convert_meta_labels(json.loads(metadata['labels']))
+        if metadata.get('skipped', False):
+            meta_label = SKIPPED_METADATA_LABEL
+        else:
+            meta_label = convert_meta_labels(json.loads(metadata['labels']))
         # Return a list of dictionaries as the result for this image
         image_results = list(dict())
         boxes = convert_boxes(object_detection_results['bounding_boxes'])
@@ -288,40 +578,107 @@ class SpatialRelationships:
 
         img_tuples = get_image_tuples(img_labels=labels)
         img_name = rel_path.rsplit('.', 1)[0]  # Remove the file extension to use for a key
-        for tup in img_tuples:
-            arg_label, ref_label = self.__order_arg_ref_pair(tup[0], tup[1])
+        arg_ref_pairs = [self.__order_arg_ref_pair(tup[0], tup[1]) for tup in img_tuples]
+        box_index = {label: idx for idx, label in enumerate(labels)}
+        pairs = [(box_index[arg_label], box_index[ref_label]) for arg_label, ref_label in arg_ref_pairs]
+        pruned = np.zeros(len(pairs), dtype=bool)
+        if self.__prune_far_pairs and arg_ref_pairs:
+            # The disjoint tuples firmly in the Very Far proximity set get the direction between their box centers
+            pair_gious, pair_ious = compute_giou_batch(boxes, pairs)
+            pruned = (pair_gious < self.__far_giou) & (pair_ious == 0)
+            center_angles = compute_center_angles(boxes, pairs)
+        memo_keys = []
+        memo_results = [None] * len(pairs)
+        reused = np.zeros(len(pairs), dtype=bool)
+        if previous_results is not None and len(previous_results):
+            previous = self.__previous_pair_results(previous_results)
+            memo_results = [previous.get((arg_label, ref_label, tuple(label_box_map[arg_label]),
+                                          tuple(label_box_map[ref_label])))
+                            for arg_label, ref_label in arg_ref_pairs]
+            reused = np.array([result is not None for result in memo_results], dtype=bool)
+        if self.__pair_memo_size:
+            memo_keys = [self.__pair_memo_key(boxes[arg_idx], boxes[ref_idx], img_width, img_height)
+                         for arg_idx, ref_idx in pairs]
+            # The reused tuples are not looked up
+            memo_lookups = self.__lookup_pair_memo(memo_keys, pruned | reused)
+            memo_results = [previous_result if is_reused else memo_result
+                            for previous_result, memo_result, is_reused in zip(memo_results, memo_lookups, reused)]
+        # The tuples whose HOF is computed
+        computed = ~pruned & np.array([result is None for result in memo_results], dtype=bool)
+        if self.__box_hof and computed.any():
+            # Compute the HOF angles of all the tuples of the image in one batch
+            hof_angles = np.zeros((len(pairs), 3), dtype=np.int64)
+            hof_angles[computed] = compute_hof_batch(boxes, np.asarray(pairs).reshape(-1, 2)[computed],
+                                                    img_shape=(img_height, img_width), num_threads=self.__hof_threads,
+                                                    coarse_step=self.__hof_coarse_step, tolerance=self.__hof_tolerance)
+        # Columns of the compact results
+        gious, ious, angles = [], [], []
+        for tup_idx, (arg_label, ref_label) in enumerate(arg_ref_pairs):
             arg_box = label_box_map[arg_label]
             ref_box = label_box_map[ref_label]
-            key = f'{img_name}_{arg_label}_{ref_label}'
 
+            if memo_results[tup_idx] is not None:
+                giou, iou, f0, f2, hybrid = memo_results[tup_idx]
+                gious.append(giou)
+                ious.append(iou)
+                angles.append((f0, f2, hybrid))
+                continue
             giou, iou = compute_giou(arg_box, ref_box)
 
-            # Create two binary mask images that correspond to the arg and ref boxes for use with HOF
-            arg_hof = np.zeros((img_height, img_width), dtype='uint8')
-            ref_hof = np.zeros((img_height, img_width), dtype='uint8')
-            arg_hof[arg_box[1]:arg_box[3], arg_box[0]:arg_box[2]] = 255
-            ref_hof[ref_box[1]:ref_box[3], ref_box[0]:ref_box[2]] = 255
-
-            # Testing the np images are constructed correctly
-            # img_path = f'./input/demo_images/{rel_path}'
-            # orig_img = cv2.imread(img_path, cv2.IMREAD_ANYCOLOR)
-            # cv2.rectangle(orig_img, (arg_box[0], arg_box[1]), (arg_box[2], arg_box[3]), (255, 0, 0), 2)
-            # cv2.rectangle(orig_img, (ref_box[0], ref_box[1]), (ref_box[2], ref_box[3]), (0, 255, 0), 2)
-            # cv2.imshow('Original image', orig_img)
-            # cv2.imshow('Arg object', arg_hof)
-            # cv2.imshow('Ref object', ref_hof)
-            # cv2.waitKey(0)
-
-            f0, f2, hybrid = compute_hof(arg_hof, ref_hof)
-            sr_angle = self.__get_concensus_angle(f0, f2, hybrid)
-
-            overlap_label, sr_label = self.__defuzzer.defuzzify_results(iou, sr_angle)
-            img_summary = self.__construct_spatial_relationships(arg_label, ref_label, overlap_label, sr_label)
-            img_summary_result = {
-                'key': key, 'relative_path': rel_path, 'img_name': img_name, 'arg_label': arg_label,
-                'arg_bounding_box': json.dumps(arg_box), 'ref_label': ref_label,
-                'ref_bounding_box': json.dumps(ref_box), 'metadata': meta_label, 'overlap': iou, 'proximity': giou,
-                'f0': f0, 'f2': f2, 'hybrid': hybrid, 'spatial_relationship': img_summary
-            }
-            image_results.append(img_summary_result)
+            if pruned[tup_idx]:
+                f0 = f2 = hybrid = center_angles[tup_idx]
+            elif self.__box_hof:
+                f0, f2, hybrid = hof_angles[tup_idx]
+            else:
+                # Create two binary mask images that correspond to the arg and ref boxes for use with HOF, cropped
+                # to the tuple so the cost does not depend on the image resolution
+                arg_hof, ref_hof, roi_origin = create_roi_masks(arg_box, ref_box, img_height, img_width)
+
+                # Testing the np images are constructed correctly
+                # img_path = f'./input/demo_images/{rel_path}'
+                # orig_img = cv2.imread(img_path, cv2.IMREAD_ANYCOLOR)
+                # cv2.rectangle(orig_img, (arg_box[0], arg_box[1]), (arg_box[2], arg_box[3]), (255, 0, 0), 2)
+                # cv2.rectangle(orig_img, (ref_box[0], ref_box[1]), (ref_box[2], ref_box[3]), (0, 255, 0), 2)
+                # cv2.imshow('Original image', orig_img)
+                # cv2.imshow('Arg object', arg_hof)
+                # cv2.imshow('Ref object', ref_hof)
+                # cv2.waitKey(0)
+
+                f0, f2, hybrid = compute_hof(arg_hof, ref_hof, img_shape=(img_height, img_width), roi_origin=roi_origin,
+                                             coarse_step=self.__hof_coarse_step, tolerance=self.__hof_tolerance)
+            gious.append(giou)
+            ious.append(iou)
+            angles.append((f0, f2, hybrid))
+            if memo_keys and not pruned[tup_idx]:
+                self.__store_pair_memo(memo_keys[tup_idx], (giou, iou, f0, f2, hybrid))
+
+        # The overlap and direction labels of all the tuples of the image at once
+        if self.__defuzzer is None:
+            self.__defuzzer = Defuzz()
+        overlap_labels, sr_labels = self.__defuzzer.defuzzify_batch(
+            ious, [self.__get_concensus_angle(f0, f2, hybrid) for f0, f2, hybrid in angles])
+        summaries = [self.__construct_spatial_relationships(arg_label, ref_label, overlap_label, sr_label)
+                     for (arg_label, ref_label), overlap_label, sr_label in zip(arg_ref_pairs, overlap_labels,
+                                                                                sr_labels)]
+        if not self.__compact_results:
+            for tup_idx, (arg_label, ref_label) in enumerate(arg_ref_pairs):
+                arg_box = label_box_map[arg_label]
+                ref_box = label_box_map[ref_label]
+                key = f'{img_name}_{arg_label}_{ref_label}'
+                f0, f2, hybrid = angles[tup_idx]
+                img_summary_result = {
+                    'key': key, 'relative_path': rel_path, 'img_name': img_name, 'arg_label': arg_label,
+                    'arg_bounding_box': json.dumps(arg_box), 'ref_label': ref_label,
+                    'ref_bounding_box': json.dumps(ref_box), 'metadata': meta_label, 'overlap': ious[tup_idx],
+                    'proximity': gious[tup_idx], 'f0': f0, 'f2': f2, 'hybrid': hybrid,
+                    'spatial_relationship': summaries[tup_idx]
+                }
+                if self.__prune_far_pairs:
+                    img_summary_result['pruned'] = bool(pruned[tup_idx])
+                image_results.append(img_summary_result)
+        else:
+            image_results = ImageTuples(rel_path, img_name, meta_label, labels, boxes, pairs, gious, ious, angles,
+                                        summaries)
+            if self.__prune_far_pairs:
+                image_results.set_column('pruned', pruned.tolist())
         return rel_path, image_results
@@ -0,0 +1,216 @@
+"""
+This module implements the content addressed cache of the stage results of the scene labeling system.
+Each result is stored under a key hashing the inputs of its stage and the fingerprint of the stage, so reprocessing an
+image with the same contents, under any name, reads the results back instead of computing them:
+    object_detection: The image contents
+    metadata: The image contents
+    spatial_relationships: The keys of the object detection results and the metadata results
+    annotation: The key of the spatial relationship results
+The fingerprint of a stage hashes its parameters, the contents of its parameter files, such as the YOLO weights or the
+ontology, and its source code. The cache is layered: changing the parameters of a stage, such as the fuzzy rules of the
+annotation, only invalidates the results of this stage and the later ones, and the earlier results are reused.
+The results are pickle files of a directory, one subdirectory per stage. When they exceed the size limit of the cache,
+the least recently used ones are evicted.
+"""
+import glob
+import hashlib
+import os
+import pickle
+import threading
+from utils import atomic_write
+
+STAGES = ('object_detection', 'metadata', 'spatial_relationships', 'annotation')
+# Source files of the code computing the results of each stage
+_LIBS_DIR = os.path.dirname(os.path.abspath(__file__))
+_UTILS_FILE = os.path.join(os.path.dirname(_LIBS_DIR), 'utils.py')
+_TUPLES_FILE = os.path.join(_LIBS_DIR, 'tuple_records.py')
+STAGE_SOURCE_FILES = {
+    'object_detection': [os.path.join(_LIBS_DIR, 'object_detection.py'), _UTILS_FILE],
+    'metadata': [os.path.join(_LIBS_DIR, 'metadata.py')],
+    'spatial_relationships': [os.path.join(_LIBS_DIR, 'spatial_relationships.py'), _TUPLES_FILE, _UTILS_FILE],
+    'annotation': sorted(glob.glob(os.path.join(_LIBS_DIR, 'annotation', '**', '*.py'), recursive=True))
+                  + [_TUPLES_FILE, _UTILS_FILE]
+}
+# Share of the size limit kept by an eviction, so the next results do not trigger another one right away
+EVICTION_TARGET = 0.9
+
+# Hashes of the files read so far, keyed by (path, size, modification time)
+_file_digests = {}
+
+
+def image_digest(image=None):
+    """
+    :param image: A decoded image array
+    :return: Hash of the image shape, data type, and pixels
+    """
+    assert image is not None, "Must supply an image"
+    digest = hashlib.sha1(repr((image.shape, str(image.dtype))).encode('utf-8'))
+    digest.update(memoryview(image).cast('B') if image.flags.c_contiguous else image.tobytes())
+    return digest.hexdigest()
+
+
+def file_digest(file_path=None):
+    """
+    Hash of the contents of a file, read once per process unless the file changes
+    :param file_path: Path of the file
+    :return: The hash of the contents of the file
+    """
+    assert file_path is not None, "Must supply the file path"
+    stat = os.stat(file_path)
+    file_key = (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+    if file_key not in _file_digests:
+        digest = hashlib.sha1()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        _file_digests[file_key] = digest.hexdigest()
+    return _file_digests[file_key]
+
+
+def stage_fingerprint(stage=None, parameters=None):
+    """
+    Fingerprint of the results of a stage
+    :param stage: Name of the stage, one of STAGES
+    :param parameters: Dictionary of the parameters of the stage. The contents of the parameters naming existing files
+    are hashed with them
+    :return: Hash of the stage name, parameters, parameter files, and source files of the stage
+    """
+    assert stage in STAGES, f"Stage must be one of {STAGES}"
+    assert parameters is not None, "Must supply the stage parameters"
+    digest = hashlib.sha1(repr((stage, sorted((k, repr(v)) for k, v in parameters.items()))).encode('utf-8'))
+    for name, value in sorted(parameters.items()):
+        if isinstance(value, str) and os.path.isfile(value):
+            digest.update(file_digest(value).encode('utf-8'))
+    for file_path in STAGE_SOURCE_FILES[stage]:
+        digest.update(file_digest(file_path).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def cache_key(fingerprint=None, *inputs):
+    """
+    :param fingerprint: Fingerprint of the stage, from stage_fingerprint
+    :param inputs: Strings identifying the inputs of the stage, such as the image hash or the keys of earlier stages
+    :return: Key of the result of the stage for the inputs
+    """
+    assert fingerprint is not None, "Must supply the stage fingerprint"
+    return hashlib.sha1('\0'.join((fingerprint,) + inputs).encode('utf-8')).hexdigest()
+
+
+class StageCache:
+    def __init__(self, cache_dir=None, max_bytes=None):
+        """
+        Construct the cache of the stage results
+        :param cache_dir: Directory of the cache, created if needed. The results left in it by earlier processes are
+        reused
+        :param max_bytes: Maximum size in bytes of the result files. Default None, no limit
+        """
+        assert cache_dir is not None, "Must supply the cache directory"
+        assert max_bytes is None or max_bytes > 0, "Maximum size of the cache must be positive"
+        self.__cache_dir = cache_dir
+        self.__max_bytes = max_bytes
+        for stage in STAGES:
+            os.makedirs(os.path.join(cache_dir, stage), exist_ok=True)
+        self.__num_bytes = sum(size for _, size, _ in self.__files())
+        self.__counters = {stage: {'hits': 0, 'misses': 0, 'writes': 0} for stage in STAGES}
+        self.__num_evicted = 0
+        # The stages of an image pipeline share the cache from their own threads
+        self.__lock = threading.Lock()
+
+    def __getstate__(self):
+        # The lock is not pickled, such as when the cache is sent to the workers of a batch run
+        state = self.__dict__.copy()
+        del state['_StageCache__lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__lock = threading.Lock()
+
+    @property
+    def cache_dir(self):
+        return self.__cache_dir
+
+    def __path(self, stage, key):
+        return os.path.join(self.__cache_dir, stage, key + '.pkl')
+
+    def __files(self):
+        # The (path, size, last use time) of the result files of every stage
+        files = []
+        for stage in STAGES:
+            with os.scandir(os.path.join(self.__cache_dir, stage)) as entries:
+                for entry in entries:
+                    if entry.name.endswith('.pkl'):
+                        try:
+                            stat = entry.stat()
+                        except OSError:
+                            continue  # Evicted by another process
+                        files.append((entry.path, stat.st_size, stat.st_mtime_ns))
+        return files
+
+    def get(self, stage=None, key=None):
+        """
+        Read a result of a stage
+        :param stage: Name of the stage, one of STAGES
+        :param key: Key of the result, from cache_key
+        :return: The cached result, None on a miss
+        """
+        assert stage in STAGES, f"Stage must be one of {STAGES}"
+        assert key is not None, "Must supply the result key"
+        path = self.__path(stage, key)
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+            # The modification time records the last use for the eviction
+            os.utime(path)
+        except (OSError, pickle.UnpicklingError, EOFError, ValueError, TypeError, AttributeError, ImportError):
+            with self.__lock:
+                self.__counters[stage]['misses'] += 1
+            return None
+        with self.__lock:
+            self.__counters[stage]['hits'] += 1
+        return value
+
+    def put(self, stage=None, key=None, value=None):
+        """
+        Write a result of a stage. The result is pickled right away, so it can be changed afterwards
+        :param stage: Name of the stage, one of STAGES
+        :param key: Key of the result, from cache_key
+        :param value: The result
+        """
+        assert stage in STAGES, f"Stage must be one of {STAGES}"
+        assert key is not None, "Must supply the result key"
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        path = self.__path(stage, key)
+        try:
+            atomic_write(path, lambda f: f.write(data))
+        except OSError:
+            return  # The results are still returned when the directory is not writable
+        with self.__lock:
+            self.__counters[stage]['writes'] += 1
+            self.__num_bytes += len(data)
+            if self.__max_bytes is not None and self.__num_bytes > self.__max_bytes:
+                self.__evict()
+
+    def __evict(self):
+        # Called with the lock held. Other processes may share the directory, so its size is measured again before
+        # evicting
+        files = sorted(self.__files(), key=lambda file: file[2])
+        self.__num_bytes = sum(size for _, size, _ in files)
+        for path, size, _ in files:
+            if self.__num_bytes <= self.__max_bytes * EVICTION_TARGET:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue  # Evicted by another process
+            self.__num_bytes -= size
+            self.__num_evicted += 1
+
+    def stats(self):
+        """
+        :return: Dictionary of the hits, misses, and writes of each stage, the size in bytes of the result files, and
+        the number of evicted results
+        """
+        with self.__lock:
+            return {'stages': {stage: dict(counters) for stage, counters in self.__counters.items()},
+                    'num_bytes': self.__num_bytes, 'num_evicted': self.__num_evicted}
@@ -0,0 +1,283 @@
+"""
+This module implements the compact record of the object tuple results of an image.
+An ImageTuples record stores the tuples of an image as columns: the object labels and boxes once per object, the
+(argument, referrant) object indices, GIOU, IOU, and HOF angles of each tuple as NumPy arrays, and the strings shared by
+the tuples of the image once. Indexing or iterating the record gives TupleView objects, dictionary views of a single
+tuple with the keys of the former per tuple dictionaries, so the callers reading and setting r['key'] are unchanged.
+The views are created on access, so a stored record holds one object per image instead of one dictionary per tuple.
+The values a caller sets on a view, such as the interaction annotations, are stored in per image columns of the record.
+"""
+from collections.abc import MutableMapping, Sequence
+import json
+import sys
+import numpy as np
+
+# Keys of a tuple, in the order of the former per tuple dictionaries
+TUPLE_KEYS = ('key', 'relative_path', 'img_name', 'arg_label', 'arg_bounding_box', 'ref_label', 'ref_bounding_box',
+              'metadata', 'overlap', 'proximity', 'f0', 'f2', 'hybrid', 'spatial_relationship')
+# Numeric keys of a tuple and the record column holding them
+NUMERIC_COLUMNS = {'overlap': 'ious', 'proximity': 'gious', 'f0': 'f0', 'f2': 'f2', 'hybrid': 'hybrid'}
+
+# Marks the tuples without a value in a column set through the views
+_MISSING = object()
+
+
+class TupleView(MutableMapping):
+    __slots__ = ('__record', '__index')
+
+    def __init__(self, record, index):
+        """
+        Dictionary view of a tuple of an ImageTuples record
+        :param record: The ImageTuples record of the image
+        :param index: Index of the tuple in the record
+        """
+        self.__record = record
+        self.__index = index
+
+    @property
+    def record(self):
+        return self.__record
+
+    @property
+    def index(self):
+        return self.__index
+
+    def __getitem__(self, key):
+        return self.__record.get_value(self.__index, key)
+
+    def __setitem__(self, key, value):
+        self.__record.set_value(self.__index, key, value)
+
+    def __delitem__(self, key):
+        self.__record.delete_value(self.__index, key)
+
+    def __iter__(self):
+        return iter(self.__record.tuple_keys(self.__index))
+
+    def __len__(self):
+        return len(self.__record.tuple_keys(self.__index))
+
+    def __repr__(self):
+        return repr(self.to_dict())
+
+    def to_dict(self):
+        """
+        :return: A copy of the tuple as a dictionary
+        """
+        return {key: self[key] for key in self}
+
+
+class ImageTuples(Sequence):
+    __slots__ = ('relative_path', 'img_name', 'metadata', 'labels', 'boxes', 'pairs', 'gious', 'ious', 'f0', 'f2',
+                 'hybrid', 'spatial_relationships', '__extra')
+
+    def __init__(self, relative_path=None, img_name=None, metadata=None, labels=None, boxes=None, pairs=None,
+                 gious=None, ious=None, angles=None, spatial_relationships=None):
+        """
+        Construct the record of the object tuples of an image
+        :param relative_path: Relative path to the image
+        :param img_name: Image name, without the file extension
+        :param metadata: Metadata label of the image
+        :param labels: Labels of the objects of the image
+        :param boxes: The [x1, y1, x2, y2] bounding boxes of the objects
+        :param pairs: The (argument, referrant) indices into the objects of each tuple
+        :param gious: GIOU of each tuple
+        :param ious: IOU of each tuple
+        :param angles: The F0, F2, and Hybrid HOF angles of each tuple
+        :param spatial_relationships: Spatial relationship summary of each tuple
+        """
+        assert relative_path is not None, "Must supply the relative path to the image"
+        assert labels is not None, "Must supply the object labels"
+        self.relative_path = relative_path
+        self.img_name = img_name
+        self.metadata = metadata
+        # The labels of the tuples are shared with the objects of the image
+        self.labels = [sys.intern(label) for label in labels]
+        self.boxes = np.asarray(boxes, dtype=np.int32).reshape(-1, 4)
+        self.pairs = np.asarray(pairs, dtype=np.int16).reshape(-1, 2)
+        self.gious = np.asarray(gious, dtype=np.float64)
+        self.ious = np.asarray(ious, dtype=np.float64)
+        angles = np.asarray(angles, dtype=np.int16).reshape(-1, 3)
+        self.f0, self.f2, self.hybrid = angles[:, 0].copy(), angles[:, 1].copy(), angles[:, 2].copy()
+        self.spatial_relationships = list(spatial_relationships)
+        assert len(self.pairs) == len(self.gious) == len(self.ious) == len(angles) == len(self.spatial_relationships), \
+            "Must supply the same number of values for each tuple"
+        # Columns of the values set through the views, keyed by the tuple key they set
+        self.__extra = {}
+
+    def __len__(self):
+        return len(self.pairs)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [TupleView(self, i) for i in range(len(self))[index]]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('tuple index out of range')
+        return TupleView(self, index)
+
+    def __eq__(self, other):
+        # Equal to the lists of dictionaries of the same tuples
+        if not isinstance(other, Sequence):
+            return NotImplemented
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+
+    __hash__ = None
+
+    def column(self, key):
+        """
+        Values of a key for all the tuples of the image
+        :param key: A tuple key
+        :return: NumPy array for the numeric keys, list otherwise
+        """
+        if key in NUMERIC_COLUMNS and key not in self.__extra:
+            return getattr(self, NUMERIC_COLUMNS[key])
+        return [self.get_value(i, key) for i in range(len(self))]
+
+    def tuple_keys(self, index):
+        """
+        :return: The keys of a tuple: the keys of TUPLE_KEYS, then the keys set through its view
+        """
+        return list(TUPLE_KEYS) + [key for key, values in self.__extra.items()
+                                   if key not in TUPLE_KEYS and values[index] is not _MISSING]
+
+    def get_value(self, index, key):
+        """
+        Value of a key of a tuple, as in the former per tuple dictionaries
+        """
+        values = self.__extra.get(key)
+        if values is not None and values[index] is not _MISSING:
+            return values[index]
+        if key in NUMERIC_COLUMNS:
+            value = getattr(self, NUMERIC_COLUMNS[key])[index]
+            return float(value) if key in ['overlap', 'proximity'] else int(value)
+        arg_idx, ref_idx = self.pairs[index]
+        if key == 'arg_label':
+            return self.labels[arg_idx]
+        if key == 'ref_label':
+            return self.labels[ref_idx]
+        if key == 'arg_bounding_box':
+            return json.dumps(self.boxes[arg_idx].tolist())
+        if key == 'ref_bounding_box':
+            return json.dumps(self.boxes[ref_idx].tolist())
+        if key == 'spatial_relationship':
+            return self.spatial_relationships[index]
+        if key == 'key':
+            return f'{self.img_name}_{self.labels[arg_idx]}_{self.labels[ref_idx]}'
+        if key in ['relative_path', 'img_name', 'metadata']:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def set_value(self, index, key, value):
+        """
+        Set the value of a key of a tuple. The values override the stored ones of the tuple only
+        """
+        if key not in self.__extra:
+            self.__extra[key] = [_MISSING] * len(self)
+        self.__extra[key][index] = value
+
+    def set_column(self, key, values):
+        """
+        Set the values of a key for all the tuples of the image
+        :param key: A tuple key
+        :param values: Value of each tuple
+        """
+        assert len(values) == len(self), "Must supply a value for each tuple"
+        self.__extra[key] = list(values)
+
+    def delete_value(self, index, key):
+        """
+        Delete a key set through the view of a tuple. The keys of TUPLE_KEYS cannot be deleted
+        """
+        values = self.__extra.get(key)
+        if key in TUPLE_KEYS or values is None or values[index] is _MISSING:
+            raise KeyError(key)
+        values[index] = _MISSING
+
+    def subset(self, indices):
+        """
+        Record of some of the tuples of the image, with the values set through their views
+        :param indices: Indices of the tuples
+        :return: A new ImageTuples record of the tuples, in the order of the indices
+        """
+        indices = np.asarray(indices, dtype=np.int64).reshape(-1)
+        angles = np.stack([self.f0[indices], self.f2[indices], self.hybrid[indices]], axis=1)
+        record = ImageTuples(self.relative_path, self.img_name, self.metadata, self.labels, self.boxes,
+                             self.pairs[indices], self.gious[indices], self.ious[indices], angles,
+                             [self.spatial_relationships[i] for i in indices])
+        for key, values in self.__extra.items():
+            record.__extra[key] = [values[i] for i in indices]
+        return record
+
+    def to_dicts(self):
+        """
+        :return: The tuples of the image as a list of dictionaries
+        """
+        return [view.to_dict() for view in self]
+
+
+def tuple_column(sr_results=None, key=None, dtype=None):
+    """
+    Values of a key for all the tuples of a list of images, read from the record columns for ImageTuples records
+    :param sr_results: List of the spatial relationship results of each image, ImageTuples or lists of dictionaries
+    :param key: A tuple key
+    :param dtype: NumPy data type of the returned array. Default None, a list is returned
+    :return: The values of the tuples of all the images, in order
+    """
+    assert sr_results is not None, "Must supply the spatial relationship results"
+    columns = [sr_result.column(key) if isinstance(sr_result, ImageTuples) else [r[key] for r in sr_result]
+               for sr_result in sr_results]
+    if dtype is None:
+        return [value for column in columns for value in column]
+    return np.concatenate([np.asarray(column, dtype=dtype) for column in columns] + [np.empty(0, dtype=dtype)])
+
+
+def tuple_geometry_keys(sr_result=None):
+    """
+    :param sr_result: The spatial relationship results of an image, an ImageTuples record or a list of dictionaries
+    :return: The (argument label, referrant label, argument box, referrant box) of each tuple, with the boxes as tuples
+    """
+    assert sr_result is not None, "Must supply the spatial relationship results"
+    if isinstance(sr_result, ImageTuples):
+        boxes = [tuple(box) for box in sr_result.boxes.tolist()]
+        return [(sr_result.labels[arg_idx], sr_result.labels[ref_idx], boxes[arg_idx], boxes[ref_idx])
+                for arg_idx, ref_idx in sr_result.pairs.tolist()]
+    return [(r['arg_label'], r['ref_label'], tuple(json.loads(r['arg_bounding_box'])),
+             tuple(json.loads(r['ref_bounding_box']))) for r in sr_result]
+
+
+def select_tuples(sr_result=None, indices=None):
+    """
+    Tuple results of some of the tuples of an image
+    :param sr_result: The spatial relationship results of the image, an ImageTuples record or a list of dictionaries
+    :param indices: Indices of the tuples
+    :return: A new ImageTuples record of the tuples, or a list of their dictionaries, which are shared with sr_result
+    """
+    assert sr_result is not None, "Must supply the spatial relationship results"
+    assert indices is not None, "Must supply the tuple indices"
+    if isinstance(sr_result, ImageTuples):
+        return sr_result.subset(indices)
+    return [sr_result[i] for i in indices]
+
+
+def rename_tuples(sr_result=None, relative_path=None):
+    """
+    Give the tuple results of an image the relative path of another image with the same contents, as the cached
+    results of an image are reused for its copies
+    :param sr_result: The spatial relationship results of the image, an ImageTuples record or a list of dictionaries
+    :param relative_path: Relative path to the image
+    :return: The results, with the relative path, image name, and tuple keys of the image
+    """
+    assert sr_result is not None, "Must supply the spatial relationship results"
+    assert relative_path is not None, "Must supply the relative path to the image"
+    img_name = relative_path.rsplit('.', 1)[0]
+    if isinstance(sr_result, ImageTuples):
+        sr_result.relative_path = relative_path
+        sr_result.img_name = img_name
+        return sr_result
+    for r in sr_result:
+        r['relative_path'] = relative_path
+        r['img_name'] = img_name
+        r['key'] = f'{img_name}_{r["arg_label"]}_{r["ref_label"]}'
+    return sr_result
@@ -0,0 +1,217 @@
+"""
+This module implements the incremental processing of the frames of a video.
+An IouTracker associates the object detections of consecutive frames by the IOU of their boxes, so an object keeps its
+label, such as person_1, for as long as it is tracked, while the detector numbers the objects of each frame anew. Each
+track also holds an anchor box, the box its tuples are computed with, which only follows the detections once they move
+beyond the move threshold, so the detection jitter of a still object does not change its tuples.
+A VideoSession holds the tracker and the annotated tuples of the previous frame. The tuples whose objects kept their
+anchor boxes carry their spatial relationships and annotations forward, and only the tuples of the objects that moved
+or appeared are computed again. The tuples of the objects that disappeared are dropped with them.
+"""
+from libs.spatial_relationships import compute_giou
+from libs.tuple_records import ImageTuples, select_tuples, tuple_column, tuple_geometry_keys
+from utils import convert_boxes
+import json
+
+# Keys of the annotations the rule bases add to the tuples
+ANNOTATION_KEYS = ('general_interaction', 'person_interaction')
+
+
+def base_label(label=None):
+    """
+    :param label: An object label numbered by the detector or tracker, such as sports_ball_1
+    :return: The label without its number, such as sports_ball
+    """
+    assert label is not None, "Must supply the object label"
+    return '_'.join(label.split('_')[:-1])
+
+
+class IouTracker:
+    def __init__(self, match_iou=0.3, move_threshold=4, max_missed=5):
+        """
+        Construct the tracker of the objects of a video
+        :param match_iou: Minimum IOU between the last box of a track and a detection of the same class for the
+        detection to continue the track
+        :param move_threshold: Largest change in pixels of a box coordinate before the anchor box of a track follows its
+        detections. Default 4, above the detection jitter of a still object
+        :param max_missed: Number of consecutive frames a track is kept without detections, so an object missed by the
+        detector for a few frames keeps its label
+        """
+        assert 0. < match_iou <= 1., "Match IOU must be in (0, 1]"
+        assert move_threshold >= 0, "Move threshold must not be negative"
+        assert max_missed >= 0, "Maximum number of missed frames must not be negative"
+        self.__match_iou = match_iou
+        self.__move_threshold = move_threshold
+        self.__max_missed = max_missed
+        # The class, last detected box, anchor box, and number of missed frames of each track, keyed by its label
+        self.__tracks = {}
+
+    @property
+    def num_tracks(self):
+        return len(self.__tracks)
+
+    @property
+    def track_labels(self):
+        # In the order the tracks started
+        return list(self.__tracks)
+
+    def update(self, labels=None, boxes=None):
+        """
+        Associate the detections of a frame with the tracks. Each track is matched with at most one detection, in
+        decreasing IOU order. The unmatched detections start new tracks, labeled with the smallest number free for
+        their class
+        :param labels: Labels of the detections of the frame, as numbered by the detector
+        :param boxes: The [x1, y1, x2, y2] boxes of the detections
+        :return: The track label and anchor box of each detection, and the set of the track labels whose anchor box
+        changed, as their object moved or appeared
+        """
+        assert labels is not None, "Must supply the detection labels"
+        assert boxes is not None, "Must supply the detection boxes"
+        assert len(labels) == len(boxes), "Must supply a box for each detection"
+        classes = [base_label(label) for label in labels]
+        candidates = []
+        for track_idx, (track_label, track) in enumerate(self.__tracks.items()):
+            for det_idx, (obj_class, box) in enumerate(zip(classes, boxes)):
+                if obj_class == track['class']:
+                    _, iou = compute_giou(track['box'], box)
+                    if iou >= self.__match_iou:
+                        candidates.append((-iou, track_idx, det_idx, track_label))
+        track_labels = [None] * len(labels)
+        matched_tracks = set()
+        for _, _, det_idx, track_label in sorted(candidates):
+            if track_labels[det_idx] is None and track_label not in matched_tracks:
+                track_labels[det_idx] = track_label
+                matched_tracks.add(track_label)
+
+        moved = set()
+        for det_idx, (obj_class, box) in enumerate(zip(classes, boxes)):
+            track_label = track_labels[det_idx]
+            if track_label is None:
+                number = 1
+                while f'{obj_class}_{number}' in self.__tracks:
+                    number += 1
+                track_label = track_labels[det_idx] = f'{obj_class}_{number}'
+                self.__tracks[track_label] = {'class': obj_class, 'box': box, 'anchor': box, 'missed': 0}
+                moved.add(track_label)
+                continue
+            track = self.__tracks[track_label]
+            track['box'] = box
+            track['missed'] = 0
+            if max(abs(c - a) for c, a in zip(box, track['anchor'])) > self.__move_threshold:
+                track['anchor'] = box
+                moved.add(track_label)
+
+        detected = set(track_labels)
+        for track_label in list(self.__tracks):
+            if track_label not in detected:
+                self.__tracks[track_label]['missed'] += 1
+                if self.__tracks[track_label]['missed'] > self.__max_missed:
+                    del self.__tracks[track_label]
+        return track_labels, [self.__tracks[track_label]['anchor'] for track_label in track_labels], moved
+
+
+class VideoSession:
+    def __init__(self, match_iou=0.3, move_threshold=4, max_missed=5):
+        """
+        Construct the session of a video, processed one frame at a time in order
+        :param match_iou: Minimum IOU of a detection continuing a track, see IouTracker
+        :param move_threshold: Largest change in pixels of a box coordinate before the tuples of its object are computed
+        again, see IouTracker
+        :param max_missed: Number of consecutive frames a track is kept without detections, see IouTracker
+        """
+        self.__tracker = IouTracker(match_iou, move_threshold, max_missed)
+        # The annotated tuples of the previous frame
+        self.__previous_results = None
+        self.__num_frames = 0
+        self.__num_tuples = 0
+        self.__num_computed = 0
+        self.__num_moved = 0
+
+    @property
+    def previous_results(self):
+        return self.__previous_results
+
+    def track_detections(self, od_result=None):
+        """
+        Relabel the object detections of a frame with their track labels, and order them as their tracks
+        :param od_result: Object detection results of the frame
+        :return: The detection results with the track labels, and the same results with the anchor boxes of the tracks,
+        which the tuples of the frame are computed with
+        """
+        assert od_result is not None, "Must supply the frame's object detection results"
+        labels = json.loads(od_result['labels'])
+        boxes = convert_boxes(od_result['bounding_boxes']) if labels else []
+        track_labels, anchors, moved = self.__tracker.update(labels, boxes)
+        self.__num_moved += len(moved)
+        # The detections are ordered as their tracks, as the order of the objects orients the tuples of inanimate
+        # objects, and the detector orders the objects of each frame anew
+        track_order = {track_label: rank for rank, track_label in enumerate(self.__tracker.track_labels)}
+        order = sorted(range(len(labels)), key=lambda det_idx: track_order[track_labels[det_idx]])
+        confidences = json.loads(od_result['confidences'])
+        tracked = dict(od_result, labels=json.dumps([track_labels[det_idx] for det_idx in order]),
+                       bounding_boxes=json.dumps([boxes[det_idx] for det_idx in order]),
+                       confidences=json.dumps([confidences[det_idx] for det_idx in order]))
+        return tracked, dict(tracked, bounding_boxes=json.dumps([anchors[det_idx] for det_idx in order]))
+
+    def annotate(self, od_result=None, metadata=None, spatial_relationships=None, general_rules=None,
+                 person_rules=None):
+        """
+        Compute the spatial relationships and annotations of a frame. The tuples with the same labels and boxes as in
+        the previous frame, under the same metadata label, carry their results forward, and the rule bases only label
+        the other tuples
+        :param od_result: Object detection results of the frame with the anchor boxes, from track_detections
+        :param metadata: Metadata results of the frame
+        :param spatial_relationships: The SpatialRelationships system
+        :param general_rules: The GeneralRules system
+        :param person_rules: The PersonRules system
+        :return: The annotated tuple results of the frame
+        """
+        assert od_result is not None, "Must supply the frame's object detection results"
+        assert metadata is not None, "Must supply the frame's metadata results"
+        assert spatial_relationships is not None, "Must supply the spatial relationship system"
+        assert general_rules is not None, "Must supply the general rules"
+        assert person_rules is not None, "Must supply the person rules"
+        previous = self.__previous_results
+        _, sr_result = spatial_relationships.compute_spatial_relationships(od_result, metadata,
+                                                                           previous_results=previous)
+        carried = {}
+        if previous is not None and len(previous) and len(sr_result) \
+                and previous[0]['metadata'] == sr_result[0]['metadata']:
+            previous_annotations = dict(zip(tuple_geometry_keys(previous),
+                                            zip(*[tuple_column([previous], key) for key in ANNOTATION_KEYS])))
+            for tup_idx, geometry in enumerate(tuple_geometry_keys(sr_result)):
+                if geometry in previous_annotations:
+                    carried[tup_idx] = previous_annotations[geometry]
+        computed = [tup_idx for tup_idx in range(len(sr_result)) if tup_idx not in carried]
+        computed_annotations = [[] for _ in ANNOTATION_KEYS]
+        if computed:
+            subset = select_tuples(sr_result, computed)
+            general_rules.compute_interactions(subset)
+            _, subset = person_rules.compute_interactions(subset)
+            computed_annotations = [tuple_column([subset], key) for key in ANNOTATION_KEYS]
+
+        for key_idx, (key, values) in enumerate(zip(ANNOTATION_KEYS, computed_annotations)):
+            column = [None] * len(sr_result)
+            for tup_idx, annotations in carried.items():
+                column[tup_idx] = annotations[key_idx]
+            for tup_idx, value in zip(computed, values):
+                column[tup_idx] = value
+            if isinstance(sr_result, ImageTuples):
+                sr_result.set_column(key, column)
+            else:
+                for r, value in zip(sr_result, column):
+                    r[key] = value
+        self.__previous_results = sr_result
+        self.__num_frames += 1
+        self.__num_tuples += len(sr_result)
+        self.__num_computed += len(computed)
+        return sr_result
+
+    def stats(self):
+        """
+        :return: Dictionary of the number of frames, tuples, and computed tuples, the share of the tuples carried
+        forward, the number of objects that moved or appeared, and the number of tracks
+        """
+        return {'frames': self.__num_frames, 'tuples': self.__num_tuples, 'computed': self.__num_computed,
+                'carried_rate': 1. - self.__num_computed / self.__num_tuples if self.__num_tuples else 0.,
+                'moved': self.__num_moved, 'tracks': self.__tracker.num_tracks}
@@ -16,79 +16,448 @@ The system will be separated into 3 parts
 
 from libs.object_detection import YoloObjectDetection
 from libs.spatial_relationships import SpatialRelationships
-from libs.metadata import MetaData
 from libs.annotation.general import GeneralRules
 from libs.annotation.person import PersonRules
+from libs.pipeline import StagePipeline
+from libs.result_store import ResultStore, ResultsView
+from libs.snapshot import METADATA_MODEL_FILE, load_snapshot, save_snapshot, snapshot_fingerprint, snapshot_path
+from libs.stage_cache import StageCache, cache_key, image_digest, stage_fingerprint
+from libs.tuple_records import rename_tuples
+from utils import requires_metadata, skipped_metadata
+import argparse
+import json
+import numpy as np
+import os
+
+# Metadata modes: compute the metadata of every image, or only of the images whose annotations use it
+METADATA_MODES = ('always', 'auto')
+# Data files the state of the warm-start snapshot is built from
+SNAPSHOT_DATA_FILES = ('./input/object_ontology.csv', './input/animate_objects.csv')
+# Synthetic detections of the warm-up, a person with a ball, a chair, and a dog, as the blank warm-up image has none
+WARM_UP_DETECTIONS = {'key': 'warm_up.jpg', 'num_objects': 4,
+                      'bounding_boxes': json.dumps([[150, 80, 260, 400], [240, 300, 290, 350], [120, 250, 300, 410],
+                                                    [20, 330, 110, 400]]),
+                      'confidences': json.dumps([0.9, 0.9, 0.9, 0.9]),
+                      'labels': json.dumps(['person_1', 'sports_ball_1', 'chair_1', 'dog_1']),
+                      'img_width': 416, 'img_height': 416}
 
 
 class SceneLabeling:
-    def __init__(self):
+    def __init__(self, compiled_fis=False, metadata_mode='always', result_store=None, prune_far_pairs=False,
+                 snapshot_dir=None, stage_cache=None, compact_results=False):
+        """
+        Construct the scene labeling system
+        :param compiled_fis: Answer the FIS queries from precomputed output surfaces. Default False
+        :param metadata_mode: 'always' computes the metadata of every image. 'auto' only computes it for the images
+        holding a person and a sports ball, the only tuples whose annotation uses it, and loads the ResNet model on
+        first use. Default 'always'
+        :param result_store: Store of the results of the processed images, such as a ResultStore with a size limit
+        spilling its least recently used results to a DiskResultStore. Default None, an unbounded in memory ResultStore
+        :param prune_far_pairs: Skip the HOF of the disjoint object tuples in the Very Far proximity set, and give them
+        default annotations. Default False
+        :param snapshot_dir: Cache directory of the warm-start snapshot. The spatial relationship system and the rule
+        bases, all built, are restored from the snapshot of the directory, or built and saved to it when it is missing
+        or stale. The metadata model is loaded from the frozen model of the directory, exported on its first load. The
+        system is then warmed up. Default None, everything is built and the rule bases are built on first use
+        :param stage_cache: StageCache reading back the stage results of the images already processed, keyed by the
+        image contents and the stage parameters. Default None, every stage is computed
+        :param compact_results: Store the tuples of each image as an ImageTuples record of NumPy columns instead of a
+        list of dictionaries, for less memory per tuple. Default False
+        """
+        assert metadata_mode in METADATA_MODES, f"Metadata mode must be one of {METADATA_MODES}"
+        self.__metadata_mode = metadata_mode
+        self.__snapshot_dir = snapshot_dir
         self.__object_detection = YoloObjectDetection()
-        self.__spatial_relationships = SpatialRelationships()
-        self.__metadata = MetaData()
-        self.__general_rules = GeneralRules()
-        self.__person_rules = PersonRules()
+        if snapshot_dir is None:
+            self.__spatial_relationships = SpatialRelationships(compact_results=compact_results,
+                                                                prune_far_pairs=prune_far_pairs)
+            self.__general_rules = GeneralRules(compiled_fis)
+            self.__person_rules = PersonRules(compiled_fis=compiled_fis)
+        else:
+            self.__restore_snapshot(compiled_fis, prune_far_pairs, compact_results)
+        self.__metadata = self.__create_metadata() if metadata_mode == 'always' else None
+
+        # The results of each image are stored together as (object detections, metadata, annotations), so they are
+        # evicted and loaded back together
+        self.__results = result_store if result_store is not None else ResultStore()
+        # The errors of the images skipped by process_images, keyed by image name
+        self.__errors = {}
+        if snapshot_dir is not None:
+            self.warm_up()
+
+        self.__stage_cache = stage_cache
+        if stage_cache is not None:
+            rules_parameters = dict(self.__general_rules.parameters(), **self.__person_rules.parameters())
+            # The metadata fingerprint is computed when the metadata model is loaded
+            self.__fingerprints = {
+                'object_detection': stage_fingerprint('object_detection', self.__object_detection.parameters()),
+                'spatial_relationships': stage_fingerprint('spatial_relationships',
+                                                           self.__spatial_relationships.parameters()),
+                'annotation': stage_fingerprint('annotation', rules_parameters)}
+
+    def __restore_snapshot(self, compiled_fis, prune_far_pairs, compact_results):
+        """
+        Restore the model independent systems from the snapshot directory, building and saving them if needed
+        """
+        fingerprint = snapshot_fingerprint({'compiled_fis': compiled_fis, 'prune_far_pairs': prune_far_pairs,
+                                            'compact_results': compact_results}, SNAPSHOT_DATA_FILES)
+        state = load_snapshot(self.__snapshot_dir, fingerprint)
+        if state is None:
+            # Every rule base is built, so the restored systems have none left to build
+            state = {'spatial_relationships': SpatialRelationships(compact_results=compact_results,
+                                                                   prune_far_pairs=prune_far_pairs),
+                     'general_rules': GeneralRules(compiled_fis),
+                     'person_rules': PersonRules(compiled_fis=compiled_fis, lazy_rule_bases=False)}
+            save_snapshot(self.__snapshot_dir, fingerprint, state)
+        self.__spatial_relationships = state['spatial_relationships']
+        self.__general_rules = state['general_rules']
+        self.__person_rules = state['person_rules']
 
-        self.__object_detection_results = dict(dict())
-        self.__metadata_results = dict(dict())
-        self.__image_annotation_results = dict(dict())
+    def __create_metadata(self):
+        """
+        Load the metadata model, from the frozen model of the snapshot directory when there is one
+        """
+        # torch is imported with the first metadata model, so importing the module does not load it
+        from libs.metadata import MetaData
+        if self.__snapshot_dir is None:
+            return MetaData()
+        model_file = snapshot_path(self.__snapshot_dir, METADATA_MODEL_FILE)
+        if os.path.exists(model_file):
+            return MetaData(model_file=model_file)
+        metadata = MetaData()
+        try:
+            os.makedirs(self.__snapshot_dir, exist_ok=True)
+            metadata.export_model(model_file)
+        except (OSError, RuntimeError):
+            pass  # The model is still usable when it cannot be exported
+        return metadata
+
+    def warm_up(self):
+        """
+        Run the models on a blank image and the spatial relationships and rule bases on synthetic detections, and
+        discard the results, so the first image does not pay for the first forward passes and rule base queries
+        """
+        image = np.zeros((WARM_UP_DETECTIONS['img_height'], WARM_UP_DETECTIONS['img_width'], 3), dtype=np.uint8)
+        self.__object_detection.compute_detections(image, WARM_UP_DETECTIONS['key'])
+        meta = self.__metadata.compute_metadata(image) if self.__metadata is not None else skipped_metadata()
+        _, sr_result = self.__spatial_relationships.compute_spatial_relationships(WARM_UP_DETECTIONS, meta)
+        self.__general_rules.compute_interactions(sr_result)
+        self.__person_rules.compute_interactions(sr_result)
 
-    def process_image(self, image=None, image_name=None):
+    def process_image(self, image=None, image_name=None, compute_metadata=None):
+        """
+        Compute the object detections, metadata, spatial relationships, and annotations of an image
+        :param image: The input image to process
+        :param image_name: The image name, used as the key of the results
+        :param compute_metadata: Compute the metadata of the image even if the annotations do not use it. Defaults to
+        the metadata mode
+        """
         assert image is not None, "Must supply an input image to process"
         assert image_name is not None, "Must supply an image name"
 
+        job = {'image': image, 'image_name': image_name, 'compute_metadata': compute_metadata}
+        for _, stage in self.__stages():
+            job = stage(job)
+        self.__store_results(job)
+
+    def process_video_frame(self, session=None, image=None, frame_name=None, compute_metadata=None):
+        """
+        Compute the results of the next frame of a video. The objects are tracked across the frames of the session and
+        keep their labels. The spatial relationships and annotations are only computed for the tuples of the objects
+        that moved beyond the move threshold of the session or appeared, and the other tuples carry their results of
+        the previous frame forward
+        :param session: The VideoSession of the video
+        :param image: The frame to process
+        :param frame_name: The frame name, used as the key of the results
+        :param compute_metadata: Compute the metadata of the frame even if the annotations do not use it. Defaults to
+        the metadata mode
+        """
+        assert session is not None, "Must supply the video session"
+        assert image is not None, "Must supply an input frame to process"
+        assert frame_name is not None, "Must supply a frame name"
+
+        job = {'image': image, 'image_name': frame_name, 'compute_metadata': compute_metadata}
+        job = self.__detect_objects(job)
+        job['od_result'], anchor_od_result = session.track_detections(job['od_result'])
+        job = self.__compute_metadata(job)
+        job['annotation'] = session.annotate(anchor_od_result, job['meta'], self.__spatial_relationships,
+                                             self.__general_rules, self.__person_rules)
+        self.__store_results(job)
+
+    def process_images(self, image_paths=None, image_names=None, compute_metadata=None, queue_size=4,
+                       decode_workers=2, on_error='skip'):
+        """
+        Process a sequence of image files with a pipelined executor. Each stage runs in its own worker, connected to
+        the next stage by a bounded queue, so the stages work on consecutive images at the same time
+        :param image_paths: Iterable of the image file paths
+        :param image_names: Iterable of the image names used as the keys of the results. Defaults to the image paths
+        :param compute_metadata: Compute the metadata of the images even if the annotations do not use it. Defaults to
+        the metadata mode
+        :param queue_size: Maximum number of images waiting in front of each stage
+        :param decode_workers: Number of workers reading the image files
+        :param on_error: 'skip' goes on with the next images when an image fails, such as a corrupt file, and records
+        its error in get_image_errors. 'raise' stops at the first failed image with a RuntimeError. Default 'skip'
+        :return: Generator of the keys of the processed images, in input order, once their results are stored
+        """
+        assert image_paths is not None, "Must supply the image paths"
+        if image_names is None:
+            image_paths = list(image_paths)
+            image_names = image_paths
+
+        def read_image(job):
+            import cv2
+            job['image'] = cv2.imread(job['image_path'], cv2.IMREAD_COLOR)
+            assert job['image'] is not None, f"Could not read image {job['image_path']}"
+            if self.__stage_cache is not None:
+                # Hashed by the decode workers, in parallel
+                job['image_digest'] = image_digest(job['image'])
+            return job
+
+        # The models and the rule bases hold state, so their stages have a single worker
+        stages = [('read_image', read_image, decode_workers)]
+        stages += [(name, stage, 1) for name, stage in self.__stages()]
+        jobs = ({'image_path': path, 'image_name': name, 'compute_metadata': compute_metadata}
+                for path, name in zip(image_paths, image_names))
+        pipeline = StagePipeline(stages, queue_size)
+        num_recorded = 0
+        try:
+            for job in pipeline.run(jobs, on_error=on_error):
+                num_recorded = self.__record_failures(pipeline, num_recorded)
+                self.__store_results(job)
+                yield job['key']
+        finally:
+            self.__record_failures(pipeline, num_recorded)
+
+    def __record_failures(self, pipeline, num_recorded):
+        """
+        Record the errors of the images the pipeline skipped since the first num_recorded ones
+        :return: The number of recorded failures of the pipeline
+        """
+        failures = pipeline.failures()
+        for index, stage_name, job, error in failures[num_recorded:]:
+            name = job['image_name'] if job is not None else f'item {index}'
+            self.__errors[name] = f'{stage_name}: {type(error).__name__}: {error}'
+        return len(failures)
+
+    def __stages(self):
+        """
+        The processing stages of an image, in order. Each stage takes the job dictionary of the image and returns it
+        with its results added
+        :return: List of the (name, stage) of the system
+        """
+        return [('object_detection', self.__detect_objects), ('metadata', self.__compute_metadata),
+                ('spatial_relationships', self.__compute_spatial_relationships),
+                ('general_annotation', self.__compute_general_annotation),
+                ('person_annotation', self.__compute_person_annotation)]
+
+    def __cached_result(self, stage, job, *inputs):
+        """
+        Read a stage result of the job from the stage cache, recording its key in the job
+        :return: The cached result, None on a miss or without a stage cache
+        """
+        if self.__stage_cache is None:
+            return None
+        job.setdefault('cache_keys', {})[stage] = cache_key(self.__fingerprints[stage], *inputs)
+        return self.__stage_cache.get(stage, job['cache_keys'][stage])
+
+    def __cache_result(self, stage, job, result):
+        if self.__stage_cache is not None:
+            self.__stage_cache.put(stage, job['cache_keys'][stage], result)
+
+    def __detect_objects(self, job):
         # Compute the object localizations
-        key, od_result = self.__object_detection.compute_detections(image, image_name)
-        self.__object_detection_results[key] = od_result
+        if self.__stage_cache is not None and 'image_digest' not in job:
+            job['image_digest'] = image_digest(job['image'])
+        od_result = self.__cached_result('object_detection', job, job.get('image_digest'))
+        if od_result is not None:
+            # The cached detections may be of a copy of the image under another name
+            job['key'], job['od_result'] = job['image_name'], dict(od_result, key=job['image_name'])
+            return job
+        job['key'], job['od_result'] = self.__object_detection.compute_detections(job['image'], job['image_name'])
+        self.__cache_result('object_detection', job, job['od_result'])
+        return job
+
+    def __compute_metadata(self, job):
+        # Compute the image metadata. Skipped metadata results are marked as skipped
+        compute_metadata = job['compute_metadata']
+        if compute_metadata is None:
+            compute_metadata = self.__metadata_mode == 'always'
+        if compute_metadata or requires_metadata(json.loads(job['od_result']['labels'])):
+            job['meta'] = self.__cached_metadata(job)
+            if job['meta'] is None:
+                job['meta'] = self.__get_metadata().compute_metadata(job['image'])
+                self.__cache_result('metadata', job, job['meta'])
+        else:
+            job['meta'] = skipped_metadata()
+        # The image is not needed by the later stages
+        del job['image']
+        return job
+
+    def __get_metadata(self):
+        # The metadata model, loaded on first use in the auto metadata mode
+        if self.__metadata is None:
+            self.__metadata = self.__create_metadata()
+        return self.__metadata
 
-        # Compute the image metadata
-        meta = self.__metadata.compute_metadata(image)
-        self.__metadata_results[key] = meta
+    def __cached_metadata(self, job):
+        if self.__stage_cache is None:
+            return None
+        if 'metadata' not in self.__fingerprints:
+            self.__fingerprints['metadata'] = stage_fingerprint('metadata', self.__get_metadata().parameters())
+        return self.__cached_result('metadata', job, job['image_digest'])
 
-        # Compute the spatial relationships
-        key, sr_result = self.__spatial_relationships.compute_spatial_relationships(od_result, meta)
-        self.__image_annotation_results[key] = sr_result
+    def __compute_spatial_relationships(self, job):
+        if self.__stage_cache is not None:
+            # The annotations depend on the spatial relationships only, so their key follows from the inputs of the
+            # spatial relationships, and a cached annotation skips the spatial relationships too
+            od_key = job['cache_keys']['object_detection']
+            sr_inputs = (od_key, json.dumps(job['meta'], sort_keys=True))
+            job['cache_keys']['spatial_relationships'] = cache_key(self.__fingerprints['spatial_relationships'],
+                                                                   *sr_inputs)
+            annotation = self.__cached_result('annotation', job, job['cache_keys']['spatial_relationships'])
+            if annotation is not None:
+                job['annotation'] = rename_tuples(annotation, job['key'])
+                return job
+            sr_result = self.__cached_result('spatial_relationships', job, *sr_inputs)
+            if sr_result is not None:
+                job['sr_result'] = rename_tuples(sr_result, job['key'])
+                return job
+        _, job['sr_result'] = self.__spatial_relationships.compute_spatial_relationships(job['od_result'], job['meta'])
+        # Cached before the annotation stages add their labels to the results
+        self.__cache_result('spatial_relationships', job, job['sr_result'])
+        return job
 
-        # Compute the general interaction summaries
-        key, general_annotation = self.__general_rules.compute_interactions(sr_result)
-        self.__image_annotation_results[key] = general_annotation
+    def __compute_general_annotation(self, job):
+        # Compute the general interaction summaries, unless the annotations were cached
+        if 'annotation' not in job:
+            self.__general_rules.compute_interactions(job['sr_result'])
+        return job
 
-        # Compute the person domain interaction summaries
-        key, person_annotation = self.__person_rules.compute_interactions(sr_result)
-        self.__image_annotation_results[key] = person_annotation
+    def __compute_person_annotation(self, job):
+        # Compute the person domain interaction summaries, unless the annotations were cached
+        if 'annotation' not in job:
+            _, job['annotation'] = self.__person_rules.compute_interactions(job['sr_result'])
+            self.__cache_result('annotation', job, job['annotation'])
+        return job
+
+    def __store_results(self, job):
+        self.__results[job['key']] = (job['od_result'], job['meta'], job['annotation'])
+
+    def __get_results(self, key, index):
+        if key is None:
+            return ResultsView(self.__results, index)
+        return self.__results[key][index]
 
     def get_object_detection_results(self, key=None):
         """
         Return all object detection results if a key is not specified. Otherwise, return object detection results
-        for the specific image
+        for the specific image. All the results are returned as a read-only mapping reading each result from the result
+        store on access, so the spilled results are not loaded back into memory at once
         :param key: None or relative path to image
-        :return: Object detection results for image(s)
+        :return: Object detection results for image(s). Raises a KeyError for a key without results
         """
-        if key in self.__object_detection_results.keys():
-            return self.__object_detection_results[key]
-        else:
-            return self.__object_detection_results
+        return self.__get_results(key, 0)
 
     def get_metadata_results(self, key=None):
         """
         Return all metadata results if a key is not specified. Otherwise
         return metadata results for a specific image
         :param key: None or relative path to image
-        :return: Metadata results for image(s)
+        :return: Metadata results for image(s). Raises a KeyError for a key without results
         """
-        if key in self.__metadata_results.keys():
-            return self.__metadata_results[key]
-        else:
-            return self.__metadata_results
+        return self.__get_results(key, 1)
 
     def get_image_annotations(self, key=None):
         """
         Return all spatial relationship results if a key is not specified. Otherwise, return spatial relationship
         results for a specific image
         :param key: None or relative path to image
-        :return: Spatial relationship results for image(s)
+        :return: Spatial relationship results for image(s). Raises a KeyError for a key without results
         """
-        if key in self.__image_annotation_results.keys():
-            return self.__image_annotation_results[key]
-        else:
-            return self.__image_annotation_results
+        return self.__get_results(key, 2)
+
+    def get_image_errors(self, key=None):
+        """
+        Return the errors of all the images skipped by process_images if a key is not specified. Otherwise, return the
+        error of a specific image
+        :param key: None or image name
+        :return: Error of the image(s), as 'stage: ExceptionType: message'. Raises a KeyError for a key without error
+        """
+        if key is None:
+            return dict(self.__errors)
+        return self.__errors[key]
+
+    def pop_results(self, key=None):
+        """
+        Remove the results of an image from the system and return them
+        :param key: Relative path to image
+        :return: The object detection results, metadata results, and image annotations of the image
+        """
+        assert key is not None, "Must supply the image key"
+        return self.__results.pop(key)
+
+
+def main(argv=None):
+    """
+    Command line entry point. The run command labels the images of a directory with a pool of worker processes:
+    python -m scene_labeling run --jobs N <image_dir>
+    The snapshot command builds the warm-start snapshot of a cache directory before the workers use it:
+    python -m scene_labeling snapshot <snapshot_dir>
+    """
+    from libs.batch_runner import run_directory
+    parser = argparse.ArgumentParser(prog='python -m scene_labeling', description='Scene labeling system')
+    commands = parser.add_subparsers(dest='command', required=True)
+    run_parser = commands.add_parser('run', help='Label the images of a directory')
+    run_parser.add_argument('image_dir', help='Directory of the images, searched recursively')
+    run_parser.add_argument('--jobs', '-j', type=int, default=None,
+                            help='Number of worker processes. Defaults to the number of cores')
+    run_parser.add_argument('--output', '-o', default=None,
+                            help='JSON lines output file, with one line per image, or directory of the Parquet or '
+                                 'Arrow tables. Defaults to scene_labeling_results.jsonl or scene_labeling_results/')
+    run_parser.add_argument('--format', choices=('jsonl', 'parquet', 'arrow'), default='jsonl',
+                            help='Output format. The columnar formats write one table of detections, metadata, tuple '
+                                 'annotations, and errors, with one row group per chunk')
+    run_parser.add_argument('--chunk-size', type=int, default=16, help='Number of images handed to a worker at a time')
+    run_parser.add_argument('--threads-per-job', type=int, default=1, help='OpenCV and torch threads of each worker')
+    run_parser.add_argument('--compiled-fis', action='store_true', help='Answer the FIS from precomputed surfaces')
+    run_parser.add_argument('--metadata-mode', choices=METADATA_MODES, default='always',
+                            help='Compute the metadata of every image, or only when the annotations use it')
+    run_parser.add_argument('--prune-far-pairs', action='store_true',
+                            help='Skip the HOF of the object tuples far apart, for crowded scenes')
+    run_parser.add_argument('--snapshot-dir', default=None,
+                            help='Cache directory of the warm-start snapshot the workers restore from')
+    run_parser.add_argument('--cache-dir', default=None,
+                            help='Directory of the stage result cache, so reprocessed images reuse their results')
+    run_parser.add_argument('--cache-max-mb', type=float, default=None,
+                            help='Size limit of the stage result cache in megabytes. Defaults to no limit')
+    snapshot_parser = commands.add_parser('snapshot', help='Build the warm-start snapshot of a cache directory')
+    snapshot_parser.add_argument('snapshot_dir', help='Cache directory of the snapshot')
+    snapshot_parser.add_argument('--compiled-fis', action='store_true', help='Answer the FIS from precomputed surfaces')
+    snapshot_parser.add_argument('--prune-far-pairs', action='store_true',
+                                 help='Skip the HOF of the object tuples far apart, for crowded scenes')
+    args = parser.parse_args(argv)
+    if args.command == 'snapshot':
+        # With the compact results of the batch runner, so the snapshot matches the runs
+        SceneLabeling(compiled_fis=args.compiled_fis, prune_far_pairs=args.prune_far_pairs,
+                      snapshot_dir=args.snapshot_dir, compact_results=True)
+        print(f'Saved the warm-start snapshot into {args.snapshot_dir}')
+        return 0
+    if args.output is None:
+        args.output = 'scene_labeling_results.jsonl' if args.format == 'jsonl' else 'scene_labeling_results'
+
+    stage_cache = None
+    if args.cache_dir is not None:
+        stage_cache = StageCache(args.cache_dir, None if args.cache_max_mb is None else int(args.cache_max_mb * 1e6))
+    num_images, num_errors = run_directory(args.image_dir, args.output, args.jobs, args.chunk_size,
+                                           args.threads_per_job,
+                                           {'compiled_fis': args.compiled_fis, 'metadata_mode': args.metadata_mode,
+                                            'prune_far_pairs': args.prune_far_pairs, 'compact_results': True,
+                                            'snapshot_dir': args.snapshot_dir,
+                                            'stage_cache': stage_cache},
+                                           output_format=args.format)
+    print(f'Labeled {num_images - num_errors} of {num_images} images into {args.output}')
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
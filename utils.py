@@ -1,11 +1,39 @@
 """
 This script contains various helper functions for the library
 """
-import cv2
 import numpy as np
 import json
+import os
 from itertools import permutations
 
+# Base labels of the objects whose person tuples use the image metadata. The sports rules use it to tell the soccer,
+# tennis, and baseball balls apart
+METADATA_OBJECTS = ('sports_ball',)
+# Metadata label of the tuples of the images whose metadata was skipped
+SKIPPED_METADATA_LABEL = 'skipped'
+
+
+def atomic_write(path=None, write_fn=None):
+    """
+    Write a file through a temporary file of the process renamed over it once complete, so concurrent readers never see
+    a truncated file. The temporary file is removed if the write fails
+    :param path: Path of the file
+    :param write_fn: Function writing the contents to the binary file object it is given
+    """
+    assert path is not None, "Must supply the file path"
+    assert write_fn is not None, "Must supply the write function"
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    try:
+        with open(tmp_path, 'wb') as f:
+            write_fn(f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
 
 def load_label_map(labels_file):
     labels_dict = {}
@@ -38,13 +66,14 @@ def get_image_tuples(img_labels=None):
     """
     tuples = list(permutations(img_labels, 2))
     no_inverse_tuples = []
-    no_inverse_key = []
+    # Set of the keys of the kept tuples, so the inverse lookup does not scan the tuples kept so far
+    no_inverse_key = set()
     for tup in tuples:
         check = tup[1] + tup[0]
         if check in no_inverse_key:
             continue  # No processing inverse relationships
         no_inverse_tuples.append(tup)
-        no_inverse_key.append(tup[0] + tup[1])
+        no_inverse_key.add(tup[0] + tup[1])
     return no_inverse_tuples
 
 
@@ -67,7 +96,29 @@ def convert_meta_labels(labels):
         return labels[0]
 
 
+def requires_metadata(img_labels=None):
+    """
+    Find whether the FIS use the metadata of an image, which is when it holds a person and an object whose person
+    tuples depend on the metadata
+    :param img_labels: The object detection labels of the image, such as person_1
+    :return: True if the metadata of the image is needed
+    """
+    assert img_labels is not None, "Must supply the image labels"
+    base_labels = {'_'.join(label.split('_')[:-1]) for label in img_labels}
+    return 'person' in base_labels and any(obj in base_labels for obj in METADATA_OBJECTS)
+
+
+def skipped_metadata():
+    """
+    Create the metadata results of an image whose metadata was not computed
+    :return: Metadata results without labels
+    """
+    return {'labels': json.dumps([]), 'confidences': json.dumps([]), 'num_labels': 0, 'skipped': True}
+
+
 def draw_detection(img, boxes, labels):
+    # OpenCV is only needed for the display
+    import cv2
     for box, label in zip(boxes, labels):
         cv2.rectangle(img, (box[0], box[1]), (box[2], box[3]), (255, 0, 0), 2)
         cv2.putText(img, label, (box[0], box[1]), cv2.FONT_HERSHEY_SIMPLEX, 0.75, (255, 0, 0), 2)
@@ -0,0 +1,73 @@
+"""
+This validation script checks that the table and vectorized labels of Defuzz give the labels of the membership
+interpolations of scikit-fuzzy, for every integer HOF angle and for the IOU values over [0, 1], including the smallest
+ones where the overlap memberships cross
+"""
+from libs.spatial_relationships import Defuzz
+import numpy as np
+import skfuzzy as fuzz
+import sys
+import time
+
+NUM_IOUS = 200001
+NUM_RANDOM = 20000
+
+
+def reference_labels(defuzzer, iou, sr_angle):
+    """
+    The labels of a tuple computed with one scikit-fuzzy interpolation per term, as Defuzz did before its tables
+    """
+    overlap = fuzz.interp_membership(defuzzer.overlap.universe, defuzzer.overlap['Overlap'].mf, iou)
+    no_overlap = fuzz.interp_membership(defuzzer.overlap.universe, defuzzer.overlap['No Overlap'].mf, iou)
+    membership = {'Overlap': overlap, 'No Overlap': no_overlap}
+    overlap_label = max(membership, key=membership.get)
+
+    terms = ['Right1', 'Right2', 'Above Right', 'Above', 'Above Left', 'Left', 'Below Left', 'Below', 'Below Right']
+    membership = {term: fuzz.interp_membership(defuzzer.sr.universe, defuzzer.sr[term].mf, sr_angle) for term in terms}
+    sr_label = max(membership, key=membership.get)
+    if sr_label == 'Right1' or sr_label == 'Right2':
+        sr_label = 'Right'
+    return overlap_label, sr_label
+
+
+def compare(defuzzer, name, ious, sr_angles):
+    """
+    Compare the batch and per tuple labels with the reference labels
+    :return: Number of mismatches
+    """
+    start = time.perf_counter()
+    expected = [reference_labels(defuzzer, iou, sr_angle) for iou, sr_angle in zip(ious, sr_angles)]
+    reference_time = time.perf_counter() - start
+    start = time.perf_counter()
+    batch = list(zip(*defuzzer.defuzzify_batch(ious, sr_angles)))
+    batch_time = time.perf_counter() - start
+    scalar = [defuzzer.defuzzify_results(iou, sr_angle) for iou, sr_angle in zip(ious[:1000], sr_angles[:1000])]
+
+    mismatches = 0
+    for iou, sr_angle, expected_labels, batch_labels in zip(ious, sr_angles, expected, batch):
+        if expected_labels != batch_labels:
+            mismatches += 1
+            if mismatches <= 10:
+                print(f'  IOU {iou!r}, angle {sr_angle!r}: {expected_labels} != {batch_labels}')
+    mismatches += sum(a != b for a, b in zip(expected, scalar))
+    print(f'{name}: {len(expected)} inputs, {mismatches} mismatches, reference {reference_time:.2f}s, '
+          f'batch {batch_time * 1e3:.1f}ms')
+    return mismatches
+
+
+if __name__ == '__main__':
+    defuzz = Defuzz()
+    rng = np.random.default_rng(0)
+    # The smallest IOU values, where the Overlap and No Overlap memberships cross
+    tiny = [0., 5e-324] + [float(x) for x in np.logspace(-320, -14, 5000)]
+    grid = np.linspace(0., 1., NUM_IOUS).tolist()
+    angles = np.arange(0, 361).tolist()
+
+    total = compare(defuzz, 'Integer angles', [0.] * len(angles) + [0.5] * len(angles), angles + angles)
+    total += compare(defuzz, 'Fractional and out of range angles', [0.] * NUM_RANDOM,
+                     rng.uniform(-5., 365., NUM_RANDOM).tolist())
+    all_ious = tiny + grid
+    total += compare(defuzz, 'IOU grid', all_ious, [0] * len(all_ious))
+    total += compare(defuzz, 'Random tuples', rng.uniform(0., 1., NUM_RANDOM).tolist(),
+                     rng.integers(0, 361, NUM_RANDOM).tolist())
+    sys.exit(1 if total else 0)
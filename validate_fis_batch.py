@@ -0,0 +1,91 @@
+"""
+This validation script checks that the batch annotation methods of the general and person domain FIS give the labels of
+the per tuple methods, for random object tuples of every object of ./input/object_ontology.csv
+"""
+from libs.annotation.general import GeneralRules
+from libs.annotation.person import PersonRules
+import numpy as np
+import pandas as pd
+import copy
+import sys
+import time
+
+ONTOLOGY_FILE = './input/object_ontology.csv'
+NUM_IMAGES = 50
+META_LABELS = ['soccer_ball', 'tennis_ball', 'baseball', 'ballplayer']
+
+
+def create_sr_results(objects=None, num_images=NUM_IMAGES, seed=0):
+    """
+    Create random spatial relationship results, each image holding a person tuple and a reversed tuple for every object
+    :param objects: Object labels of the ontology
+    :param num_images: Number of images
+    :param seed: Seed of the random generator
+    :return: List of the spatial relationship results of each image
+    """
+    rng = np.random.default_rng(seed)
+    sr_results = []
+    for i in range(num_images):
+        meta_label = META_LABELS[rng.integers(len(META_LABELS))]
+        sr_result = []
+        for obj in objects:
+            obj_label = '_'.join(obj.split(' ')) + '_2'
+            for arg_label, ref_label in [('person_1', obj_label), (obj_label, 'person_1')]:
+                # Half of the tuples do not overlap, as in most images
+                iou = 0. if rng.random() < 0.5 else rng.uniform(0., 1.)
+                f0, f2, hybrid = rng.integers(0, 361, 3) if rng.random() < 0.5 else [rng.integers(0, 361)] * 3
+                sr_result.append({'relative_path': f'image_{i}.jpg', 'arg_label': arg_label, 'ref_label': ref_label,
+                                  'metadata': meta_label, 'overlap': iou, 'proximity': rng.uniform(-1., 1.),
+                                  'f0': int(f0), 'f2': int(f2), 'hybrid': int(hybrid)})
+        sr_results.append(sr_result)
+    return sr_results
+
+
+def compare(name, rules, sr_results, scalar_key):
+    """
+    Label the tuples with the per tuple and the batch methods, and print the mismatches
+    :return: Number of mismatches
+    """
+    scalar_results = copy.deepcopy(sr_results)
+    start = time.perf_counter()
+    scalar_labels = []
+    for sr_result in scalar_results:
+        for r in sr_result:
+            try:
+                rules.compute_interactions([r])
+                scalar_labels.append(r[scalar_key])
+            except KeyError:
+                # The simulation has no output for the tuple
+                scalar_labels.append(None)
+    scalar_time = time.perf_counter() - start
+
+    batch_results = copy.deepcopy(sr_results)
+    start = time.perf_counter()
+    annotations = rules.compute_interactions_batch(batch_results)
+    batch_time = time.perf_counter() - start
+    batch_labels = [r[scalar_key] for _, annotation in annotations for r in annotation]
+
+    mismatches = 0
+    for r, scalar_label, batch_label in zip([r for sr_result in sr_results for r in sr_result], scalar_labels,
+                                            batch_labels):
+        if scalar_label is not None and scalar_label != batch_label:
+            mismatches += 1
+            print(f'  {r["arg_label"]} {r["ref_label"]}: {scalar_label} != {batch_label}')
+    print(f'{name}: {len(batch_labels)} tuples, {mismatches} mismatches, {scalar_labels.count(None)} without output, '
+          f'per tuple {scalar_time:.2f}s, batch {batch_time:.2f}s ({scalar_time / max(batch_time, 1e-9):.0f}x)')
+    return mismatches
+
+
+if __name__ == '__main__':
+    ontology_df = pd.read_csv(ONTOLOGY_FILE, encoding='utf-8', engine='python')
+    object_labels = [o for o in ontology_df['object'] if o != 'person']
+    results = create_sr_results(object_labels)
+
+    total = 0
+    for compiled_fis in [False, True]:
+        mode = 'compiled' if compiled_fis else 'live'
+        total += compare(f'General rules ({mode})', GeneralRules(compiled_fis=compiled_fis), results,
+                         'general_interaction')
+        total += compare(f'Person rules ({mode})', PersonRules(compiled_fis=compiled_fis), results,
+                         'person_interaction')
+    sys.exit(1 if total else 0)
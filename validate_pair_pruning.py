@@ -0,0 +1,81 @@
+"""
+This validation script compares the spatial relationships and annotations of crowd scenes computed with and without the
+pruning of the object tuples far apart, and checks that the batch GIOU screening gives the GIOU and IOU of compute_giou
+"""
+from libs.spatial_relationships import SpatialRelationships, compute_giou, compute_giou_batch
+from libs.annotation.general import GeneralRules
+from libs.annotation.person import PersonRules
+import numpy as np
+import json
+import sys
+import time
+
+NUM_IMAGES = 3
+NUM_PEOPLE = 60
+NUM_OBJECTS = 10
+OBJECT_LABELS = ['bench', 'backpack', 'umbrella', 'bicycle', 'dog']
+IMG_WIDTH = 1920
+IMG_HEIGHT = 1080
+METADATA = {'labels': json.dumps(['ballplayer']), 'confidences': json.dumps([1.]), 'num_labels': 1}
+
+
+def create_crowd(seed=0):
+    """
+    Create the object detection results of a random crowd scene
+    :param seed: Seed of the random generator
+    :return: The object detection results of the scene
+    """
+    rng = np.random.default_rng(seed)
+    labels = [f'person_{i + 1}' for i in range(NUM_PEOPLE)]
+    labels += [f'{OBJECT_LABELS[i % len(OBJECT_LABELS)]}_{i // len(OBJECT_LABELS) + 1}' for i in range(NUM_OBJECTS)]
+    boxes = []
+    for label in labels:
+        width, height = (rng.integers(30, 80), rng.integers(80, 200)) if label.startswith('person') else \
+            (rng.integers(20, 100), rng.integers(20, 100))
+        x, y = rng.integers(0, IMG_WIDTH - width), rng.integers(0, IMG_HEIGHT - height)
+        boxes.append([int(x), int(y), int(x + width), int(y + height)])
+    return {'key': f'crowd_{seed}.jpg', 'num_objects': len(labels), 'bounding_boxes': json.dumps(boxes),
+            'confidences': json.dumps([0.9] * len(labels)), 'labels': json.dumps(labels), 'img_width': IMG_WIDTH,
+            'img_height': IMG_HEIGHT}
+
+
+def annotate(spatial_relationships, general_rules, person_rules, od_result):
+    """
+    Compute the spatial relationships and annotations of a scene, as SceneLabeling does
+    :return: The tuple results, and the computation time
+    """
+    start = time.perf_counter()
+    _, sr_result = spatial_relationships.compute_spatial_relationships(od_result, METADATA)
+    general_rules.compute_interactions(sr_result)
+    _, annotations = person_rules.compute_interactions(sr_result)
+    return annotations, time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    general = GeneralRules(compiled_fis=True)
+    person = PersonRules(compiled_fis=True)
+    full = SpatialRelationships()
+    pruning = SpatialRelationships(prune_far_pairs=True)
+
+    failures = 0
+    for seed in range(NUM_IMAGES):
+        od = create_crowd(seed)
+        boxes = json.loads(od['bounding_boxes'])
+        pairs = [(i, j) for i in range(len(boxes)) for j in range(len(boxes)) if i != j]
+        gious, ious = compute_giou_batch(boxes, pairs)
+        if [compute_giou(boxes[i], boxes[j]) for i, j in pairs] != list(zip(gious, ious)):
+            print('  The batch GIOU differs from compute_giou')
+            failures += 1
+
+        full_results, full_time = annotate(full, general, person, od)
+        pruned_results, pruned_time = annotate(pruning, general, person, od)
+        pruned = np.array([r['pruned'] for r in pruned_results])
+        print(f'{od["key"]}: {len(full_results)} tuples, {pruned.mean():.1%} pruned, full {full_time:.2f}s, '
+              f'pruned {pruned_time:.2f}s ({full_time / pruned_time:.1f}x)')
+        for key in ['proximity', 'overlap', 'spatial_relationship', 'general_interaction', 'person_interaction']:
+            same = np.array([a[key] == b[key] for a, b in zip(full_results, pruned_results)])
+            print(f'  {key}: agreement {same.mean():.4f}, on the pruned tuples {same[pruned].mean():.4f}')
+            # The pruned tuples are Very Far, so their proximity and interactions must not change
+            if key != 'spatial_relationship' and not same.all():
+                failures += 1
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,91 @@
+"""
+This validation script checks that the HOF histograms computed from masks cropped to an object tuple, from the bounding
+boxes alone, and from the batch of all the tuples of an image are the ones of the full image masks, on random tuples of
+landscape and portrait images, including boxes touching and crossing the image edges
+"""
+from libs.spatial_relationships import compute_hof_batch, compute_hof_histograms, create_box_mask, create_roi_masks
+import numpy as np
+import sys
+import time
+
+NUM_TUPLES = 150
+IMG_SHAPES = [(480, 640), (640, 480), (1080, 1920)]
+
+
+def random_box(rng, img_height, img_width, edge=False):
+    """
+    :param edge: Place the box against or across a random image edge
+    :return: A random [x1, y1, x2, y2] bounding box of the image
+    """
+    width, height = int(rng.integers(5, img_width // 3)), int(rng.integers(5, img_height // 3))
+    x, y = int(rng.integers(0, img_width - width)), int(rng.integers(0, img_height - height))
+    if edge:
+        side = rng.integers(0, 4)
+        overhang = int(rng.integers(0, 3))
+        if side == 0:
+            x = -overhang
+        elif side == 1:
+            y = -overhang
+        elif side == 2:
+            x = img_width - width + overhang
+        else:
+            y = img_height - height + overhang
+    return [x, y, x + width, y + height]
+
+
+def full_histograms(arg_box, ref_box, img_height, img_width):
+    """
+    The histograms of the full image masks of a tuple, the reference of the other paths
+    """
+    return np.stack(compute_hof_histograms(create_box_mask(arg_box, img_height, img_width),
+                                           create_box_mask(ref_box, img_height, img_width)))
+
+
+def compare(name, rng, img_shape, edge):
+    """
+    Compare the cropped, bounding box, and batch histograms of random tuples with the full image histograms
+    :return: Number of mismatches
+    """
+    img_height, img_width = img_shape
+    boxes = [random_box(rng, img_height, img_width, edge) for _ in range(2 * NUM_TUPLES)]
+    pairs = [(2 * i, 2 * i + 1) for i in range(NUM_TUPLES)]
+    mismatches = {'cropped': 0, 'box': 0, 'batch': 0}
+    times = {'full': 0., 'cropped': 0.}
+    # The clipped boxes, as the boxes of the detector
+    clipped = [[max(box[0], 0), max(box[1], 0), min(box[2], img_width), min(box[3], img_height)] for box in boxes]
+    batch = compute_hof_batch(clipped, pairs, img_shape=img_shape)
+    for tup_idx, (arg_idx, ref_idx) in enumerate(pairs):
+        start = time.perf_counter()
+        full = full_histograms(boxes[arg_idx], boxes[ref_idx], img_height, img_width)
+        times['full'] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        arg_mask, ref_mask, roi_origin = create_roi_masks(boxes[arg_idx], boxes[ref_idx], img_height, img_width)
+        cropped = np.stack(compute_hof_histograms(arg_mask, ref_mask, img_shape=img_shape, roi_origin=roi_origin))
+        times['cropped'] += time.perf_counter() - start
+        if not np.array_equal(cropped, full):
+            mismatches['cropped'] += 1
+            if mismatches['cropped'] <= 5:
+                print(f'  Cropped histograms differ for boxes {boxes[arg_idx]} and {boxes[ref_idx]}')
+
+        clipped_full = full_histograms(clipped[arg_idx], clipped[ref_idx], img_height, img_width)
+        box = np.stack(compute_hof_histograms(clipped[arg_idx], clipped[ref_idx], img_shape=img_shape))
+        if not np.allclose(box, clipped_full):
+            mismatches['box'] += 1
+            if mismatches['box'] <= 5:
+                print(f'  Box histograms differ for boxes {clipped[arg_idx]} and {clipped[ref_idx]}')
+        if not np.array_equal(np.argmax(box, axis=1), batch[tup_idx]):
+            mismatches['batch'] += 1
+    print(f'{name} {img_width}x{img_height}: {NUM_TUPLES} tuples, mismatches cropped {mismatches["cropped"]} box '
+          f'{mismatches["box"]} batch {mismatches["batch"]}, full image {times["full"]:.2f}s, cropped '
+          f'{times["cropped"]:.2f}s')
+    return sum(mismatches.values())
+
+
+if __name__ == '__main__':
+    generator = np.random.default_rng(0)
+    total = 0
+    for shape in IMG_SHAPES:
+        total += compare('Inside the image', generator, shape, edge=False)
+        total += compare('Touching the edges', generator, shape, edge=True)
+    sys.exit(1 if total else 0)